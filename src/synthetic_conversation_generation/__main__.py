@@ -0,0 +1,4 @@
+from synthetic_conversation_generation.cli import main
+
+
+main()
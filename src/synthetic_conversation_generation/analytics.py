@@ -0,0 +1,372 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from synthetic_conversation_generation.cli_support import configure_logging
+from synthetic_conversation_generation.data_models.conversation import ROLE
+from synthetic_conversation_generation.llm_queries.history_window import count_tokens
+from synthetic_conversation_generation.output.columnar import ColumnarConversationReader, detect_format
+
+
+logger = logging.getLogger(__name__)
+
+
+# Each role's index in the per-role columns of a chunk
+_ROLE_CODES = {role.name: code for code, role in enumerate(ROLE)}
+
+# A conversation as the analytics need it: the persona's name and the role and content of each message
+ConversationRecord = Tuple[str, List[Tuple[str, str]]]
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Dataset analytics need NumPy: pip install 'synthetic_conversation_generation[analytics]'") from e
+    return numpy
+
+
+class CountHistogram:
+    """
+    Histogram of non-negative integers, such as characters per message, filled from NumPy arrays.
+
+    Values below exact_limit each have their own bucket. Larger values share logarithmic
+    buckets of fixed relative width, so percentiles keep the same precision for short
+    and very long messages in constant memory, however many values are added.
+    """
+
+    def __init__(self, exact_limit: int = 128, significant_digits: int = 2):
+        """
+        Args:
+            exact_limit: Values below this are counted exactly
+            significant_digits: Decimal digits of precision kept for larger values, e.g. 2 for 1%
+        """
+        np = _numpy()
+        self.exact_limit = exact_limit
+        self._log_base = math.log1p(10 ** -significant_digits)
+        self.counts = np.zeros(exact_limit, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.max: Optional[int] = None
+
+    def _buckets(self, values):
+        np = _numpy()
+        buckets = values.copy()
+        large = values >= self.exact_limit
+        buckets[large] = self.exact_limit + (np.log(values[large] / self.exact_limit) / self._log_base).astype(np.int64)
+        return buckets
+
+    def add(self, values):
+        np = _numpy()
+        values = np.asarray(values, dtype=np.int64)
+        if values.size == 0:
+            return
+        counts = np.bincount(self._buckets(values))
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts[:len(counts)] += counts
+        self.count += int(values.size)
+        self.total += int(values.sum())
+        largest = int(values.max())
+        self.max = largest if self.max is None else max(self.max, largest)
+
+    def _highest_equivalent_value(self, bucket: int) -> int:
+        if bucket < self.exact_limit:
+            return bucket
+        # Upper edge of the bucket, capped at the largest value actually added
+        return min(math.ceil(self.exact_limit * math.exp((bucket - self.exact_limit + 1) * self._log_base)) - 1, self.max)
+
+    def value_at_percentile(self, q: float) -> Optional[int]:
+        if self.count == 0:
+            return None
+        np = _numpy()
+        target = max(1, math.ceil(q / 100 * self.count))
+        return self._highest_equivalent_value(int(np.searchsorted(np.cumsum(self.counts), target)))
+
+    def exact_counts(self) -> Dict[int, int]:
+        """Count of each value below exact_limit that was added at least once."""
+        return {value: int(count) for value, count in enumerate(self.counts[:self.exact_limit]) if count}
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.value_at_percentile(50),
+            "p90": self.value_at_percentile(90),
+            "p99": self.value_at_percentile(99),
+            "max": self.max
+        }
+
+
+class ConversationStats:
+    """
+    Summary statistics over conversation files, accumulated one chunk of conversations at a time.
+
+    Each chunk is reduced to flat NumPy arrays of per-message role, characters and tokens,
+    which are folded into histograms and per-persona totals with vectorized bincounts, so
+    memory depends on the chunk size and the number of personas rather than on the size
+    of the files. Whether a conversation ended early or hit the turn limit is decided
+    when the report is built, so the limit does not need to be known up front.
+    """
+
+    def __init__(self):
+        np = _numpy()
+        self.conversations = 0
+        self.turns = CountHistogram(exact_limit=1024)
+        self.characters = {role: CountHistogram() for role in ROLE}
+        self.tokens = {role: CountHistogram() for role in ROLE}
+        self.persona_names: List[str] = []
+        self._persona_codes: Dict[str, int] = {}
+        # Per persona: conversations by number of turns, and total characters and tokens by role
+        self._persona_turn_counts = np.zeros((0, 1), dtype=np.int64)
+        self._persona_characters = np.zeros((0, len(ROLE)), dtype=np.int64)
+        self._persona_tokens = np.zeros((0, len(ROLE)), dtype=np.int64)
+
+    def _persona_code(self, persona_name: str) -> int:
+        code = self._persona_codes.get(persona_name)
+        if code is None:
+            code = self._persona_codes[persona_name] = len(self.persona_names)
+            self.persona_names.append(persona_name)
+        return code
+
+    def add_conversations(self, conversations: Iterable[ConversationRecord]):
+        """Add a chunk of conversations."""
+        np = _numpy()
+        persona_codes = []
+        message_conversations = []
+        message_roles = []
+        message_characters = []
+        message_tokens = []
+        for index, (persona_name, messages) in enumerate(conversations):
+            persona_codes.append(self._persona_code(persona_name))
+            for role, content in messages:
+                role_code = _ROLE_CODES.get(role)
+                if role_code is None:
+                    continue
+                message_conversations.append(index)
+                message_roles.append(role_code)
+                message_characters.append(len(content))
+                message_tokens.append(count_tokens(content))
+
+        count = len(persona_codes)
+        if count == 0:
+            return
+        persona_codes = np.asarray(persona_codes, dtype=np.int64)
+        message_conversations = np.asarray(message_conversations, dtype=np.int64)
+        message_roles = np.asarray(message_roles, dtype=np.int64)
+        message_characters = np.asarray(message_characters, dtype=np.int64)
+        message_tokens = np.asarray(message_tokens, dtype=np.int64)
+
+        # Every turn opens with a user message
+        turns = np.bincount(message_conversations[message_roles == _ROLE_CODES[ROLE.user.name]], minlength=count)
+        self.turns.add(turns)
+        self.conversations += count
+
+        conversation_characters = np.zeros((count, len(ROLE)), dtype=np.int64)
+        conversation_tokens = np.zeros((count, len(ROLE)), dtype=np.int64)
+        for role in ROLE:
+            code = _ROLE_CODES[role.name]
+            is_role = message_roles == code
+            self.characters[role].add(message_characters[is_role])
+            self.tokens[role].add(message_tokens[is_role])
+            conversation_characters[:, code] = np.bincount(message_conversations[is_role], weights=message_characters[is_role], minlength=count)
+            conversation_tokens[:, code] = np.bincount(message_conversations[is_role], weights=message_tokens[is_role], minlength=count)
+
+        self._add_persona_totals(persona_codes, turns, conversation_characters, conversation_tokens)
+
+    def _add_persona_totals(self, persona_codes, turns, conversation_characters, conversation_tokens):
+        np = _numpy()
+        personas = len(self.persona_names)
+        max_turns = max(self._persona_turn_counts.shape[1], int(turns.max()) + 1)
+        self._persona_turn_counts = np.pad(self._persona_turn_counts, ((0, personas - self._persona_turn_counts.shape[0]), (0, max_turns - self._persona_turn_counts.shape[1])))
+        self._persona_characters = np.pad(self._persona_characters, ((0, personas - self._persona_characters.shape[0]), (0, 0)))
+        self._persona_tokens = np.pad(self._persona_tokens, ((0, personas - self._persona_tokens.shape[0]), (0, 0)))
+
+        self._persona_turn_counts += np.bincount(persona_codes * max_turns + turns, minlength=personas * max_turns).reshape(personas, max_turns)
+        for code in range(len(ROLE)):
+            self._persona_characters[:, code] += np.bincount(persona_codes, weights=conversation_characters[:, code], minlength=personas).astype(np.int64)
+            self._persona_tokens[:, code] += np.bincount(persona_codes, weights=conversation_tokens[:, code], minlength=personas).astype(np.int64)
+
+    def report(self, max_conversation_turns: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Summarize everything added so far.
+
+        Args:
+            max_conversation_turns: Turn limit of the run, to tell conversations that hit it from ones
+                that ended early (default: the longest conversation's turns)
+
+        Returns:
+            JSON-serializable report
+        """
+        np = _numpy()
+        if max_conversation_turns is None:
+            max_conversation_turns = self.turns.max or 0
+
+        persona_conversations = self._persona_turn_counts.sum(axis=1)
+        persona_turns = self._persona_turn_counts @ np.arange(self._persona_turn_counts.shape[1])
+        persona_early = self._persona_turn_counts[:, :max_conversation_turns].sum(axis=1)
+        early = int(persona_early.sum())
+
+        personas = []
+        for code in np.lexsort((np.array(self.persona_names, dtype=object), -persona_conversations)):
+            conversations = int(persona_conversations[code])
+            personas.append({
+                "persona_name": self.persona_names[code],
+                "conversations": conversations,
+                "mean_turns": float(persona_turns[code] / conversations),
+                "ended_early": int(persona_early[code]),
+                "early_stop_rate": float(persona_early[code] / conversations),
+                **{f"mean_{role.name}_characters": float(self._persona_characters[code, _ROLE_CODES[role.name]] / conversations) for role in ROLE},
+                **{f"mean_{role.name}_tokens": float(self._persona_tokens[code, _ROLE_CODES[role.name]] / conversations) for role in ROLE}
+            })
+
+        return {
+            "conversations": self.conversations,
+            "messages": sum(histogram.count for histogram in self.characters.values()),
+            "turns": {**self.turns.summary(), "histogram": self.turns.exact_counts()},
+            "terminations": {
+                "max_conversation_turns": max_conversation_turns,
+                "ended_early": early,
+                "hit_max_turns": self.conversations - early,
+                "early_stop_rate": early / self.conversations if self.conversations else None
+            },
+            "roles": {
+                role.name: {"characters": self.characters[role].summary(), "tokens": self.tokens[role].summary()}
+                for role in ROLE
+            },
+            "personas": personas
+        }
+
+
+def iter_conversation_chunks(path: str, chunk_size: int = 10_000) -> Iterator[List[ConversationRecord]]:
+    """
+    Read a JSONL, Parquet or Arrow IPC conversation file chunk_size conversations at a time.
+
+    JSONL records are decoded one line at a time and reduced to what the analytics need
+    straight away; columnar files are scanned batch by batch.
+    """
+    try:
+        file_format = detect_format(path)
+    except ValueError:
+        file_format = "jsonl"
+
+    if file_format == "jsonl":
+        with open(path, "r") as f:
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    return
+                chunk = []
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    chunk.append((record.get("persona_name", ""), [(message["role"], message["content"]) for message in record["messages"]]))
+                yield chunk
+    else:
+        conversations = ColumnarConversationReader(path).conversations()
+        while True:
+            chunk = [(conversation.user_id, [(message.role.name, message.content) for message in conversation.messages]) for conversation in itertools.islice(conversations, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+
+
+def format_report(report: Dict[str, Any], max_personas: int = 50) -> str:
+    """Render a report as Markdown."""
+    def number(value, digits=1):
+        if value is None:
+            return "-"
+        return f"{value:,.{digits}f}" if isinstance(value, float) else f"{value:,}"
+
+    turns = report["turns"]
+    terminations = report["terminations"]
+    lines = [
+        "# Conversation Analytics",
+        "",
+        f"{number(report['conversations'])} conversations and {number(report['messages'])} messages from {', '.join(report.get('files', []))}",
+        "",
+        "## Turns per Conversation",
+        "",
+        "| Mean | p50 | p90 | p99 | Max |",
+        "| ---: | ---: | ---: | ---: | ---: |",
+        f"| {number(turns['mean'], 2)} | {number(turns['p50'])} | {number(turns['p90'])} | {number(turns['p99'])} | {number(turns['max'])} |",
+        "",
+        "| Turns | Conversations |",
+        "| ---: | ---: |",
+        *(f"| {turn} | {number(count)} |" for turn, count in turns["histogram"].items()),
+        "",
+        "## Terminations",
+        "",
+        f"Conversations with fewer than {terminations['max_conversation_turns']} turns count as ended early.",
+        "",
+        "| Ended early | Hit max turns | Early stop rate |",
+        "| ---: | ---: | ---: |",
+        f"| {number(terminations['ended_early'])} | {number(terminations['hit_max_turns'])} | {number(terminations['early_stop_rate'], 3)} |",
+        "",
+        "## Messages by Role",
+        "",
+        "| Role | Messages | Mean chars | p50 chars | p99 chars | Max chars | Mean tokens | p50 tokens | p99 tokens | Total tokens |",
+        "| --- | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |",
+    ]
+    for role, stats in report["roles"].items():
+        characters, tokens = stats["characters"], stats["tokens"]
+        lines.append(f"| {role} | {number(characters['count'])} | {number(characters['mean'])} | {number(characters['p50'])} | {number(characters['p99'])} | {number(characters['max'])} | {number(tokens['mean'])} | {number(tokens['p50'])} | {number(tokens['p99'])} | {number(tokens['total'])} |")
+
+    personas = report["personas"]
+    lines += [
+        "",
+        "## Personas",
+        "",
+        f"The {min(max_personas, len(personas))} of {len(personas)} personas with the most conversations. Characters and tokens are means per conversation.",
+        "",
+        "| Persona | Conversations | Mean turns | Early stop rate | User chars | Assistant chars | User tokens | Assistant tokens |",
+        "| --- | ---: | ---: | ---: | ---: | ---: | ---: | ---: |",
+    ]
+    for persona in personas[:max_personas]:
+        name = (persona["persona_name"] or "(unnamed)").replace("|", "\\|")
+        lines.append(f"| {name} | {number(persona['conversations'])} | {number(persona['mean_turns'], 2)} | {number(persona['early_stop_rate'], 3)} | {number(persona['mean_user_characters'])} | {number(persona['mean_assistant_characters'])} | {number(persona['mean_user_tokens'])} | {number(persona['mean_assistant_tokens'])} |")
+    return "\n".join(lines) + "\n"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--input-path", type=str, nargs="+", required=True, help="Conversation files written by conversation_generator.py, as JSONL, Parquet or Arrow IPC")
+    parser.add_argument("--output-path", type=str, help="Path to write the report as JSON")
+    parser.add_argument("--markdown-path", type=str, help="Path to write the report as Markdown (default: print it unless --output-path is given)")
+    parser.add_argument("--max-conversation-turns", type=int, help="Turn limit of the run, to tell conversations that hit it from ones that ended early (default: the longest conversation's turns)")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Conversations read and reduced at a time, bounding memory use")
+    parser.add_argument("--max-personas", type=int, default=50, help="Personas to list in the Markdown report; the JSON report lists all of them")
+
+
+def run(args: argparse.Namespace):
+    stats = ConversationStats()
+    for path in args.input_path:
+        for chunk in iter_conversation_chunks(path, args.chunk_size):
+            stats.add_conversations(chunk)
+            logger.debug(f"Read {stats.conversations} conversations")
+        logger.info(f"Read {path}: {stats.conversations} conversations so far")
+
+    report = {"files": list(args.input_path), **stats.report(args.max_conversation_turns)}
+
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump(report, f, indent=2)
+    markdown = format_report(report, args.max_personas)
+    if args.markdown_path:
+        with open(args.markdown_path, "w") as f:
+            f.write(markdown)
+    elif not args.output_path:
+        print(markdown)
+    logger.info(f"{report['conversations']} conversations, {report['turns']['mean'] or 0:.2f} turns on average, early stop rate {report['terminations']['early_stop_rate'] or 0:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize generated conversation files: turns, message lengths, terminations and per-persona breakdowns")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging()
+    run(args)
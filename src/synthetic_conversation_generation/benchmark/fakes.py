@@ -0,0 +1,545 @@
+from collections import Counter
+from dataclasses import dataclass, field
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.inference_endpoint import InferenceEndpoint
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+from synthetic_conversation_generation.llm_queries.rate_limiter import CHARS_PER_TOKEN
+
+
+WORDS = [
+    "account", "actually", "after", "again", "answer", "anyway", "around", "because", "before", "better",
+    "budget", "change", "check", "could", "daily", "different", "early", "enough", "every", "family",
+    "favorite", "few", "figure", "friend", "great", "happy", "help", "honestly", "idea", "important",
+    "just", "kind", "later", "little", "maybe", "meeting", "morning", "need", "never", "option",
+    "order", "plan", "please", "problem", "question", "quick", "really", "recommend", "schedule", "second",
+    "should", "simple", "something", "still", "sure", "thanks", "think", "today", "trying", "usually",
+    "wait", "week", "whether", "without", "wonder", "work", "worried", "would", "year", "yesterday"
+]
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal latency distribution; sigma=0 gives a constant latency."""
+    median_seconds: float = 0.05
+    sigma: float = 0.5
+    max_seconds: Optional[float] = None
+
+    def sample(self, rng: random.Random) -> float:
+        latency = self.median_seconds * math.exp(self.sigma * rng.gauss(0, 1)) if self.sigma > 0 else self.median_seconds
+        return min(latency, self.max_seconds) if self.max_seconds is not None else latency
+
+
+@dataclass
+class FakeServiceConfig:
+    """Behaviour of a fake LLM provider or assistant endpoint."""
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    # Fraction of calls that fail with a 500
+    error_rate: float = 0.0
+    # Fraction of calls that fail with a 429 and a Retry-After header
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: float = 0.5
+    # Length of generated free-text fields and assistant messages
+    response_words: int = 40
+    # Delay between words of a streamed response; latency is then the time to the first word
+    inter_token_seconds: float = 0.0
+
+
+@dataclass
+class _FakeResponse:
+    status_code: int
+    headers: Dict[str, str]
+
+
+class FakeAPIError(Exception):
+    """Error shaped like the provider SDKs' HTTP errors, so it is classified and retried the same way."""
+
+    def __init__(self, status_code: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"Fake API error {status_code}")
+        self.status_code = status_code
+        self.response = _FakeResponse(status_code, headers or {})
+
+
+class _DeterministicCalls:
+    """
+    Seeds a random generator per call from its input and how often that input was seen.
+
+    Results therefore do not depend on thread scheduling, and a retried call draws fresh
+    faults instead of failing the same way forever.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._occurrences: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def rng(self, key: Union[str, bytes]) -> random.Random:
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences[digest]
+            self._occurrences[digest] += 1
+        return random.Random(f"{self.seed}:{digest}:{occurrence}")
+
+
+def _inject_faults(config: FakeServiceConfig, rng: random.Random) -> Optional[FakeAPIError]:
+    roll = rng.random()
+    if roll < config.rate_limit_rate:
+        return FakeAPIError(429, {"retry-after": str(config.retry_after_seconds)})
+    if roll < config.rate_limit_rate + config.error_rate:
+        return FakeAPIError(500)
+    return None
+
+
+class FakeModelProvider(ModelProvider):
+    """
+    Offline ModelProvider that answers any response schema with generated text after a simulated latency.
+
+    Token usage is estimated from text length and recorded like a real provider's, so
+    usage summaries and metrics behave as in a live run.
+    """
+
+    def __init__(self, config: Optional[FakeServiceConfig] = None, completion_rate: float = 0.3, seed: int = 42):
+        """
+        Args:
+            config: Latency, fault injection and response length
+            completion_rate: Probability that a boolean field, i.e. a completion check, is true
+            seed: Seed for latencies, faults and generated text
+        """
+        super().__init__()
+        self.config = config or FakeServiceConfig()
+        self.completion_rate = completion_rate
+        self._calls = _DeterministicCalls(seed)
+
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
+        text = user_msg if isinstance(user_msg, str) else user_msg.text
+        rng = self._calls.rng(f"{model_id}\0{text}")
+
+        time.sleep(self.config.latency.sample(rng))
+        error = _inject_faults(self.config, rng)
+        if error is not None:
+            raise error
+
+        response = self._fake_value(response_schema, rng, "response")
+        self.record_usage(model_id, len(text) // CHARS_PER_TOKEN, len(json.dumps(response)) // CHARS_PER_TOKEN)
+        return response
+
+    def _fake_value(self, schema: Dict, rng: random.Random, name: str) -> Any:
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {key: self._fake_value(value, rng, key) for key, value in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [self._fake_value(schema.get("items", {}), rng, name)]
+        if schema_type == "boolean":
+            return rng.random() < self.completion_rate
+        if schema_type == "integer":
+            return rng.randint(0, 100)
+        if schema_type == "number":
+            return rng.random()
+        if name == "name":
+            return words(rng, 2).title()
+        if name == "summary":
+            return words(rng, 10)
+        return words(rng, self.config.response_words)
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return response_schema
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections when many workers connect at once
+    request_queue_size = 1024
+
+
+class FakeInferenceServer:
+    """
+    Local HTTP stand-in for an assistant's inference endpoint, serving OpenAI-style chat responses.
+
+    Runs a threaded HTTP/1.1 server with keep-alive in the background, so the real
+    InferenceEndpoint client, connection pool and serialization are exercised. Requests
+    with "stream": true are answered with Server-Sent Events, one word per event, in the
+    Anthropic format on paths ending in /messages and the OpenAI format otherwise.
+    """
+
+    def __init__(self, config: Optional[FakeServiceConfig] = None, seed: int = 42, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeServiceConfig()
+        self.requests = 0
+        self._calls = _DeterministicCalls(seed)
+        self._lock = threading.Lock()
+        self._server = _FakeHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def _handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if json.loads(body or b"{}").get("stream"):
+                    self._stream(body)
+                    return
+                status, headers, response = fake_server.respond(body)
+                payload = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body: bytes):
+                stream_format = "anthropic" if self.path.endswith("/messages") else "openai"
+                events = fake_server.stream_events(body, stream_format)
+                error = next(events)
+                if error is not None:
+                    payload = json.dumps({"error": str(error)}).encode("utf-8")
+                    self.send_response(error.status_code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    for key, value in error.response.headers.items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for event in events:
+                    self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def respond(self, body: bytes):
+        """Status, headers and JSON response for a request body."""
+        with self._lock:
+            self.requests += 1
+        rng = self._calls.rng(body)
+
+        time.sleep(self.config.latency.sample(rng))
+        error = _inject_faults(self.config, rng)
+        if error is not None:
+            return error.status_code, error.response.headers, {"error": str(error)}
+
+        return 200, {}, {"choices": [{"message": {"role": "assistant", "content": words(rng, self.config.response_words)}}]}
+
+    def stream_events(self, body: bytes, stream_format: str) -> Iterator[Any]:
+        """
+        Yield the injected error or None, then, if there was no error, each encoded SSE event of the response in turn.
+        """
+        with self._lock:
+            self.requests += 1
+        rng = self._calls.rng(body)
+
+        time.sleep(self.config.latency.sample(rng))
+        error = _inject_faults(self.config, rng)
+        yield error
+        if error is not None:
+            return
+
+        def event(data: Dict, event_type: Optional[str] = None) -> bytes:
+            return (f"event: {event_type}\n" if event_type else "").encode("utf-8") + b"data: " + json.dumps(data).encode("utf-8") + b"\n\n"
+
+        if stream_format == "anthropic":
+            yield event({"type": "message_start", "message": {"role": "assistant", "content": []}}, "message_start")
+            yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for i, word in enumerate(words(rng, self.config.response_words).split(" ")):
+            if i > 0 and self.config.inter_token_seconds > 0:
+                time.sleep(self.config.inter_token_seconds)
+            text = word if i == 0 else " " + word
+            if stream_format == "anthropic":
+                yield event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}, "content_block_delta")
+            else:
+                yield event({"choices": [{"index": 0, "delta": {"content": text}}]})
+        if stream_format == "anthropic":
+            yield event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield event({"type": "message_stop"}, "message_stop")
+        else:
+            yield event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            yield b"data: [DONE]\n\n"
+
+    def inference_endpoint(self, pool_size: int = 10, stream: bool = False, stream_format: str = "openai") -> InferenceEndpoint:
+        if stream and stream_format == "anthropic":
+            return InferenceEndpoint(
+                url=self.url.replace("/v1/chat/completions", "/v1/messages"),
+                body={"model": "benchmark-assistant", "max_tokens": 1024},
+                headers={},
+                response_path=["content", 0, "text"],
+                pool_size=pool_size,
+                stream=True,
+                stream_format="anthropic"
+            )
+        return InferenceEndpoint(
+            url=self.url,
+            body={"model": "benchmark-assistant"},
+            headers={},
+            response_path=["choices", 0, "message", "content"],
+            pool_size=pool_size,
+            stream=stream
+        )
+
+    def start(self) -> "FakeInferenceServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeInferenceServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class FakeBatchServer:
+    """
+    Local HTTP stand-in for the OpenAI Batch and Anthropic Message Batches APIs.
+
+    Serves the file upload, batch creation, status and results endpoints that the provider
+    SDKs call, so the real batch backends, SDK clients and result parsing are exercised.
+    Each batch reports itself in progress for its first polls_until_complete status checks
+    and is then answered in full, with a config.error_rate fraction of its requests failing.
+    Requests are seeded by their body and how often it was seen, so a resubmitted request
+    draws a fresh outcome.
+    """
+
+    def __init__(self, config: Optional[FakeServiceConfig] = None, completion_rate: float = 0.3, seed: int = 42, polls_until_complete: int = 1, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeServiceConfig()
+        self.polls_until_complete = polls_until_complete
+        self.batches_created = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self._answers = FakeModelProvider(self.config, completion_rate, seed)
+        self._calls = _DeterministicCalls(seed)
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._server = _FakeHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def anthropic_base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.anthropic_base_url}/v1"
+
+    def _handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, payload: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _route(self, method: str):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    response = fake_server.handle(method, self.path.split("?")[0], self.headers.get("Content-Type", ""), body)
+                except KeyError as e:
+                    self._reply(404, json.dumps({"error": {"message": f"Not found: {e}"}}).encode("utf-8"))
+                    return
+                if isinstance(response, bytes):
+                    self._reply(200, response, "application/binary")
+                else:
+                    self._reply(200, json.dumps(response).encode("utf-8"))
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+    def handle(self, method: str, path: str, content_type: str, body: bytes) -> Union[Dict, bytes]:
+        """JSON response, or raw file content, for a request; raises KeyError for unknown paths and ids."""
+        parts = path.strip("/").split("/")
+        if parts[:2] == ["v1", "files"]:
+            if method == "POST":
+                return self._upload_file(content_type, body)
+            if len(parts) == 4 and parts[3] == "content":
+                return self._files[parts[2]]
+        elif parts[:2] == ["v1", "batches"]:
+            if method == "POST":
+                request = json.loads(body)
+                lines = self._files[request["input_file_id"]].decode("utf-8").splitlines()
+                return self._create_batch("openai", [json.loads(line) for line in lines if line.strip()])
+            return self._openai_batch(self._poll(parts[2]))
+        elif parts[:3] == ["v1", "messages", "batches"]:
+            if method == "POST":
+                return self._create_batch("anthropic", json.loads(body)["requests"])
+            if len(parts) == 5 and parts[4] == "results":
+                return self._batches[parts[3]]["results"]
+            return self._anthropic_batch(self._poll(parts[3]))
+        raise KeyError(path)
+
+    def _upload_file(self, content_type: str, body: bytes) -> Dict:
+        boundary = content_type.split("boundary=")[1].strip('"').encode("utf-8")
+        for part in body.split(b"--" + boundary):
+            headers, _, content = part.partition(b"\r\n\r\n")
+            if b'name="file"' in headers:
+                file_id = f"file-{uuid.uuid4().hex}"
+                with self._lock:
+                    self._files[file_id] = content[:-2] if content.endswith(b"\r\n") else content
+                return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()), "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+        raise KeyError("file")
+
+    def _create_batch(self, api: str, requests: List[Dict]) -> Dict:
+        batch_id = f"batch-{uuid.uuid4().hex}"
+        with self._lock:
+            self.batches_created += 1
+            self._batches[batch_id] = {"id": batch_id, "api": api, "requests": requests, "polls": 0, "created_at": int(time.time()), "results": None}
+        return self._openai_batch(self._batches[batch_id]) if api == "openai" else self._anthropic_batch(self._batches[batch_id])
+
+    def _poll(self, batch_id: str) -> Dict:
+        batch = self._batches[batch_id]
+        with self._lock:
+            batch["polls"] += 1
+            ready = batch["results"] is None and batch["polls"] > self.polls_until_complete
+        if ready:
+            self._answer(batch)
+        return batch
+
+    def _answer(self, batch: Dict):
+        outputs, errors = [], []
+        for request in batch["requests"]:
+            params = request["body"] if batch["api"] == "openai" else request["params"]
+            schema = params["response_format"]["json_schema"]["schema"] if batch["api"] == "openai" else params["tools"][0]["input_schema"]
+            rng = self._calls.rng(json.dumps(params, sort_keys=True))
+            failed = rng.random() < self.config.error_rate
+            response = None if failed else self._answers._fake_value(schema, rng, "response")
+            with self._lock:
+                self.requests += 1
+                self.failed_requests += failed
+            (errors if failed else outputs).append(self._result_line(batch["api"], request["custom_id"], params["model"], response))
+
+        if batch["api"] == "openai":
+            batch["output_file_id"] = self._store_file(outputs)
+            batch["error_file_id"] = self._store_file(errors) if errors else None
+            batch["results"] = True
+        else:
+            batch["results"] = "\n".join(json.dumps(line) for line in outputs + errors).encode("utf-8")
+
+    def _store_file(self, lines: List[Dict]) -> str:
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self._files[file_id] = "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+        return file_id
+
+    def _result_line(self, api: str, custom_id: str, model_id: str, response: Optional[Dict]) -> Dict:
+        usage_tokens = len(json.dumps(response)) // CHARS_PER_TOKEN
+        if api == "openai":
+            if response is None:
+                return {"id": f"response-{custom_id}", "custom_id": custom_id, "response": {"status_code": 500, "body": {"error": {"message": "Fake server error", "type": "server_error"}}}, "error": None}
+            completion = {
+                "id": f"chatcmpl-{custom_id}", "object": "chat.completion", "created": int(time.time()), "model": model_id,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(response)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": usage_tokens, "total_tokens": 10 + usage_tokens}
+            }
+            return {"id": f"response-{custom_id}", "custom_id": custom_id, "response": {"status_code": 200, "body": completion}, "error": None}
+
+        if response is None:
+            return {"custom_id": custom_id, "result": {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Fake server error"}}}}
+        message = {
+            "id": f"msg-{custom_id}", "type": "message", "role": "assistant", "model": model_id,
+            "content": [{"type": "tool_use", "id": f"toolu-{custom_id}", "name": "json_extractor", "input": response}],
+            "stop_reason": "tool_use", "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": usage_tokens}
+        }
+        return {"custom_id": custom_id, "result": {"type": "succeeded", "message": message}}
+
+    def _openai_batch(self, batch: Dict) -> Dict:
+        done = batch["results"] is not None
+        return {
+            "id": batch["id"], "object": "batch", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+            "input_file_id": "file-input", "created_at": batch["created_at"], "status": "completed" if done else "in_progress",
+            "output_file_id": batch.get("output_file_id"), "error_file_id": batch.get("error_file_id")
+        }
+
+    def _anthropic_batch(self, batch: Dict) -> Dict:
+        done = batch["results"] is not None
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(batch["created_at"]))
+        return {
+            "id": batch["id"], "type": "message_batch", "processing_status": "ended" if done else "in_progress",
+            "request_counts": {"processing": 0 if done else len(batch["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": created_at, "expires_at": created_at, "ended_at": created_at if done else None,
+            "archived_at": None, "cancel_initiated_at": None,
+            "results_url": f"{self.anthropic_base_url}/v1/messages/batches/{batch['id']}/results" if done else None
+        }
+
+    def start(self) -> "FakeBatchServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeBatchServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def synthetic_personas(count: int, seed: int = 42) -> List[CharacterCard]:
+    """Deterministic personas for benchmark conversations."""
+    rng = random.Random(seed)
+    return [
+        CharacterCard(
+            name=f"{words(rng, 2).title()} {i}",
+            description=words(rng, 60),
+            personality=words(rng, 40),
+            scenario=words(rng, 40),
+            summary=words(rng, 10)
+        )
+        for i in range(count)
+    ]
@@ -0,0 +1,238 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.benchmark.fakes import FakeInferenceServer, FakeModelProvider, FakeServiceConfig, LatencyModel, synthetic_personas
+from synthetic_conversation_generation.cli_support import configure_logging
+from synthetic_conversation_generation.conversation_generator import ConversationGenerator, ConversationRunner
+from synthetic_conversation_generation.data_models.assistant import Assistant
+from synthetic_conversation_generation.metrics import MetricsRecorder
+from synthetic_conversation_generation.persona_generator import PersonaGenerator
+
+
+logger = logging.getLogger(__name__)
+
+
+BENCHMARK_ASSISTANT = Assistant(
+    name="Benchmark Assistant",
+    description="A general-purpose assistant that helps users plan their week, answer everyday questions and recommend products."
+)
+
+
+@dataclass
+class Scenario:
+    name: str
+    # "conversations" runs ConversationGenerator, "personas" runs PersonaGenerator
+    kind: str
+    num_personas: int
+    max_conversation_turns: int = 3
+    concurrency: int = 16
+    max_full_personas: Optional[int] = None
+
+
+STANDARD_SCENARIOS = [
+    Scenario("conversations-100", "conversations", num_personas=100, max_conversation_turns=3, concurrency=16),
+    Scenario("conversations-1k", "conversations", num_personas=1000, max_conversation_turns=3, concurrency=64),
+    Scenario("conversations-1k-long", "conversations", num_personas=1000, max_conversation_turns=8, concurrency=64),
+    Scenario("conversations-10k", "conversations", num_personas=10000, max_conversation_turns=3, concurrency=128),
+    Scenario("personas-100", "personas", num_personas=100, concurrency=8),
+    Scenario("personas-1k-summaries", "personas", num_personas=1000, concurrency=8, max_full_personas=20),
+]
+
+
+@dataclass
+class BenchmarkConfig:
+    llm: FakeServiceConfig = field(default_factory=FakeServiceConfig)
+    endpoint: FakeServiceConfig = field(default_factory=FakeServiceConfig)
+    completion_rate: float = 0.3
+    seed: int = 42
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _latency_percentiles(summary: Dict, call: str, stage: str) -> Dict[str, Optional[float]]:
+    stats = summary["calls"].get(call, {}).get(stage, {})
+    return {f"latency_{q}": stats.get(q) for q in ("p50", "p95", "p99")}
+
+
+def run_scenario(scenario: Scenario, config: BenchmarkConfig) -> Dict:
+    """
+    Run one scenario against the fake provider and endpoint and measure it.
+
+    For conversation scenarios latency is per turn; for persona scenarios it is per persona query.
+
+    Returns:
+        The scenario definition together with its throughput, latency percentiles, CPU time and peak RSS
+    """
+    recorder = MetricsRecorder()
+    metrics.set_recorder(recorder)
+    model_provider = FakeModelProvider(config.llm, config.completion_rate, config.seed)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if scenario.kind == "conversations":
+        with FakeInferenceServer(config.endpoint, config.seed) as server:
+            inference_endpoint = server.inference_endpoint(pool_size=scenario.concurrency)
+            jobs = (
+                (str(conversation_id), ConversationGenerator(model_provider, "benchmark-user-model", inference_endpoint, BENCHMARK_ASSISTANT, user_persona, scenario.max_conversation_turns, "benchmark-completion-model"))
+                for conversation_id, user_persona in enumerate(synthetic_personas(scenario.num_personas, config.seed))
+            )
+            conversation_runner = ConversationRunner(concurrency=scenario.concurrency)
+            completed = sum(1 for _ in conversation_runner.run(jobs))
+            failed = len(conversation_runner.failed_conversation_ids)
+            inference_endpoint.close()
+        latency = ("turn", "conversation")
+    elif scenario.kind == "personas":
+        persona_generator = PersonaGenerator(model_provider, "benchmark-persona-model", BENCHMARK_ASSISTANT, [], scenario.max_full_personas)
+        completed = sum(1 for _ in persona_generator.generate_personas(scenario.num_personas, scenario.concurrency))
+        failed = scenario.num_personas - completed
+        latency = ("llm_query", "persona")
+    else:
+        raise ValueError(f"Unknown scenario kind: {scenario.kind}")
+    wall_seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+
+    summary = recorder.summary()
+    metrics.set_recorder(None)
+    return {
+        **asdict(scenario),
+        "completed": completed,
+        "failed": failed,
+        "wall_seconds": wall_seconds,
+        "throughput_per_minute": completed / wall_seconds * 60 if wall_seconds > 0 else None,
+        **_latency_percentiles(summary, *latency),
+        "cpu_seconds": cpu_seconds,
+        "prompt_cpu_seconds": sum(summary["prompt_cpu_seconds"].values()),
+        "peak_rss_mb": _peak_rss_mb(),
+        "llm_calls": sum(stats["count"] for stats in summary["calls"].get("llm_query", {}).values()),
+        "retries": sum(count for kinds in summary["retries"].values() for count in kinds.values())
+    }
+
+
+def logger_levels(verbose: bool) -> Dict[str, int]:
+    """Levels for configure_logging: per-turn progress logs would dominate the output and the CPU profile of large scenarios unless verbose."""
+    if verbose:
+        return {}
+    return {
+        "synthetic_conversation_generation.conversation_generator": logging.WARNING,
+        "synthetic_conversation_generation.persona_generator": logging.WARNING
+    }
+
+
+def run_isolated(scenario: Scenario, config: BenchmarkConfig, logger_levels: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Run a scenario in a fresh process so that its peak RSS is not inflated by earlier scenarios.
+
+    Args:
+        logger_levels: Logging is configured afresh in the new process, with these logger levels
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=configure_logging, initargs=(logging.INFO, logger_levels)) as executor:
+        return executor.submit(run_scenario, scenario, config).result()
+
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Compare results with a previous report of the same scenarios.
+
+    Returns:
+        A description of each scenario whose throughput dropped, or whose p95 latency rose, by more than tolerance
+    """
+    baseline_by_name = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_name.get(result["name"])
+        if previous is None:
+            continue
+        if previous.get("throughput_per_minute") and result["throughput_per_minute"] is not None and result["throughput_per_minute"] < previous["throughput_per_minute"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: throughput {result['throughput_per_minute']:.1f}/min vs baseline {previous['throughput_per_minute']:.1f}/min")
+        if previous.get("latency_p95") and result["latency_p95"] is not None and result["latency_p95"] > previous["latency_p95"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p95 latency {result['latency_p95']:.3f}s vs baseline {previous['latency_p95']:.3f}s")
+    return regressions
+
+
+def format_results(results: List[Dict]) -> str:
+    def number(value, precision):
+        return "-" if value is None else f"{value:.{precision}f}"
+
+    lines = [f"{'scenario':<24} {'done':>6} {'failed':>6} {'per min':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'cpu s':>7} {'prompt cpu s':>12} {'peak rss mb':>11}"]
+    for result in results:
+        lines.append(
+            f"{result['name']:<24} {result['completed']:>6} {result['failed']:>6} {number(result['throughput_per_minute'], 1):>9} "
+            f"{number(result['latency_p50'], 3):>7} {number(result['latency_p95'], 3):>7} {number(result['latency_p99'], 3):>7} "
+            f"{number(result['cpu_seconds'], 2):>7} {number(result['prompt_cpu_seconds'], 2):>12} {number(result['peak_rss_mb'], 1):>11}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    scenarios_by_name = {scenario.name: scenario for scenario in STANDARD_SCENARIOS}
+
+    parser = argparse.ArgumentParser(description="Benchmark conversation and persona generation offline against a fake LLM provider and assistant endpoint")
+    parser.add_argument("--scenarios", type=str, nargs="+", choices=[*scenarios_by_name, "all"], default=["conversations-100", "personas-100"], help="Scenarios to run")
+    parser.add_argument("--output-path", type=str, help="Path to save the results (JSON format)")
+    parser.add_argument("--baseline-path", type=str, help="Path to a previous results file; exit with an error if any scenario regressed")
+    parser.add_argument("--regression-tolerance", type=float, default=0.1, help="Relative throughput drop or p95 latency rise tolerated before reporting a regression")
+    parser.add_argument("--llm-latency-median", type=float, default=0.05, help="Median latency of fake LLM calls in seconds")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5, help="Log-normal spread of fake LLM latency (0 for constant)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail with a 500")
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail with a 429")
+    parser.add_argument("--endpoint-latency-median", type=float, default=0.05, help="Median latency of the fake assistant endpoint in seconds")
+    parser.add_argument("--endpoint-latency-sigma", type=float, default=0.5, help="Log-normal spread of fake assistant endpoint latency (0 for constant)")
+    parser.add_argument("--endpoint-error-rate", type=float, default=0.0, help="Fraction of fake assistant endpoint calls that fail with a 500")
+    parser.add_argument("--endpoint-rate-limit-rate", type=float, default=0.0, help="Fraction of fake assistant endpoint calls that fail with a 429")
+    parser.add_argument("--retry-after-seconds", type=float, default=0.5, help="Retry-After sent with injected 429s")
+    parser.add_argument("--completion-rate", type=float, default=0.3, help="Probability that each completion check ends the conversation")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for fake latencies, faults and responses")
+    parser.add_argument("--no-isolate", action="store_true", help="Run scenarios in this process instead of one fresh process each; peak RSS then accumulates across scenarios")
+    parser.add_argument("--verbose", action="store_true", help="Log the progress of every conversation turn and persona, which slows large scenarios")
+    args = parser.parse_args()
+    scenario_logger_levels = logger_levels(args.verbose)
+    configure_logging(logger_levels=scenario_logger_levels)
+
+    config = BenchmarkConfig(
+        llm=FakeServiceConfig(LatencyModel(args.llm_latency_median, args.llm_latency_sigma), args.llm_error_rate, args.llm_rate_limit_rate, args.retry_after_seconds),
+        endpoint=FakeServiceConfig(LatencyModel(args.endpoint_latency_median, args.endpoint_latency_sigma), args.endpoint_error_rate, args.endpoint_rate_limit_rate, args.retry_after_seconds),
+        completion_rate=args.completion_rate,
+        seed=args.seed
+    )
+    scenarios = STANDARD_SCENARIOS if "all" in args.scenarios else [scenarios_by_name[name] for name in args.scenarios]
+
+    results = []
+    for scenario in scenarios:
+        logger.info(f"Running scenario {scenario.name}")
+        result = run_scenario(scenario, config) if args.no_isolate else run_isolated(scenario, config, scenario_logger_levels)
+        logger.info(f"Finished {scenario.name} in {result['wall_seconds']:.1f}s")
+        results.append(result)
+
+    print(format_results(results))
+
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump({"config": asdict(config), "results": results}, f, indent=2)
+
+    if args.baseline_path:
+        with open(args.baseline_path, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.regression_tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
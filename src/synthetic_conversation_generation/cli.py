@@ -0,0 +1,43 @@
+import argparse
+from typing import List, Optional
+
+from synthetic_conversation_generation import analytics, conversation_generator, job_queue, load_test, persona_generator, pipeline
+from synthetic_conversation_generation.cli_support import configure_logging
+from synthetic_conversation_generation.output import columnar
+
+
+# Each command module provides add_arguments(parser) and run(args), and optionally check_arguments(parser, args)
+# and logger_levels(args) for configure_logging
+COMMANDS = [
+    ("personas", persona_generator, "Generate user personas for an assistant"),
+    ("conversations", conversation_generator, "Generate conversations between personas and an assistant endpoint"),
+    ("pipeline", pipeline, "Generate personas and hold a conversation with each as soon as it is accepted"),
+    ("load-test", load_test, "Load-test an assistant endpoint with multi-turn conversations arriving at a target rate"),
+    ("jobs", job_queue, "Inspect and export a conversation job store"),
+    ("convert", columnar, "Convert JSONL conversations into a columnar Parquet or Arrow IPC dataset"),
+    ("analytics", analytics, "Summarize generated conversation files: turns, message lengths, terminations and per-persona breakdowns"),
+]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="synthetic-conversations", description="Generate synthetic personas and conversations for testing AI assistants")
+    subparsers = parser.add_subparsers(dest="subcommand", metavar="COMMAND", required=True)
+    for name, module, description in COMMANDS:
+        command_parser = subparsers.add_parser(name, help=description, description=description)
+        module.add_arguments(command_parser)
+        command_parser.set_defaults(command_module=module, command_parser=command_parser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    check_arguments = getattr(args.command_module, "check_arguments", None)
+    if check_arguments is not None:
+        check_arguments(args.command_parser, args)
+    logger_levels = getattr(args.command_module, "logger_levels", None)
+    configure_logging(logger_levels=logger_levels(args) if logger_levels is not None else None)
+    args.command_module.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+from dataclasses import dataclass
+import logging
+from typing import Dict, Optional
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.hedging import HedgedModelProvider
+from synthetic_conversation_generation.llm_queries.llm_query import MODEL_PROVIDERS, ModelProvider, create_model_provider
+from synthetic_conversation_generation.llm_queries.openai_compatible import OpenAICompatibleModelProvider
+from synthetic_conversation_generation.llm_queries.rate_limiter import RateLimitedModelProvider, RateLimiter
+from synthetic_conversation_generation.llm_queries.response_cache import CacheMode, CachedModelProvider, ResponseCache
+from synthetic_conversation_generation.metrics import MetricsRecorder, ThreadProfiler, load_prices
+
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: int = logging.INFO, logger_levels: Optional[Dict[str, int]] = None):
+    """
+    Set up logging for a command line run: the application's loggers at the given level and
+    everything else, e.g. the HTTP and SDK loggers of third-party libraries, at WARNING.
+
+    Only command entry points call this, so importing the package never configures logging.
+
+    Args:
+        level: Level of the application's loggers
+        logger_levels: Logger name -> level for loggers that should differ from level, applied in order
+    """
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logging.getLogger("synthetic_conversation_generation").setLevel(level)
+    for name, logger_level in (logger_levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+
+def add_model_provider_arguments(parser: argparse.ArgumentParser, purpose: str):
+    """
+    Add the arguments read by create_model_provider_stack.
+
+    Args:
+        parser: Parser to add the arguments to
+        purpose: What the provider is used for, completing "LLM provider to use for ..."
+    """
+    parser.add_argument("--model-provider", type=str, choices=MODEL_PROVIDERS, default="openai", help=f"LLM provider to use for {purpose}")
+    parser.add_argument("--model-provider-config", type=str, help="Path to a YAML file configuring the openai_compatible provider's server, concurrency and sampling")
+    parser.add_argument("--requests-per-minute", type=float, help="Requests per minute allowed per model, shared by all workers")
+    parser.add_argument("--tokens-per-minute", type=float, help="Estimated tokens per minute allowed per model, shared by all workers")
+    parser.add_argument("--hedge-percentile", type=float, help="Send a duplicate request when a call runs past this percentile of recent latencies for its model and stage, e.g. 95, and use whichever answers first")
+    parser.add_argument("--hedge-min-samples", type=int, default=20, help="Successful calls per model and stage needed before hedging starts")
+    parser.add_argument("--fallback-model-provider", type=str, choices=MODEL_PROVIDERS, help="LLM provider to fail over to when the primary keeps failing (default: the primary provider)")
+    parser.add_argument("--fallback-model-provider-config", type=str, help="Path to a YAML file configuring an openai_compatible fallback provider")
+    parser.add_argument("--fallback-model-ids", type=str, help="Fallback model for each primary model as MODEL=FALLBACK pairs separated by commas, or a single model ID for every model")
+    parser.add_argument("--circuit-breaker-failures", type=int, default=5, help="Consecutive failures after which a provider's circuit breaker opens")
+    parser.add_argument("--circuit-breaker-reset-seconds", type=float, default=30, help="Seconds an open circuit breaker refuses calls before letting a trial call through")
+    parser.add_argument("--cache-path", type=str, help="Path to a SQLite file caching LLM responses across runs")
+    parser.add_argument("--cache-mode", type=str, choices=[mode.name for mode in CacheMode], default="read_write", help="How to use the response cache")
+    parser.add_argument("--cache-max-entries", type=int, help="Evict least recently used cached responses beyond this many entries")
+    parser.add_argument("--cache-max-age-days", type=float, help="Evict cached responses older than this many days")
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """Add the arguments read by RunMetrics."""
+    parser.add_argument("--metrics-path", type=str, help="Path to write a JSON run summary of per-stage latency percentiles, tokens, cost, retries and conversation outcomes")
+    parser.add_argument("--prometheus-path", type=str, help="Path to write the run summary in Prometheus text format")
+    parser.add_argument("--trace-path", type=str, help="Path to a JSONL file to append one OpenTelemetry-style span per timed call to")
+    parser.add_argument("--pricing-path", type=str, help="Path to a YAML file of USD prices per million input, cached_input and output tokens by model ID, to estimate cost per stage")
+    parser.add_argument("--profile-path", type=str, help="Path to write a cProfile capture of local CPU time across all worker threads")
+
+
+@dataclass
+class ModelProviderStack:
+    """The model provider a run queries, and the pieces it was wrapped with."""
+    model_provider: ModelProvider
+    # The unwrapped OpenAI, Anthropic or self-hosted provider, which batch backends submit through directly
+    base_provider: ModelProvider
+    rate_limiter: Optional[RateLimiter] = None
+    hedged_provider: Optional[HedgedModelProvider] = None
+    response_cache: Optional[ResponseCache] = None
+
+    def log_summary(self):
+        if self.rate_limiter is not None:
+            logger.info(f"Rate limiter: {self.rate_limiter.snapshot()}")
+
+        if self.hedged_provider is not None:
+            logger.info(f"Hedging and failover: {self.hedged_provider.stats()}")
+
+        if self.response_cache is not None:
+            logger.info(f"Response cache: {self.response_cache.stats()}")
+
+        if isinstance(self.base_provider, OpenAICompatibleModelProvider):
+            logger.info(f"Self-hosted model requests: {self.base_provider.concurrency_stats()}")
+
+        logger.info(f"Token usage by model: {self.model_provider.usage_summary()}")
+
+
+def parse_fallback_model_ids(value: Optional[str]) -> Dict[str, str]:
+    """Parse --fallback-model-ids into the fallback model for each primary model, with "*" for any other model."""
+    if not value:
+        return {}
+    model_ids = {}
+    for pair in value.split(","):
+        model_id, separator, fallback_model_id = pair.strip().partition("=")
+        if separator:
+            model_ids[model_id.strip()] = fallback_model_id.strip()
+        else:
+            model_ids["*"] = model_id
+    return model_ids
+
+
+def create_model_provider_stack(args: argparse.Namespace) -> ModelProviderStack:
+    """Create the provider chosen by add_model_provider_arguments, rate limited, hedged with failover and then cached as requested."""
+    base_provider = create_model_provider(args.model_provider, args.model_provider_config)
+    model_provider = base_provider
+
+    rate_limiter = None
+    if args.requests_per_minute or args.tokens_per_minute:
+        rate_limiter = RateLimiter(args.requests_per_minute, args.tokens_per_minute)
+        model_provider = RateLimitedModelProvider(model_provider, rate_limiter)
+
+    hedged_provider = None
+    fallback_model_ids = parse_fallback_model_ids(args.fallback_model_ids)
+    if args.hedge_percentile is not None or args.fallback_model_provider or fallback_model_ids:
+        # Hedges and failovers go through the rate limiter, so they count against the same quota
+        fallback_provider = None
+        if args.fallback_model_provider and (args.fallback_model_provider, args.fallback_model_provider_config) != (args.model_provider, args.model_provider_config):
+            fallback_provider = create_model_provider(args.fallback_model_provider, args.fallback_model_provider_config)
+            if rate_limiter is not None:
+                fallback_provider = RateLimitedModelProvider(fallback_provider, rate_limiter)
+        hedged_provider = HedgedModelProvider(
+            model_provider,
+            fallback_provider,
+            fallback_model_ids,
+            hedge_percentile=args.hedge_percentile,
+            min_samples=args.hedge_min_samples,
+            failure_threshold=args.circuit_breaker_failures,
+            reset_seconds=args.circuit_breaker_reset_seconds
+        )
+        model_provider = hedged_provider
+
+    response_cache = None
+    if args.cache_path:
+        max_age_seconds = args.cache_max_age_days * 24 * 60 * 60 if args.cache_max_age_days is not None else None
+        response_cache = ResponseCache(args.cache_path, CacheMode[args.cache_mode], args.cache_max_entries, max_age_seconds)
+        model_provider = CachedModelProvider(model_provider, response_cache)
+
+    return ModelProviderStack(model_provider, base_provider, rate_limiter, hedged_provider, response_cache)
+
+
+class RunMetrics:
+    """
+    Records metrics for a command line run as set up by add_metrics_arguments.
+
+    Creating it installs the run's MetricsRecorder and starts the profiler if one was
+    requested; finish() stops both and writes the requested summaries.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.recorder = MetricsRecorder(args.trace_path, load_prices(args.pricing_path) if args.pricing_path else None)
+        metrics.set_recorder(self.recorder)
+        self.profiler = None
+        if args.profile_path:
+            self.profiler = ThreadProfiler()
+            self.profiler.start()
+
+    def finish(self):
+        if self.profiler is not None:
+            self.profiler.stop(self.args.profile_path)
+
+        self.recorder.close()
+        logger.info(f"Call latency by stage: {self.recorder.latency_overview()}")
+        if self.args.metrics_path:
+            self.recorder.write_summary(self.args.metrics_path)
+        if self.args.prometheus_path:
+            self.recorder.write_prometheus(self.args.prometheus_path)
@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from enum import Enum, auto
+import json
+import logging
+import random
+import re
+import threading
+from typing import Dict, List, Optional, Pattern
+
+from synthetic_conversation_generation.data_models.conversation import Conversation, ROLE
+
+
+logger = logging.getLogger(__name__)
+
+
+class PreCheckDecision(Enum):
+    continue_conversation = auto()
+    complete = auto()
+    escalate = auto()
+
+
+class CompletionPreCheck(ABC):
+    """
+    Local stage that runs before the LLM completion check and decides clear-cut turns itself.
+
+    Every decision is logged together with the LLM verdict when one is available. With
+    audit_rate > 0 a random sample of local decisions is also sent to the LLM, purely to
+    measure agreement; the local decision is still the one that is used.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, audit_rate: float = 0.0, seed: int = 42):
+        """
+        Args:
+            log_path: Path to a JSONL file to append one record per decision to
+            audit_rate: Fraction of local decisions to also send to the LLM for comparison
+            seed: Seed for choosing which decisions to audit
+        """
+        self.audit_rate = audit_rate
+        self.decisions: Counter = Counter()
+        self.audited = 0
+        self.agreements = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._log_file = open(log_path, "a") if log_path else None
+
+    @abstractmethod
+    def classify(self, conversation: Conversation) -> PreCheckDecision:
+        pass
+
+    def should_audit(self) -> bool:
+        with self._lock:
+            return self.audit_rate > 0 and self._random.random() < self.audit_rate
+
+    def record(self, conversation: Conversation, decision: PreCheckDecision, llm_is_complete: Optional[bool] = None):
+        """Count and log a decision, with the LLM verdict if the LLM was called for this turn."""
+        agrees = None
+        if decision != PreCheckDecision.escalate and llm_is_complete is not None:
+            agrees = (decision == PreCheckDecision.complete) == llm_is_complete
+
+        record = {
+            "conversation_id": conversation.id,
+            "turn": sum(1 for message in conversation.messages if message.role == ROLE.user) - 1,
+            "decision": decision.name,
+            "llm_is_complete": llm_is_complete,
+            "agrees": agrees
+        }
+        logger.debug(f"Completion pre-check: {record}")
+
+        with self._lock:
+            self.decisions[decision.name] += 1
+            if agrees is not None:
+                self.audited += 1
+                self.agreements += int(agrees)
+            if self._log_file is not None:
+                self._log_file.write(json.dumps(record) + "\n")
+                self._log_file.flush()
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "decisions": dict(self.decisions),
+                "audited": self.audited,
+                "agreement_rate": self.agreements / self.audited if self.audited else None
+            }
+
+    def close(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+
+DEFAULT_CLOSURE_PATTERNS = [
+    r"\b(good ?bye|bye|see (you|ya)|talk (to you )?later|take care)\b",
+    r"\bthat'?s (all|everything|it for (now|today))\b",
+    r"\b(have|enjoy) a (good|great|nice|lovely|wonderful) (day|night|evening|weekend|one)\b",
+    r"\b(that|this) (answers|solves|covers) (it|everything|my question)\b",
+    r"\bi'?m all set\b",
+]
+
+
+class RuleBasedPreCheck(CompletionPreCheck):
+    """
+    Pattern-based closure detector.
+
+    Conversations shorter than min_turns that show no closure signal clearly continue.
+    A last user message with an explicit sign-off and no further question is clearly
+    done. Everything else is escalated to the LLM.
+    """
+
+    def __init__(self, min_turns: int = 2, closure_patterns: Optional[List[str]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.min_turns = min_turns
+        self.closure_patterns: List[Pattern] = [re.compile(pattern, re.IGNORECASE) for pattern in (closure_patterns or DEFAULT_CLOSURE_PATTERNS)]
+
+    def classify(self, conversation: Conversation) -> PreCheckDecision:
+        user_messages = [message for message in conversation.messages if message.role == ROLE.user]
+        if not user_messages:
+            return PreCheckDecision.continue_conversation
+
+        last_user_message = user_messages[-1].content.replace("’", "'")
+        has_closure_signal = any(pattern.search(last_user_message) for pattern in self.closure_patterns)
+
+        if has_closure_signal and "?" not in last_user_message:
+            return PreCheckDecision.complete
+        if not has_closure_signal and len(user_messages) < self.min_turns:
+            return PreCheckDecision.continue_conversation
+        return PreCheckDecision.escalate
@@ -1,35 +1,113 @@
 import argparse
-import json
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass, field
+import itertools
 import logging
-from typing import List
-from anthropic import Anthropic
-from openai import OpenAI
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.cli_support import RunMetrics, add_metrics_arguments, add_model_provider_arguments, configure_logging, create_model_provider_stack
+from synthetic_conversation_generation.completion_precheck import CompletionPreCheck, PreCheckDecision, RuleBasedPreCheck
 from synthetic_conversation_generation.data_models.assistant import Assistant
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
-from synthetic_conversation_generation.data_models.conversation import Conversation
-from synthetic_conversation_generation.data_models.conversation_characters import ConversationCharacters
+from synthetic_conversation_generation.data_models.conversation import Conversation, Message, ROLE
+from synthetic_conversation_generation.data_models.conversation_characters import iter_personas
 from synthetic_conversation_generation.data_models.inference_endpoint import InferenceEndpoint
+from synthetic_conversation_generation.experiment import ExperimentCell, ExperimentRunner, cell_output_path, endpoint_names
+from synthetic_conversation_generation.job_queue import JobStore, JobWorker
+from synthetic_conversation_generation.llm_queries.batch import BatchBackend, create_batch_backend
 from synthetic_conversation_generation.llm_queries.conversation_completion_query import ConversationCompletionQuery
-from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider, OpenAIModelProvider, AnthropicModelProvider
+from synthetic_conversation_generation.llm_queries.history_window import HistoryWindow, HistoryWindowPolicy
+from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider
 from synthetic_conversation_generation.llm_queries.user_message_query import UserMessageQuery
+from synthetic_conversation_generation.output.conversation_writer import create_conversation_writer, drop_conversations, load_conversation_ids
 
-# Configure root logger to WARNING to silence third-party libraries
-logging.basicConfig(
-    level=logging.WARNING,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-# Set loggers within this application to INFO
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-logging.getLogger('openai').setLevel(logging.WARNING)
-logging.getLogger('anthropic').setLevel(logging.WARNING)
+@dataclass
+class SpeculationStats:
+    """
+    Counts of speculative user message queries, shared across the conversations of a run.
+
+    A discarded speculative query can only be cancelled before it starts. One that has
+    already started, as it almost always has, still runs to completion and is billed and
+    counted against rate limits, so it is counted as wasted rather than saved.
+    """
+    # Speculative queries submitted
+    calls: int = 0
+    # Discarded queries that were sent anyway
+    wasted: int = 0
+    # Discarded queries cancelled before they were sent
+    cancelled: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, discarded: bool, cancelled: bool = False):
+        with self._lock:
+            self.calls += 1
+            if discarded and cancelled:
+                self.cancelled += 1
+            elif discarded:
+                self.wasted += 1
+
+
+@dataclass
+class BranchingPolicy:
+    """Where a branched conversation tree forks, and into how many continuations."""
+    # Completed turns after which every open branch forks, e.g. [1, 3]; 0 forks the opening message
+    fork_turns: List[int]
+    # Continuations each fork produces
+    branches: int = 2
+
+    def __post_init__(self):
+        if self.branches < 2:
+            raise ValueError("branches must be at least 2")
+        if any(turn < 0 for turn in self.fork_turns):
+            raise ValueError("fork turns cannot be negative")
+        self.fork_turns = sorted(set(self.fork_turns))
+
+    def is_complete_tree(self, branch_ids: Iterable[str]) -> bool:
+        """
+        Whether these leaves make up a whole tree rather than one cut short while it was being written.
+
+        Every fork splits into exactly `branches` continuations, so the leaves are a whole
+        tree when each fork they pass through has all of its continuations present.
+        """
+        branch_ids = set(branch_ids)
+        if "0" in branch_ids:
+            # The conversation ended before the first fork
+            return len(branch_ids) == 1
+        paths = {tuple(int(number) for number in branch_id.split(".")) for branch_id in branch_ids}
+        reached = {path[:length] for path in paths for length in range(1, len(path) + 1)}
+        return all(step[:-1] + (number,) in reached for step in reached for number in range(1, self.branches + 1))
+
+
+@dataclass
+class _Branch:
+    conversation: Conversation
+    history_window: Optional[HistoryWindow]
+    # Continuation taken at each fork so far
+    path: Tuple[int, ...] = ()
+    # Sample the opening user message of a forked continuation with this branch number
+    opening_branch_number: Optional[int] = None
+
 
 class ConversationGenerator:
 
-    def __init__(self, model_provider: ModelProvider, model_id: str, assistant_endpoint: InferenceEndpoint, assistant: Assistant, user_persona: CharacterCard, max_conversation_turns: int, conversation_completion_query_model_id: str):
+    def __init__(self, model_provider: ModelProvider, model_id: str, assistant_endpoint: InferenceEndpoint, assistant: Assistant, user_persona: CharacterCard, max_conversation_turns: int, conversation_completion_query_model_id: str, speculative: bool = False, speculation_stats: Optional[SpeculationStats] = None, completion_precheck: Optional[CompletionPreCheck] = None, sample_number: Optional[int] = None, history_window_policy: Optional[HistoryWindowPolicy] = None, branching_policy: Optional[BranchingPolicy] = None):
+        """
+        Args:
+            speculative: Generate the next user message concurrently with the completion check,
+                discarding it if the conversation turns out to be complete
+            speculation_stats: Where to count speculative calls and wasted calls
+            completion_precheck: Local check that decides clear-cut turns without calling the completion model
+            sample_number: Marks repeated conversations with the same persona so they are sampled independently
+            history_window_policy: Bound the history shown to the user simulator and completion check;
+                the assistant endpoint always receives the whole conversation
+            branching_policy: Grow a tree of conversations that share their opening turns instead of a single conversation
+        """
         self.model_provider = model_provider
         self.model_id = model_id
         self.assistant_endpoint = assistant_endpoint
@@ -37,101 +115,653 @@ class ConversationGenerator:
         self.user_persona = user_persona
         self.max_conversation_turns = max_conversation_turns
         self.conversation_completion_query_model_id = conversation_completion_query_model_id
+        self.speculative = speculative
+        self.speculation_stats = speculation_stats if speculation_stats is not None else SpeculationStats()
+        self.completion_precheck = completion_precheck
+        self.sample_number = sample_number
+        self.history_window_policy = history_window_policy
+        self.branching_policy = branching_policy
 
-    def generate_conversation(self, conversation_id: str) -> Conversation:
-        conversation = Conversation(
-            id=str(conversation_id),
-            user_id=self.user_persona.name,
-            messages=[]
-        )
+    def create_history_window(self, conversation: Conversation) -> Optional[HistoryWindow]:
+        if self.history_window_policy is None:
+            return None
+        return HistoryWindow(self.history_window_policy, self.model_provider, conversation, self.user_persona, self.assistant)
+
+    def _new_conversation(self, conversation_id: str, branch_id: Optional[str] = None, messages: Optional[List[Message]] = None) -> Conversation:
+        if branch_id is None:
+            return Conversation(id=str(conversation_id), user_id=self.user_persona.name, messages=messages or [])
+        return Conversation(id=f"{conversation_id}/{branch_id}", user_id=self.user_persona.name, messages=messages or [], parent_id=str(conversation_id), branch_id=branch_id)
+
+    @staticmethod
+    def _completed_turns(conversation: Conversation) -> int:
+        return sum(1 for message in conversation.messages if message.role == ROLE.user)
+
+    def generate_conversations(self, conversation_id: str) -> List[Conversation]:
+        """The conversation with this id, or with a branching policy every leaf of its tree."""
+        if self.branching_policy is None:
+            return [self.generate_conversation(conversation_id)]
+        return self.generate_branches(conversation_id)
+
+    def generate_conversation(self, conversation_id: str, conversation: Optional[Conversation] = None, on_turn: Optional[Callable[[Conversation], None]] = None) -> Conversation:
+        """
+        Args:
+            conversation_id: Id of the conversation to generate
+            conversation: Partial conversation to resume from, as saved after its last completed turn
+            on_turn: Called with the conversation after every turn that does not end it, e.g. to checkpoint it
+        """
+        if conversation is None:
+            conversation = self._new_conversation(conversation_id)
+
+        termination_reason = None
+        try:
+            termination_reason = self._extend(conversation, self.create_history_window(conversation), self.max_conversation_turns, on_turn=on_turn)
+        except Exception:
+            termination_reason = "error"
+            raise
+        finally:
+            metrics.record_termination(conversation.id, termination_reason, self._completed_turns(conversation))
+
+        return conversation
+
+    def generate_branches(self, conversation_id: str) -> List[Conversation]:
+        """
+        Grow a tree of conversations that share their opening turns.
+
+        The turns before the first fork are generated once. At each fork turn, every
+        branch still open splits into branching_policy.branches continuations, each
+        opened with an independently sampled user message, and a branch that ends
+        before a fork is not split further. The forks share their history, so their
+        user simulator and completion check prompts share the provider's cached prefix.
+        Branches are grown one after another on the calling thread.
+
+        Returns:
+            Every leaf as a full conversation in branch order, with conversation_id as its
+            parent_id and the continuation taken at each fork as its branch_id. A
+            conversation that ends before the first fork is returned as branch "0".
+        """
+        trunk = self._new_conversation(conversation_id, "0")
+        open_branches = [_Branch(trunk, self.create_history_window(trunk))]
+        leaves: List[_Branch] = []
+
+        for fork_turn in self.branching_policy.fork_turns:
+            if fork_turn >= self.max_conversation_turns:
+                break
+            forked = []
+            for branch in open_branches:
+                if self._grow_branch(branch, fork_turn) is not None:
+                    leaves.append(branch)
+                    continue
+                for branch_number in range(1, self.branching_policy.branches + 1):
+                    path = branch.path + (branch_number,)
+                    conversation = self._new_conversation(conversation_id, ".".join(str(number) for number in path), list(branch.conversation.messages))
+                    history_window = branch.history_window.fork(conversation) if branch.history_window is not None else None
+                    forked.append(_Branch(conversation, history_window, path, branch_number))
+            open_branches = forked
+
+        for branch in open_branches:
+            self._grow_branch(branch, self.max_conversation_turns)
+            leaves.append(branch)
+
+        return [branch.conversation for branch in sorted(leaves, key=lambda branch: branch.path)]
+
+    def _grow_branch(self, branch: _Branch, turn_limit: int) -> Optional[str]:
+        """Extend a branch up to turn_limit turns, recording its termination if it ends."""
+        conversation = branch.conversation
+        termination_reason = None
+        try:
+            opening_user_message = None
+            # The first continuation is sampled exactly as an unbranched conversation would be
+            if branch.opening_branch_number is not None and branch.opening_branch_number > 1 and self._completed_turns(conversation) < turn_limit:
+                opening_user_message = UserMessageQuery(
+                    model_provider=self.model_provider,
+                    model_id=self.model_id,
+                    conversation=conversation,
+                    user_persona=self.user_persona,
+                    assistant=self.assistant,
+                    sample_number=self.sample_number,
+                    history_window=branch.history_window,
+                    branch_number=branch.opening_branch_number
+                ).query()
+            branch.opening_branch_number = None
+            termination_reason = self._extend(conversation, branch.history_window, turn_limit, opening_user_message)
+        except Exception:
+            termination_reason = "error"
+            raise
+        finally:
+            if termination_reason is not None:
+                metrics.record_termination(conversation.id, termination_reason, self._completed_turns(conversation))
+
+        return termination_reason
+
+    def _extend(self, conversation: Conversation, history_window: Optional[HistoryWindow], turn_limit: int, next_user_message: Optional[Message] = None, on_turn: Optional[Callable[[Conversation], None]] = None) -> Optional[str]:
+        """
+        Run turns until the conversation ends or has turn_limit turns.
+
+        Args:
+            next_user_message: Already generated user message to open the first turn with
+            turn_limit: Turns to stop after, at most max_conversation_turns
+
+        Returns:
+            Why the conversation ended, or None if it stopped at a turn_limit below max_conversation_turns
+        """
+        completed_turns = self._completed_turns(conversation)
         # Always start with a user message
         user_message_generator = UserMessageQuery(
             model_provider=self.model_provider,
             model_id=self.model_id,
             conversation=conversation,
             user_persona=self.user_persona,
-            assistant=self.assistant
+            assistant=self.assistant,
+            sample_number=self.sample_number,
+            history_window=history_window
+        )
+
+        speculation_executor = ThreadPoolExecutor(max_workers=1) if self.speculative else None
+        termination_reason = None
+        try:
+            with metrics.stage("conversation"), metrics.span("conversation", conversation_id=conversation.id, persona=self.user_persona.name) as conversation_span:
+                # Continue conversation until completion or max turns
+                for i in range(completed_turns, turn_limit):
+                    logger.info(f"Conversation {conversation.id} turn: {i}")
+                    with metrics.span("turn", conversation_id=conversation.id, turn=i):
+                        termination_reason, next_user_message = self._run_turn(i, conversation, user_message_generator, history_window, speculation_executor, next_user_message, turn_limit)
+                    if termination_reason is not None:
+                        break
+                    if on_turn is not None and i + 1 < self.max_conversation_turns:
+                        on_turn(conversation)
+                else:
+                    if turn_limit >= self.max_conversation_turns:
+                        termination_reason = "max_turns"
+                conversation_span["termination_reason"] = termination_reason
+        finally:
+            if speculation_executor is not None:
+                # Don't hold up a finished conversation waiting on a discarded speculative query
+                speculation_executor.shutdown(wait=False)
+
+        return termination_reason
+
+    def _run_turn(self, i: int, conversation: Conversation, user_message_generator: UserMessageQuery, history_window: Optional[HistoryWindow], speculation_executor: Optional[ThreadPoolExecutor], next_user_message: Optional[Message], turn_limit: int) -> Tuple[Optional[str], Optional[Message]]:
+        """
+        Add one user message and assistant response to the conversation and check whether it is over.
+
+        Returns:
+            Why the conversation ended, or None if it continues, and the next user message if it was generated speculatively
+        """
+        # Continue conversation with next user message, unless it was already generated speculatively
+        user_message = next_user_message if next_user_message is not None else user_message_generator.query()
+        conversation.messages.append(user_message)
+
+        # Generate assistant response
+        assistant_message = self.assistant_endpoint.get_assistant_message(conversation)
+        conversation.messages.append(assistant_message)
+
+        # Check if conversation should end
+        completion_checker = ConversationCompletionQuery(
+            model_provider=self.model_provider,
+            model_id=self.conversation_completion_query_model_id,
+            conversation=conversation,
+            user_persona=self.user_persona,
+            assistant=self.assistant,
+            history_window=history_window
         )
 
-        # Continue conversation until completion or max turns
-        for i in range(self.max_conversation_turns):
-            print(f"Conversation turn: {i}")
-
-            # Continue conversation with next user message
-            user_message = user_message_generator.query()
-            conversation.messages.append(user_message)
-
-            # Generate assistant response
-            assistant_message = self.assistant_endpoint.get_assistant_message(conversation)
-            conversation.messages.append(assistant_message)
-
-            # Check if conversation should end
-            completion_checker = ConversationCompletionQuery(
-                model_provider=self.model_provider,
-                model_id=self.conversation_completion_query_model_id,
-                conversation=conversation,
-                user_persona=self.user_persona,
-                assistant=self.assistant
-            )
+        # Settle clear-cut turns locally and only escalate ambiguous ones to the completion model
+        if self.completion_precheck is not None:
+            decision = self.completion_precheck.classify(conversation)
+            if decision != PreCheckDecision.escalate:
+                llm_is_complete = completion_checker.query() if self.completion_precheck.should_audit() else None
+                self.completion_precheck.record(conversation, decision, llm_is_complete)
+                return ("precheck" if decision == PreCheckDecision.complete else None), None
+
+        # Nothing follows the last turn before a stop, so there is nothing to speculate on
+        if speculation_executor is None or i + 1 == turn_limit:
             is_complete = completion_checker.query()
-            if is_complete:
+            self._record_escalation(conversation, is_complete)
+            return ("completion_check" if is_complete else None), None
+
+        # The conversation is not modified until both queries finish, so the speculative
+        # user message sees exactly the history it would have seen after the check
+        speculative_user_message = speculation_executor.submit(copy_context().run, user_message_generator.query)
+        is_complete = completion_checker.query()
+        self._record_escalation(conversation, is_complete)
+        if is_complete:
+            # Usually too late: a query that has started runs on, and is billed, regardless
+            self.speculation_stats.record(discarded=True, cancelled=speculative_user_message.cancel())
+            return "completion_check", None
+        self.speculation_stats.record(discarded=False)
+        return None, speculative_user_message.result()
+
+    def _record_escalation(self, conversation: Conversation, is_complete: bool):
+        if self.completion_precheck is not None:
+            self.completion_precheck.record(conversation, PreCheckDecision.escalate, is_complete)
+
+
+class ConversationRunner:
+    """
+    Runs many ConversationGenerators at once on a bounded thread pool.
+
+    Each conversation still runs its turns in order on a single worker; only
+    independent conversations overlap. Results are yielded in job order regardless
+    of completion order, and a conversation that raises is logged and skipped
+    rather than aborting the run. A job whose generator has a branching policy yields
+    every leaf of its tree, and fails or succeeds as a whole.
+    """
+
+    def __init__(self, concurrency: int = 1):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.failed_conversation_ids: List[str] = []
+
+    def run(self, jobs: Iterable[Tuple[str, ConversationGenerator]]) -> Iterator[Conversation]:
+        """
+        Generate a conversation for each (conversation_id, generator) job.
+
+        Args:
+            jobs: Iterable of (conversation_id, ConversationGenerator) pairs, in output order
+
+        Yields:
+            Successfully generated conversations, in the same order as the jobs
+        """
+        jobs = iter(jobs)
+        # Sequence number -> conversations (empty if the job failed), waiting for earlier jobs to finish
+        finished: Dict[int, List[Conversation]] = {}
+        active: Dict[Future, Tuple[int, str]] = {}
+        next_to_submit = 0
+        next_to_yield = 0
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                while not exhausted and len(active) < self.concurrency:
+                    job = next(jobs, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    conversation_id, conversation_generator = job
+                    future = executor.submit(conversation_generator.generate_conversations, conversation_id)
+                    active[future] = (next_to_submit, str(conversation_id))
+                    next_to_submit += 1
+
+                if not active:
+                    break
+
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sequence, conversation_id = active.pop(future)
+                    try:
+                        finished[sequence] = future.result()
+                    except Exception:
+                        logger.exception(f"Conversation {conversation_id} failed")
+                        self.failed_conversation_ids.append(conversation_id)
+                        finished[sequence] = []
+
+                while next_to_yield in finished:
+                    yield from finished.pop(next_to_yield)
+                    next_to_yield += 1
+
+
+@dataclass
+class _BatchConversationState:
+    conversation_id: str
+    conversation_generator: ConversationGenerator
+    conversation: Conversation
+    history_window: Optional[HistoryWindow] = None
+    turns: int = 0
+    failed: bool = False
+
+
+class BatchConversationRunner:
+    """
+    Advances many conversations in turn-synchronous waves through a batch API.
+
+    Every pending user message of a wave is submitted as one batch job, the assistant
+    endpoint is then called for each conversation, and every completion check that the
+    local pre-check cannot settle is submitted as a second batch job. Jobs are processed
+    in chunks of batch_size conversations, and results are yielded in job order.
+    """
+
+    def __init__(self, batch_backend: BatchBackend, batch_size: int = 1000, assistant_concurrency: int = 8):
+        self.batch_backend = batch_backend
+        self.batch_size = batch_size
+        self.assistant_concurrency = assistant_concurrency
+        self.failed_conversation_ids: List[str] = []
+
+    def run(self, jobs: Iterable[Tuple[str, ConversationGenerator]]) -> Iterator[Conversation]:
+        """
+        Generate a conversation for each (conversation_id, generator) job.
+
+        Args:
+            jobs: Iterable of (conversation_id, ConversationGenerator) pairs, in output order
+
+        Yields:
+            Successfully generated conversations, in the same order as the jobs
+        """
+        jobs = iter(jobs)
+        while True:
+            chunk = list(itertools.islice(jobs, self.batch_size))
+            if not chunk:
                 break
+            yield from self._run_chunk(chunk)
 
-        return conversation    
+    def _fail(self, state: _BatchConversationState, reason: str):
+        logger.error(f"Conversation {state.conversation_id} failed: {reason}")
+        state.failed = True
+        self.failed_conversation_ids.append(state.conversation_id)
+        metrics.record_termination(state.conversation_id, "error", state.turns)
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--assistant-path", type=str, required=True, help="Path to YAML file containing assistant definition")
-    parser.add_argument("--conversation-characters-path", type=str, required=True, help="Path to YAML file containing user personas")
-    parser.add_argument("--inference-endpoint-path", type=str, required=True, help="Path to YAML file specifying how to call your AI assistant via HTTP")
-    parser.add_argument("--output-path", type=str, required=True, help="Path to save the generated conversations (JSONL format)")
-    parser.add_argument("--model-provider", type=str, choices=["openai", "anthropic"], default="openai", help="LLM provider to use for generating user messages")
+    def _update_history_windows(self, states: List[_BatchConversationState]):
+        """Fold the turns that have left each conversation's history window into its summary, as one batch."""
+        pending = [(state, state.history_window.summary_query()) for state in states if state.history_window is not None]
+        pending = [(state, query) for state, query in pending if query is not None]
+        if not pending:
+            return
+        summaries = self.batch_backend.run_queries([query for _, query in pending])
+        for (state, query), summary in zip(pending, summaries):
+            if summary is None:
+                self._fail(state, "unable to summarize conversation history")
+            else:
+                state.history_window.apply_summary(query, summary)
+
+    def _run_chunk(self, chunk: List[Tuple[str, ConversationGenerator]]) -> Iterator[Conversation]:
+        states = [
+            _BatchConversationState(str(conversation_id), conversation_generator, Conversation(id=str(conversation_id), user_id=conversation_generator.user_persona.name, messages=[]))
+            for conversation_id, conversation_generator in chunk
+        ]
+        for state in states:
+            state.history_window = state.conversation_generator.create_history_window(state.conversation)
+
+        active = [state for state in states if state.conversation_generator.max_conversation_turns > 0]
+        while active:
+            logger.info(f"Advancing {len(active)} conversations by one turn")
+            self._update_history_windows(active)
+            active = [state for state in active if not state.failed]
+
+            # Next user message for every active conversation, as one batch
+            user_messages = self.batch_backend.run_queries([
+                UserMessageQuery(
+                    model_provider=state.conversation_generator.model_provider,
+                    model_id=state.conversation_generator.model_id,
+                    conversation=state.conversation,
+                    user_persona=state.conversation_generator.user_persona,
+                    assistant=state.conversation_generator.assistant,
+                    sample_number=state.conversation_generator.sample_number,
+                    history_window=state.history_window
+                )
+                for state in active
+            ])
+            for state, user_message in zip(active, user_messages):
+                if user_message is None:
+                    self._fail(state, "unable to generate user message")
+                else:
+                    state.conversation.messages.append(user_message)
+            active = [state for state in active if not state.failed]
+
+            # Assistant responses come from the live endpoint, called concurrently
+            with ThreadPoolExecutor(max_workers=self.assistant_concurrency) as executor:
+                futures = [executor.submit(state.conversation_generator.assistant_endpoint.get_assistant_message, state.conversation) for state in active]
+            for state, future in zip(active, futures):
+                try:
+                    state.conversation.messages.append(future.result())
+                    state.turns += 1
+                except Exception as e:
+                    self._fail(state, f"assistant endpoint error: {e}")
+            active = [state for state in active if not state.failed]
+
+            # Settle what the local pre-check can and batch the remaining completion checks
+            next_active = []
+            escalated = []
+            for state in active:
+                if state.turns >= state.conversation_generator.max_conversation_turns:
+                    metrics.record_termination(state.conversation_id, "max_turns", state.turns)
+                    continue
+                completion_precheck = state.conversation_generator.completion_precheck
+                decision = completion_precheck.classify(state.conversation) if completion_precheck is not None else PreCheckDecision.escalate
+                if decision == PreCheckDecision.escalate:
+                    escalated.append(state)
+                    continue
+                completion_precheck.record(state.conversation, decision)
+                if decision == PreCheckDecision.continue_conversation:
+                    next_active.append(state)
+                else:
+                    metrics.record_termination(state.conversation_id, "precheck", state.turns)
+
+            self._update_history_windows(escalated)
+            escalated = [state for state in escalated if not state.failed]
+            completion_checks = self.batch_backend.run_queries([
+                ConversationCompletionQuery(
+                    model_provider=state.conversation_generator.model_provider,
+                    model_id=state.conversation_generator.conversation_completion_query_model_id,
+                    conversation=state.conversation,
+                    user_persona=state.conversation_generator.user_persona,
+                    assistant=state.conversation_generator.assistant,
+                    history_window=state.history_window
+                )
+                for state in escalated
+            ]) if escalated else []
+            for state, is_complete in zip(escalated, completion_checks):
+                if is_complete is None:
+                    self._fail(state, "unable to check conversation completion")
+                    continue
+                state.conversation_generator._record_escalation(state.conversation, is_complete)
+                if is_complete:
+                    metrics.record_termination(state.conversation_id, "completion_check", state.turns)
+                else:
+                    next_active.append(state)
+
+            active = next_active
+
+        for state in states:
+            if not state.failed:
+                yield state.conversation
+
+
+def add_conversation_arguments(parser: argparse.ArgumentParser):
+    """Add the arguments that shape each conversation, shared with the pipeline command."""
     parser.add_argument("--model-id", type=str, default="gpt-4o", help="Model ID for generating user messages")
     parser.add_argument("--conversation-completion-query-model-id", type=str, default="o3", help="Model ID for determining when conversations should end")
     parser.add_argument("--max-conversation-turns", type=int, default=3, help="Maximum number of turns a conversation can have")
-    args = parser.parse_args()
+    parser.add_argument("--concurrency", type=int, default=1, help="Maximum number of conversations to generate at once")
+    parser.add_argument("--speculative", action="store_true", help="Generate the next user message while the completion check runs, discarding it if the conversation is complete; a discarded message has usually already been sent and is still billed")
+    parser.add_argument("--completion-precheck", action="store_true", help="Decide clear-cut turns with local closure rules and only send ambiguous ones to the completion model")
+    parser.add_argument("--precheck-min-turns", type=int, default=2, help="Turns before which a conversation without closure signals always continues")
+    parser.add_argument("--precheck-log-path", type=str, help="Path to a JSONL file logging every pre-check decision alongside the completion model's verdict")
+    parser.add_argument("--precheck-audit-rate", type=float, default=0.0, help="Fraction of local pre-check decisions to also send to the completion model to measure agreement")
+    parser.add_argument("--history-turns", type=int, help="Show the user simulator and completion check only this many recent turns verbatim and a rolling summary of older ones; the assistant endpoint always gets the full history")
+    parser.add_argument("--history-token-budget", type=int, help="Approximate tokens the conversation history may take in each user simulator and completion check prompt; older turns are summarized to fit")
+    parser.add_argument("--summary-model-id", type=str, help="Model ID for summarizing turns that leave the history window (default: --model-id)")
+    parser.add_argument("--summary-max-tokens", type=int, default=400, help="Approximate length the history summary is kept within")
+    parser.add_argument("--branch-at-turns", type=str, help="Comma-separated completed turns after which each conversation forks into --branches continuations that share the turns before, e.g. 1,3")
+    parser.add_argument("--branches", type=int, default=2, help="Continuations each fork produces with --branch-at-turns")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--assistant-path", type=str, required=True, help="Path to YAML file containing assistant definition")
+    parser.add_argument("--conversation-characters-path", type=str, required=True, help="Path to YAML or JSONL file containing user personas, streamed as conversations start")
+    parser.add_argument("--inference-endpoint-path", type=str, nargs="+", required=True, help="Paths to YAML files specifying how to call your AI assistant via HTTP; give several to compare assistant configurations in one run")
+    parser.add_argument("--repetitions", type=int, default=1, help="Number of conversations to generate per persona and endpoint")
+    parser.add_argument("--output-mode", type=str, choices=["per_cell", "tagged"], default="per_cell", help="With several endpoints or repetitions, write one file per endpoint and repetition, or one stream tagged with both")
+    parser.add_argument("--output-path", type=str, help="Path to save the generated conversations (JSONL format); with --job-store, where to export them once every job is finished")
+    parser.add_argument("--output-format", type=str, choices=["jsonl", "parquet", "arrow"], default="jsonl", help="JSONL, or a columnar Parquet or Arrow IPC dataset with one row per message (requires pyarrow)")
+    add_conversation_arguments(parser)
+    parser.add_argument("--resume", action="store_true", help="Append to an existing output file, skipping conversations it already contains")
+    parser.add_argument("--job-store", type=str, help="Path to a SQLite job store shared by workers; enqueue every conversation there, then lease and generate them, checkpointing each turn")
+    parser.add_argument("--worker-id", type=str, help="Unique name of this worker in the job store (default: hostname, process id and a random suffix)")
+    parser.add_argument("--lease-seconds", type=float, default=300, help="Seconds a job stays leased without a heartbeat or checkpoint before another worker may take it over")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per job, including ones lost to crashed workers, before the job store marks it failed")
+    parser.add_argument("--batch", action="store_true", help="Advance all conversations in turn-synchronous waves through the provider's batch API")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Maximum number of conversations advanced together in batch mode")
+    parser.add_argument("--batch-poll-interval", type=float, default=60, help="Seconds between batch status checks in batch mode")
+    add_model_provider_arguments(parser, "generating user messages")
+    add_metrics_arguments(parser)
+
+
+def check_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if not args.output_path and not args.job_store:
+        parser.error("--output-path is required unless --job-store is given")
+    if args.job_store and (args.batch or args.resume):
+        parser.error("--job-store resumes on its own and cannot be combined with --batch or --resume")
+    if args.resume and args.output_format != "jsonl":
+        parser.error("--resume only works with JSONL output; use --job-store for resumable columnar runs")
+    if args.branch_at_turns and (args.job_store or args.batch):
+        parser.error("--branch-at-turns cannot be combined with --job-store or --batch")
+    try:
+        create_branching_policy(args)
+    except ValueError as e:
+        parser.error(f"--branch-at-turns / --branches: {e}")
+
+
+def create_history_window_policy(args: argparse.Namespace) -> Optional[HistoryWindowPolicy]:
+    if args.history_turns is None and args.history_token_budget is None:
+        return None
+    return HistoryWindowPolicy(args.summary_model_id or args.model_id, args.history_turns, args.history_token_budget, args.summary_max_tokens)
 
-    if args.model_provider == "openai":
-        openai_client = OpenAI()
-        model_provider = OpenAIModelProvider(openai_client)
-    else:
-        anthropic_client = Anthropic()
-        model_provider = AnthropicModelProvider(anthropic_client)
+
+def create_branching_policy(args: argparse.Namespace) -> Optional[BranchingPolicy]:
+    if not args.branch_at_turns:
+        return None
+    return BranchingPolicy([int(turn) for turn in args.branch_at_turns.split(",")], args.branches)
+
+
+def resume_branch_trees(written_conversation_ids: Dict[str, Set[str]], branching_policy: BranchingPolicy) -> Set[str]:
+    """
+    Find the conversation trees already written in full, and remove partly written ones so they can be generated again.
+
+    Args:
+        written_conversation_ids: Output path -> ids of the leaves written to it, as <tree id>/<branch id>
+
+    Returns:
+        Ids of the trees that are complete
+    """
+    tree_branch_ids: Dict[str, Set[str]] = {}
+    for conversation_ids in written_conversation_ids.values():
+        for conversation_id in conversation_ids:
+            tree_id, branch_id = conversation_id.rsplit("/", 1)
+            tree_branch_ids.setdefault(tree_id, set()).add(branch_id)
+
+    partial_tree_ids = {tree_id for tree_id, branch_ids in tree_branch_ids.items() if not branching_policy.is_complete_tree(branch_ids)}
+    if partial_tree_ids:
+        logger.warning(f"Regenerating {len(partial_tree_ids)} partly written conversation trees: {', '.join(sorted(partial_tree_ids))}")
+        for output_path, conversation_ids in written_conversation_ids.items():
+            partial_leaf_ids = {conversation_id for conversation_id in conversation_ids if conversation_id.rsplit("/", 1)[0] in partial_tree_ids}
+            if partial_leaf_ids:
+                drop_conversations(output_path, partial_leaf_ids)
+    return set(tree_branch_ids) - partial_tree_ids
+
+
+def create_completion_precheck(args: argparse.Namespace) -> Optional[RuleBasedPreCheck]:
+    if not args.completion_precheck:
+        return None
+    return RuleBasedPreCheck(min_turns=args.precheck_min_turns, log_path=args.precheck_log_path, audit_rate=args.precheck_audit_rate)
+
+
+def log_conversation_summary(args: argparse.Namespace, speculation_stats: SpeculationStats, completion_precheck: Optional[CompletionPreCheck]):
+    if args.speculative:
+        logger.info(f"Speculative user messages: {speculation_stats.calls} generated, {speculation_stats.wasted} discarded after being sent and billed, {speculation_stats.cancelled} cancelled before being sent")
+
+    if completion_precheck is not None:
+        completion_precheck.close()
+        logger.info(f"Completion pre-check: {completion_precheck.summary()}")
+
+
+def run(args: argparse.Namespace):
+    run_metrics = RunMetrics(args)
+    provider_stack = create_model_provider_stack(args)
+    model_provider = provider_stack.model_provider
+    batch_backend = create_batch_backend(provider_stack.base_provider, args.batch_poll_interval) if args.batch else None
 
     # Load assistant from separate YAML file
     assistant = Assistant.from_yaml(args.assistant_path)
 
-    # Load user personas from YAML file
-    conversation_characters = ConversationCharacters.from_yaml(args.conversation_characters_path)
-    user_personas = conversation_characters.users
+    inference_endpoint_paths = dict(zip(endpoint_names(args.inference_endpoint_path), args.inference_endpoint_path))
+    inference_endpoints = {endpoint_name: InferenceEndpoint.from_yaml(path) for endpoint_name, path in inference_endpoint_paths.items()}
+
+    # Every endpoint and repetition is one cell of the experiment; a single cell is an ordinary run
+    cells = [ExperimentCell(endpoint_name, repetition) for endpoint_name in inference_endpoints for repetition in range(args.repetitions)]
+    is_experiment = len(cells) > 1
+    per_cell_output = is_experiment and args.output_mode == "per_cell"
+    output_paths = {cell: cell_output_path(args.output_path, cell) if per_cell_output else args.output_path for cell in cells} if args.output_path else {}
 
-    inference_endpoint = InferenceEndpoint.from_yaml(args.inference_endpoint_path)
+    branching_policy = create_branching_policy(args)
+    completed_conversation_ids = set()
+    if args.resume:
+        written_conversation_ids = {output_path: load_conversation_ids(output_path) for output_path in set(output_paths.values())}
+        for conversation_ids in written_conversation_ids.values():
+            completed_conversation_ids |= conversation_ids
+        if branching_policy is not None:
+            completed_conversation_ids = resume_branch_trees(written_conversation_ids, branching_policy)
+        logger.info(f"Resuming: skipping {len(completed_conversation_ids)} conversations already written")
 
     ## Generate synthetic data for each user persona
-    conversations = []
-    for conversation_id, user_persona in enumerate(user_personas):        
-        logger.info(f"Generating conversation {conversation_id} for user {user_persona.name}")
-
-        conversation_generator = ConversationGenerator(model_provider, args.model_id, inference_endpoint, assistant, user_persona, args.max_conversation_turns, args.conversation_completion_query_model_id)
-        conversation = conversation_generator.generate_conversation(conversation_id)
-        conversations.append(conversation)
-
-    ## Save conversations to file
-    with open(args.output_path, "w") as f:
-        for conversation in conversations:
-            # Convert each conversation to the desired format
-            formatted_messages = []
-            
-            # Add user and assistant messages
-            for message in conversation.messages:
-                formatted_message = {
-                    "role": message.role.name,
-                    "content": message.content
-                }
-                formatted_messages.append(formatted_message)
-            
-            # Create the final jsonl object and write to file
-            jsonl_object = {"messages": formatted_messages}
-            f.write(json.dumps(jsonl_object) + "\n")
+    speculation_stats = SpeculationStats()
+    completion_precheck = create_completion_precheck(args)
+    history_window_policy = create_history_window_policy(args)
 
+    def create_generator(cell, user_persona):
+        # Repetitions are marked in the prompt so they are sampled independently instead of served from the cache
+        sample_number = cell.repetition + 1 if cell.repetition > 0 else None
+        return ConversationGenerator(model_provider, args.model_id, inference_endpoints[cell.endpoint_name], assistant, user_persona, args.max_conversation_turns, args.conversation_completion_query_model_id, args.speculative, speculation_stats, completion_precheck, sample_number, history_window_policy, branching_policy)
 
+    def conversation_jobs(endpoint_name):
+        for repetition in range(args.repetitions):
+            cell = ExperimentCell(endpoint_name, repetition)
+            # Personas are streamed from the file afresh for every endpoint and repetition rather than held in memory
+            for persona_index, user_persona in enumerate(iter_personas(args.conversation_characters_path)):
+                conversation_id = cell.conversation_id(persona_index) if is_experiment else str(persona_index)
+                if conversation_id in completed_conversation_ids:
+                    continue
+                logger.info(f"Generating conversation {conversation_id} for user {user_persona.name}")
+                yield cell, conversation_id, create_generator(cell, user_persona)
+
+    def create_runner(inference_endpoint):
+        # Each endpoint gets its own concurrency limit so a slow endpoint cannot starve the others
+        concurrency = inference_endpoint.max_concurrency or args.concurrency
+        if batch_backend is not None:
+            return BatchConversationRunner(batch_backend, batch_size=args.batch_size, assistant_concurrency=concurrency)
+        return ConversationRunner(concurrency=concurrency)
+
+    if args.job_store:
+        ## Enqueue every conversation, then work on the queue alongside any other workers sharing it
+        job_store = JobStore(args.job_store, args.lease_seconds, args.max_attempts)
+        added = job_store.enqueue(
+            (cell.conversation_id(persona_index) if is_experiment else str(persona_index), cell, persona_index, user_persona)
+            for cell in cells
+            for persona_index, user_persona in enumerate(iter_personas(args.conversation_characters_path))
+        )
+        logger.info(f"Added {added} new jobs to {args.job_store}: {job_store.status()}")
+
+        job_worker = JobWorker(job_store, lambda job: create_generator(job.cell, job.persona), args.worker_id, args.concurrency)
+        job_worker.run()
+        logger.info(f"Worker {job_worker.worker_id} completed {job_worker.completed} conversations; job store: {job_store.status()}")
+        if job_worker.failed_job_ids:
+            logger.warning(f"{len(job_worker.failed_job_ids)} job attempts failed: {', '.join(job_worker.failed_job_ids)}")
+
+        if args.output_path:
+            exported = job_store.export(args.output_path, per_cell=per_cell_output, output_format=args.output_format)
+            logger.info(f"Exported {exported} conversations")
+    else:
+        ## Save each conversation to file as soon as it is generated
+        experiment_runner = ExperimentRunner({endpoint_name: create_runner(inference_endpoint) for endpoint_name, inference_endpoint in inference_endpoints.items()})
+        with ExitStack() as stack:
+            writers = {output_path: stack.enter_context(create_conversation_writer(output_path, args.output_format, append=args.resume)) for output_path in set(output_paths.values())}
+            for cell, conversation in experiment_runner.run({endpoint_name: conversation_jobs(endpoint_name) for endpoint_name in inference_endpoints}):
+                writers[output_paths[cell]].write(conversation, cell.metadata if is_experiment else None)
+
+        if experiment_runner.failed_conversation_ids:
+            logger.warning(f"{len(experiment_runner.failed_conversation_ids)} conversations failed: {', '.join(experiment_runner.failed_conversation_ids)}")
+
+    for inference_endpoint in inference_endpoints.values():
+        inference_endpoint.close()
+
+    log_conversation_summary(args, speculation_stats, completion_precheck)
+    provider_stack.log_summary()
+    run_metrics.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    check_arguments(parser, args)
+    configure_logging()
+    run(args)
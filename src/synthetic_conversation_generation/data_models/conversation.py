@@ -1,30 +1,72 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from enum import Enum, auto
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class ROLE(Enum):
     user = auto()
     assistant = auto()
 
+@dataclass
+class MessageTiming:
+    """How long the assistant endpoint took to produce a message."""
+    total_seconds: float
+    # Only measured for streamed responses, where every content delta counts as a token
+    time_to_first_token_seconds: Optional[float] = None
+    mean_inter_token_seconds: Optional[float] = None
+    max_inter_token_seconds: Optional[float] = None
+    tokens: Optional[int] = None
+
+
 @dataclass
 class Message:
     role: ROLE
     content: str
     timestamp: datetime
     message_id: str
+    timing: Optional[MessageTiming] = None
 
     @property
     def prompt_format(self):
         return {"message_id": self.message_id, "role": self.role.name.lower(), "content": self.content}
 
+    def to_dict(self) -> Dict:
+        data = {"message_id": self.message_id, "role": self.role.name, "content": self.content, "timestamp": self.timestamp.isoformat()}
+        if self.timing is not None:
+            data["timing"] = asdict(self.timing)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        """
+        Create a Message instance from a dictionary produced by to_dict.
+
+        Args:
+            data: Dictionary containing message data
+
+        Returns:
+            Message instance
+        """
+        return cls(
+            role=ROLE[data['role']],
+            content=data['content'],
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            message_id=data['message_id'],
+            timing=MessageTiming(**data['timing']) if data.get('timing') else None
+        )
+
 
 @dataclass
 class Conversation:
     id: str
     user_id: str
     messages: List[Message]
+    # For a leaf of a branched conversation tree: the id of the tree, and the path of
+    # continuations taken at each fork, e.g. "2.1" for the second branch at the first
+    # fork and then the first branch at the second
+    parent_id: Optional[str] = None
+    branch_id: Optional[str] = None
 
     def __hash__(self):
         return hash((self.id, self.user_id))
@@ -52,3 +94,29 @@ class Conversation:
     def prompt_format(self):
         return [m.prompt_format for m in self.messages]
 
+    def to_dict(self) -> Dict:
+        data = {"id": self.id, "user_id": self.user_id, "messages": [message.to_dict() for message in self.messages]}
+        if self.branch_id is not None:
+            data["parent_id"] = self.parent_id
+            data["branch_id"] = self.branch_id
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict):
+        """
+        Create a Conversation instance from a dictionary produced by to_dict.
+
+        Args:
+            data: Dictionary containing conversation data
+
+        Returns:
+            Conversation instance
+        """
+        return cls(
+            id=data['id'],
+            user_id=data['user_id'],
+            messages=[Message.from_dict(message) for message in data['messages']],
+            parent_id=data.get('parent_id'),
+            branch_id=data.get('branch_id')
+        )
+
@@ -1,11 +1,17 @@
 from dataclasses import dataclass, asdict
-from typing import List
+import json
+from typing import Any, Iterator, List
 
 import yaml
 
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
 
 
+# libyaml's C loader and dumper are many times faster than the pure-Python ones
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
 @dataclass
 class ConversationCharacters:
     users: List[CharacterCard]
@@ -22,11 +28,11 @@ class ConversationCharacters:
             ConversationCharacters object containing the parsed user personas
         """
         with open(schema_path, 'r') as f:
-            schema_data = yaml.safe_load(f)
+            schema_data = yaml.load(f, Loader=YAML_LOADER)
         
         # Parse users
         users = []
-        for user_data in schema_data.get('users', []):
+        for user_data in schema_data.get('users') or []:
             users.append(CharacterCard.from_dict(user_data))
         
         return cls(users=users)
@@ -44,11 +50,78 @@ class ConversationCharacters:
         # Convert the dataclass to a dictionary
         data = asdict(self)
         
-        yaml_content = yaml.dump(data, sort_keys=False)
+        yaml_content = yaml.dump(data, Dumper=YAML_DUMPER, sort_keys=False)
         
         # Write to the output file
         with open(output_path, 'w') as f:
             f.write(yaml_content)
             
         return yaml_content
-    
+
+
+def _build_from_events(first: yaml.Event, events: Iterator[yaml.Event]) -> Any:
+    """Build the value that starts with the given parser event. Scalars stay strings, as every persona field is text."""
+    if isinstance(first, yaml.ScalarEvent):
+        return first.value
+    if isinstance(first, yaml.MappingStartEvent):
+        mapping = {}
+        for event in events:
+            if isinstance(event, yaml.MappingEndEvent):
+                return mapping
+            mapping[_build_from_events(event, events)] = _build_from_events(next(events), events)
+    if isinstance(first, yaml.SequenceStartEvent):
+        sequence = []
+        for event in events:
+            if isinstance(event, yaml.SequenceEndEvent):
+                return sequence
+            sequence.append(_build_from_events(event, events))
+    if isinstance(first, yaml.AliasEvent):
+        raise ValueError("YAML aliases are not supported when streaming personas")
+    raise ValueError(f"Unexpected YAML event {first}")
+
+
+def _iter_yaml_personas(path: str) -> Iterator[CharacterCard]:
+    with open(path, 'r') as f:
+        events = yaml.parse(f, Loader=YAML_LOADER)
+        for event in events:
+            if isinstance(event, yaml.MappingStartEvent):
+                break
+        else:
+            return
+
+        # Skip top-level keys until `users`, then build one persona at a time from its events
+        for event in events:
+            if isinstance(event, yaml.MappingEndEvent):
+                return
+            key = _build_from_events(event, events)
+            value_start = next(events)
+            if key != 'users':
+                _build_from_events(value_start, events)
+                continue
+            if not isinstance(value_start, yaml.SequenceStartEvent):
+                # `users:` with no entries
+                return
+            for item_start in events:
+                if isinstance(item_start, yaml.SequenceEndEvent):
+                    return
+                yield CharacterCard.from_dict(_build_from_events(item_start, events))
+
+
+def iter_personas(path: str) -> Iterator[CharacterCard]:
+    """
+    Stream personas from a JSONL file (one persona object per line) or a YAML file with a `users` list.
+
+    Personas are parsed one at a time, so the first is available immediately and memory
+    stays flat however large the pool. YAML is read with libyaml's C parser when PyYAML
+    was built with it.
+
+    Args:
+        path: Path to a .jsonl file, or any other extension for YAML
+    """
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield CharacterCard.from_dict(json.loads(line))
+    else:
+        yield from _iter_yaml_personas(path)
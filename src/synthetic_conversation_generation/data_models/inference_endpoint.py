@@ -1,12 +1,37 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Union
-import requests
+from typing import Dict, Any, Optional, List, Tuple, Union
+import json
 import yaml
 import os
 import re
+import time
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.data_models.conversation import Conversation, Message, MessageTiming, ROLE
+from synthetic_conversation_generation.http_client import HTTPClient, create_http_client, iter_sse_events
+
+
+# Where each supported stream format keeps the text of a content delta
+DEFAULT_DELTA_PATHS: Dict[str, List[Union[str, int]]] = {
+    "openai": ["choices", 0, "delta", "content"],
+    "anthropic": ["delta", "text"],
+}
+
+
+class StreamError(Exception):
+    """The endpoint reported an error in the middle of a streamed response."""
+    pass
+
+
+def _follow_path(data: Any, path: List[Union[str, int]]) -> Any:
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
 
-from synthetic_conversation_generation.data_models.conversation import Conversation, Message, ROLE
 
 @dataclass
 class InferenceEndpoint:
@@ -14,6 +39,40 @@ class InferenceEndpoint:
     body: Dict[str, Any]
     headers: Dict[str, str]
     response_path: List[Union[str, int]]
+    pool_size: int = 10
+    connect_timeout: float = 10
+    read_timeout: float = 300
+    http2: bool = False
+    # Conversations to run against this endpoint at once, overriding the run-wide concurrency
+    max_concurrency: Optional[int] = None
+    # Stream the response as Server-Sent Events in the "openai" or "anthropic" format
+    stream: bool = False
+    stream_format: str = "openai"
+    # Path to the text of each streamed delta (default: the stream format's standard path)
+    delta_path: Optional[List[Union[str, int]]] = None
+    _http_client: HTTPClient = field(init=False, repr=False, compare=False)
+    _body_prefix: bytes = field(init=False, repr=False, compare=False)
+    _request_headers: Dict[str, str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.stream_format not in DEFAULT_DELTA_PATHS:
+            raise ValueError(f"Unknown stream format '{self.stream_format}', expected one of {', '.join(DEFAULT_DELTA_PATHS)}")
+        if self.delta_path is None:
+            self.delta_path = DEFAULT_DELTA_PATHS[self.stream_format]
+
+        self._http_client = create_http_client(self.pool_size, self.connect_timeout, self.read_timeout, self.http2)
+
+        # Serialize the static part of the body once so each turn only has to encode the messages
+        body = {k: v for k, v in self.body.items() if k != 'messages'}
+        if self.stream:
+            body.setdefault('stream', True)
+        static_body = json.dumps(body)
+        if static_body == '{}':
+            self._body_prefix = b'{"messages": '
+        else:
+            self._body_prefix = (static_body[:-1] + ', "messages": ').encode('utf-8')
+
+        self._request_headers = {'Content-Type': 'application/json', **self.headers}
 
     @classmethod
     def from_yaml(cls, schema_path: str):
@@ -27,7 +86,15 @@ class InferenceEndpoint:
             url=schema_data['url'],
             body=schema_data['body'],
             headers=schema_data.get('headers', {}),
-            response_path=schema_data['response_path']
+            response_path=schema_data['response_path'],
+            pool_size=schema_data.get('pool_size', 10),
+            connect_timeout=schema_data.get('connect_timeout', 10),
+            read_timeout=schema_data.get('read_timeout', 300),
+            http2=schema_data.get('http2', False),
+            max_concurrency=schema_data.get('max_concurrency'),
+            stream=schema_data.get('stream', False),
+            stream_format=schema_data.get('stream_format', 'openai'),
+            delta_path=schema_data.get('delta_path')
         )
     
     @staticmethod
@@ -58,24 +125,79 @@ class InferenceEndpoint:
         """
         Generate the next assistant message in the conversation by calling the inference endpoint.
         """
-        # Prepare request payload
-        payload = self.body.copy()
-        payload['messages'] = [{'role': msg.role.name, 'content': msg.content} for msg in conversation.messages]
-        
-        # Make request to the inference endpoint
-        response = requests.post(self.url, json=payload, headers=self.headers)
-        response.raise_for_status()
-        
-        # Parse the response using the provided path
-        response_data = response.json()
-        result = response_data
-        for key in self.response_path:
-            result = result[key]
-                
+        # Fill the precompiled request template with the conversation so far
+        messages = [{'role': msg.role.name, 'content': msg.content} for msg in conversation.messages]
+        payload = self._body_prefix + json.dumps(messages).encode('utf-8') + b'}'
+
+        # Make request to the inference endpoint over the pooled connection
+        with metrics.stage("assistant"), metrics.span("assistant_endpoint", messages=len(messages), request_bytes=len(payload), stream=self.stream) as span:
+            if self.stream:
+                result, timing = self._read_stream(payload)
+                span["time_to_first_token_seconds"] = timing.time_to_first_token_seconds
+                if timing.time_to_first_token_seconds is not None:
+                    metrics.record_latency("assistant_first_token", timing.time_to_first_token_seconds)
+            else:
+                start = time.perf_counter()
+                response_data = self._http_client.post_json(self.url, payload, self._request_headers)
+
+                # Parse the response using the provided path
+                result = response_data
+                for key in self.response_path:
+                    result = result[key]
+                timing = MessageTiming(total_seconds=time.perf_counter() - start)
+
         # Create and return the assistant message
         return Message(
             role=ROLE.assistant,
             content=result,
             timestamp=datetime.now(),
-            message_id=len(conversation.messages)
-        )
\ No newline at end of file
+            message_id=len(conversation.messages),
+            timing=timing
+        )
+
+    def _read_stream(self, payload: bytes) -> Tuple[str, MessageTiming]:
+        """
+        Assemble a streamed response from its content deltas as they arrive.
+
+        Each event is parsed on its own, so the message is ready as soon as the stream ends
+        without parsing one large body.
+        """
+        start = time.perf_counter()
+        parts: List[str] = []
+        token_times: List[float] = []
+        finished = False
+        for event_type, data in iter_sse_events(self._http_client.post_stream(self.url, payload, self._request_headers)):
+            # Keep reading after the final event so the connection can go back to the pool
+            if finished:
+                continue
+            if data == "[DONE]":
+                finished = True
+                continue
+
+            event = json.loads(data)
+            if isinstance(event, dict):
+                event_type = event.get("type", event_type)
+                if "error" in event or event_type == "error":
+                    raise StreamError(f"Endpoint reported an error mid-stream: {event.get('error', event)}")
+                if event_type == "message_stop":
+                    finished = True
+                    continue
+
+            delta = _follow_path(event, self.delta_path)
+            if delta:
+                token_times.append(time.perf_counter())
+                parts.append(delta)
+
+        inter_token_seconds = [later - earlier for earlier, later in zip(token_times, token_times[1:])]
+        timing = MessageTiming(
+            total_seconds=time.perf_counter() - start,
+            time_to_first_token_seconds=token_times[0] - start if token_times else None,
+            mean_inter_token_seconds=sum(inter_token_seconds) / len(inter_token_seconds) if inter_token_seconds else None,
+            max_inter_token_seconds=max(inter_token_seconds) if inter_token_seconds else None,
+            tokens=len(token_times)
+        )
+        return "".join(parts), timing
+
+    def close(self):
+        """Close the pooled connections held by this endpoint."""
+        self._http_client.close()
@@ -0,0 +1,116 @@
+from collections import Counter
+from dataclasses import dataclass
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from synthetic_conversation_generation.data_models.conversation import Conversation
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExperimentCell:
+    """One assistant endpoint and repetition of an experiment over a persona set."""
+    endpoint_name: str
+    repetition: int
+
+    def conversation_id(self, persona_index: int) -> str:
+        return f"{self.endpoint_name}/{self.repetition}/{persona_index}"
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return {"endpoint": self.endpoint_name, "repetition": self.repetition}
+
+
+def endpoint_names(endpoint_paths: List[str]) -> List[str]:
+    """Short names for endpoint files, taken from their file names and numbered where they collide."""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in endpoint_paths]
+    totals = Counter(stems)
+    seen: Counter = Counter()
+    names = []
+    for stem in stems:
+        seen[stem] += 1
+        names.append(f"{stem}-{seen[stem]}" if totals[stem] > 1 else stem)
+    return names
+
+
+def cell_output_path(output_path: str, cell: ExperimentCell) -> str:
+    """Output file for one cell, e.g. conversations.jsonl -> conversations.openai_chat_completion.rep0.jsonl."""
+    root, extension = os.path.splitext(output_path)
+    return f"{root}.{cell.endpoint_name}.rep{cell.repetition}{extension or '.jsonl'}"
+
+
+_DONE = object()
+
+
+class ExperimentRunner:
+    """
+    Runs the cross product of assistant endpoints and repetitions over one persona set.
+
+    Each endpoint gets its own runner, and with it its own concurrency limit, so a slow
+    endpoint cannot starve the others. All endpoints run at the same time, sharing the
+    model provider and therefore its cache and rate limits. Conversations are yielded as
+    they finish, in job order within each endpoint.
+    """
+
+    def __init__(self, runners: Dict[str, Any], queue_size: int = 100):
+        """
+        Args:
+            runners: ConversationRunner or BatchConversationRunner for each endpoint name
+            queue_size: Finished conversations to buffer before runners wait for the consumer
+        """
+        self.runners = runners
+        self.queue_size = queue_size
+
+    @property
+    def failed_conversation_ids(self) -> List[str]:
+        return [conversation_id for runner in self.runners.values() for conversation_id in runner.failed_conversation_ids]
+
+    def _run_endpoint(self, endpoint_name: str, runner: Any, jobs: Iterable[Tuple[ExperimentCell, str, Any]], results: queue.Queue):
+        cells: Dict[str, ExperimentCell] = {}
+
+        def runner_jobs():
+            for cell, conversation_id, conversation_generator in jobs:
+                cells[conversation_id] = cell
+                yield conversation_id, conversation_generator
+
+        try:
+            for conversation in runner.run(runner_jobs()):
+                results.put((cells.pop(conversation.id), conversation))
+            logger.info(f"Finished all conversations for endpoint {endpoint_name}")
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(_DONE)
+
+    def run(self, jobs: Dict[str, Iterable[Tuple[ExperimentCell, str, Any]]]) -> Iterator[Tuple[ExperimentCell, Conversation]]:
+        """
+        Generate every conversation of the experiment.
+
+        Args:
+            jobs: For each endpoint name, (cell, conversation_id, ConversationGenerator) jobs in output order
+
+        Yields:
+            Each successfully generated conversation with the cell it belongs to
+        """
+        results: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self._run_endpoint, args=(endpoint_name, self.runners[endpoint_name], endpoint_jobs, results), name=f"experiment-{endpoint_name}", daemon=True)
+            for endpoint_name, endpoint_jobs in jobs.items()
+        ]
+        for thread in threads:
+            thread.start()
+
+        running = len(threads)
+        while running:
+            result = results.get()
+            if result is _DONE:
+                running -= 1
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                yield result
@@ -0,0 +1,137 @@
+from abc import ABC, abstractmethod
+import logging
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient(ABC):
+    """Pooled, keep-alive HTTP client shared by every call to an inference endpoint."""
+
+    @abstractmethod
+    def post_json(self, url: str, data: bytes, headers: Dict[str, str], read_timeout: Optional[float] = None) -> Any:
+        """POST a pre-serialized JSON body and return the decoded JSON response, overriding the client's read timeout if given."""
+        pass
+
+    @abstractmethod
+    def post_stream(self, url: str, data: bytes, headers: Dict[str, str]) -> Iterator[str]:
+        """POST a pre-serialized JSON body and yield the lines of the response as they arrive."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class RequestsHTTPClient(HTTPClient):
+
+    def __init__(self, pool_size: int, connect_timeout: float, read_timeout: float):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post_json(self, url: str, data: bytes, headers: Dict[str, str], read_timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if read_timeout is None else (self.timeout[0], read_timeout)
+        response = self.session.post(url, data=data, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post_stream(self, url: str, data: bytes, headers: Dict[str, str]) -> Iterator[str]:
+        with self.session.post(url, data=data, headers=headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            # chunk_size=None yields data as it arrives instead of waiting for fixed-size reads
+            for line in response.iter_lines(chunk_size=None):
+                yield line.decode("utf-8")
+
+    def close(self):
+        self.session.close()
+
+
+class HTTPXClient(HTTPClient):
+    """HTTP/2-capable client, used when httpx and h2 are installed."""
+
+    def __init__(self, pool_size: int, connect_timeout: float, read_timeout: float):
+        import httpx
+
+        self.connect_timeout = connect_timeout
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+
+    def post_json(self, url: str, data: bytes, headers: Dict[str, str], read_timeout: Optional[float] = None) -> Any:
+        if read_timeout is None:
+            response = self.client.post(url, content=data, headers=headers)
+        else:
+            import httpx
+            response = self.client.post(url, content=data, headers=headers, timeout=httpx.Timeout(read_timeout, connect=self.connect_timeout))
+        response.raise_for_status()
+        return response.json()
+
+    def post_stream(self, url: str, data: bytes, headers: Dict[str, str]) -> Iterator[str]:
+        with self.client.stream("POST", url, content=data, headers=headers) as response:
+            response.raise_for_status()
+            yield from response.iter_lines()
+
+    def close(self):
+        self.client.close()
+
+
+def iter_sse_events(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], str]]:
+    """
+    Parse the lines of a Server-Sent Events stream.
+
+    Yields:
+        The event type, if the event named one, and the event's data
+    """
+    event_type = None
+    data = []
+    for line in lines:
+        if not line:
+            # A blank line ends the event
+            if data:
+                yield event_type, "\n".join(data)
+            event_type = None
+            data = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event_type = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event_type, "\n".join(data)
+
+
+def create_http_client(pool_size: int = 10, connect_timeout: float = 10, read_timeout: float = 300, http2: bool = False) -> HTTPClient:
+    """
+    Create a pooled HTTP client.
+
+    Args:
+        pool_size: Maximum number of keep-alive connections to hold open
+        connect_timeout: Seconds to wait when establishing a connection
+        read_timeout: Seconds to wait for the server to send a response
+        http2: Use HTTP/2 if httpx and h2 are installed, otherwise fall back to HTTP/1.1
+
+    Returns:
+        HTTPClient instance
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+            return HTTPXClient(pool_size, connect_timeout, read_timeout)
+        except ImportError:
+            logger.warning("HTTP/2 requested but httpx[http2] is not installed, falling back to HTTP/1.1")
+
+    return RequestsHTTPClient(pool_size, connect_timeout, read_timeout)
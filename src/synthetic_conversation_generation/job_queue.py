@@ -0,0 +1,406 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from enum import Enum, auto
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from synthetic_conversation_generation.cli_support import configure_logging
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.conversation import Conversation
+from synthetic_conversation_generation.experiment import ExperimentCell, cell_output_path
+from synthetic_conversation_generation.output.conversation_writer import ConversationWriter, create_conversation_writer
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(Enum):
+    pending = auto()
+    leased = auto()
+    done = auto()
+    failed = auto()
+
+
+@dataclass
+class Job:
+    job_id: str
+    cell: ExperimentCell
+    persona_index: int
+    persona: CharacterCard
+    attempts: int
+    # Conversation as of its last completed turn, if an earlier attempt got that far
+    conversation: Optional[Conversation] = None
+
+
+class LeaseLostError(Exception):
+    """The job's lease expired and it was taken over or finished by another worker."""
+    pass
+
+
+class JobStore:
+    """
+    Durable queue of conversation jobs in a SQLite file shared by workers on one or more machines.
+
+    Workers lease jobs for lease_seconds at a time and renew the lease by heartbeating or
+    checkpointing each completed turn. A job whose lease runs out, because its worker
+    crashed or hung, is leased again by another worker, which resumes the conversation from
+    its last checkpoint. Jobs that fail max_attempts times are marked failed.
+
+    The database runs in WAL mode with a busy timeout, so every worker thread and process
+    can share one file; use a filesystem with working POSIX locks for multi-node runs.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        """
+        Args:
+            path: Path to the SQLite job store, created if it does not exist
+            lease_seconds: How long a lease lasts without a heartbeat or checkpoint
+            max_attempts: Attempts, including ones lost to crashes, before a job is marked failed
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                endpoint_name TEXT NOT NULL,
+                repetition INTEGER NOT NULL,
+                persona_index INTEGER NOT NULL,
+                persona TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                conversation TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode, with explicit transactions where several statements must be atomic
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, jobs: Iterable[Tuple[str, ExperimentCell, int, CharacterCard]]) -> int:
+        """
+        Add (job_id, cell, persona_index, persona) jobs, ignoring ids that are already queued.
+
+        Every worker can therefore enqueue the same job list on startup.
+
+        Returns:
+            Number of newly added jobs
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (job_id, endpoint_name, repetition, persona_index, persona, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (job_id, cell.endpoint_name, cell.repetition, persona_index, json.dumps(asdict(persona)), JobStatus.pending.name, now)
+                    for job_id, cell, persona_index, persona in jobs
+                )
+            )
+            added = connection.total_changes - before
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, worker_id: str, limit: int = 1) -> List[Job]:
+        """Lease up to limit pending or expired jobs, in the order they were enqueued."""
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that already used their last attempt are not retried again
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, lease_expires_at = NULL, error = ?, updated_at = ? WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (JobStatus.failed.name, "Lease expired on the final attempt", now, JobStatus.leased.name, now, self.max_attempts)
+            )
+            rows = connection.execute(
+                "SELECT job_id, endpoint_name, repetition, persona_index, persona, attempts, conversation FROM jobs WHERE status = ? OR (status = ? AND lease_expires_at < ?) ORDER BY rowid LIMIT ?",
+                (JobStatus.pending.name, JobStatus.leased.name, now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                [(JobStatus.leased.name, worker_id, now + self.lease_seconds, now, row[0]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return [
+            Job(
+                job_id=job_id,
+                cell=ExperimentCell(endpoint_name, repetition),
+                persona_index=persona_index,
+                persona=CharacterCard.from_dict(json.loads(persona)),
+                attempts=attempts + 1,
+                conversation=Conversation.from_dict(json.loads(conversation)) if conversation else None
+            )
+            for job_id, endpoint_name, repetition, persona_index, persona, attempts, conversation in rows
+        ]
+
+    def _update_leased(self, job_id: str, worker_id: str, assignments: str, params: Tuple) -> bool:
+        cursor = self._connection().execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ? AND worker_id = ? AND status = ?",
+            (*params, time.time(), job_id, worker_id, JobStatus.leased.name)
+        )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, worker_id: str):
+        """Renew a lease. Raises LeaseLostError if the worker no longer holds it."""
+        if not self._update_leased(job_id, worker_id, "lease_expires_at = ?", (time.time() + self.lease_seconds,)):
+            raise LeaseLostError(f"Lost lease on job {job_id}")
+
+    def checkpoint(self, job_id: str, worker_id: str, conversation: Conversation):
+        """Save the conversation after a completed turn and renew the lease. Raises LeaseLostError if the worker no longer holds it."""
+        if not self._update_leased(job_id, worker_id, "conversation = ?, lease_expires_at = ?", (json.dumps(conversation.to_dict()), time.time() + self.lease_seconds)):
+            raise LeaseLostError(f"Lost lease on job {job_id}")
+
+    def complete(self, job_id: str, worker_id: str, conversation: Conversation):
+        """
+        Store a finished conversation.
+
+        A worker whose lease expired may still complete the job if nobody else has; the
+        first worker to finish wins and any other worker on the job loses its lease.
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, worker_id = ?, lease_expires_at = NULL, conversation = ?, error = NULL, updated_at = ? WHERE job_id = ? AND status != ?",
+            (JobStatus.done.name, worker_id, json.dumps(conversation.to_dict()), time.time(), job_id, JobStatus.done.name)
+        )
+        if cursor.rowcount != 1:
+            raise LeaseLostError(f"Job {job_id} was already completed by another worker")
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """Release a job after an error, to be retried from its last checkpoint unless it has used every attempt."""
+        self._connection().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker_id = NULL, lease_expires_at = NULL, error = ?, updated_at = ? WHERE job_id = ? AND worker_id = ? AND status = ?",
+            (self.max_attempts, JobStatus.failed.name, JobStatus.pending.name, error, time.time(), job_id, worker_id, JobStatus.leased.name)
+        )
+
+    def retry_failed(self) -> int:
+        """Return every failed job to the queue with a fresh set of attempts."""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, attempts = 0, error = NULL, updated_at = ? WHERE status = ?",
+            (JobStatus.pending.name, time.time(), JobStatus.failed.name)
+        )
+        return cursor.rowcount
+
+    def status(self) -> Dict[str, int]:
+        """Number of jobs in each status, plus how many leases have expired without being picked up again."""
+        connection = self._connection()
+        counts = {status.name: 0 for status in JobStatus}
+        for status, count in connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        counts["expired"] = connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND lease_expires_at < ?", (JobStatus.leased.name, time.time())
+        ).fetchone()[0]
+        return counts
+
+    def is_drained(self) -> bool:
+        counts = self.status()
+        return counts[JobStatus.pending.name] == 0 and counts[JobStatus.leased.name] == 0
+
+    def failures(self) -> Dict[str, Optional[str]]:
+        return dict(self._connection().execute("SELECT job_id, error FROM jobs WHERE status = ? ORDER BY rowid", (JobStatus.failed.name,)))
+
+    def finished_conversations(self) -> Iterator[Tuple[ExperimentCell, Conversation]]:
+        """Every completed conversation with its cell, in the order the jobs were enqueued."""
+        rows = self._connection().execute(
+            "SELECT endpoint_name, repetition, conversation FROM jobs WHERE status = ? ORDER BY rowid", (JobStatus.done.name,)
+        )
+        for endpoint_name, repetition, conversation in rows:
+            yield ExperimentCell(endpoint_name, repetition), Conversation.from_dict(json.loads(conversation))
+
+    def export(self, output_path: str, per_cell: bool = False, output_format: str = "jsonl") -> int:
+        """
+        Write completed conversations to JSONL or a columnar dataset, replacing the output atomically.
+
+        Records of experiments with several endpoints or repetitions are tagged with their
+        cell, or written to one file per cell when per_cell is set.
+
+        Returns:
+            Number of conversations written
+        """
+        connection = self._connection()
+        is_experiment = connection.execute("SELECT COUNT(*) FROM (SELECT DISTINCT endpoint_name, repetition FROM jobs)").fetchone()[0] > 1
+
+        temporary_suffix = f".{uuid.uuid4().hex}.tmp"
+        writers: Dict[str, ConversationWriter] = {}
+        exported = 0
+        try:
+            for cell, conversation in self.finished_conversations():
+                path = cell_output_path(output_path, cell) if per_cell and is_experiment else output_path
+                if path not in writers:
+                    writers[path] = create_conversation_writer(path + temporary_suffix, output_format, fsync=False)
+                writers[path].write(conversation, cell.metadata if is_experiment else None)
+                exported += 1
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        for path in writers:
+            os.replace(path + temporary_suffix, path)
+        return exported
+
+
+class JobWorker:
+    """
+    Leases jobs from a JobStore and generates their conversations until the store is drained.
+
+    Every turn that does not end a conversation is checkpointed, which also renews the
+    lease, and a background thread heartbeats held jobs in between. A job whose lease was
+    lost to another worker is abandoned. When no job can be leased but other workers still
+    hold some, the worker waits in case their leases expire.
+    """
+
+    def __init__(self, job_store: JobStore, create_generator: Callable[[Job], Any], worker_id: Optional[str] = None, concurrency: int = 1, heartbeat_interval: Optional[float] = None, poll_interval: float = 5):
+        """
+        Args:
+            job_store: Store to lease jobs from
+            create_generator: Builds the ConversationGenerator for a job
+            worker_id: Unique name of this worker (default: hostname, process id and a random suffix)
+            concurrency: Number of jobs to work on at once
+            heartbeat_interval: Seconds between lease renewals (default: a third of the lease)
+            poll_interval: Seconds to wait before looking for jobs again while other workers hold leases
+        """
+        self.job_store = job_store
+        self.create_generator = create_generator
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else job_store.lease_seconds / 3
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed_job_ids: List[str] = []
+        self.abandoned_job_ids: List[str] = []
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            with self._lock:
+                held = list(self._held)
+            for job_id in held:
+                try:
+                    self.job_store.heartbeat(job_id, self.worker_id)
+                except LeaseLostError:
+                    logger.warning(f"Lost lease on job {job_id}; it will be abandoned at its next checkpoint")
+                except Exception as e:
+                    logger.warning(f"Unable to renew lease on job {job_id}: {e}")
+
+    def _run_job(self, job: Job):
+        with self._lock:
+            self._held.add(job.job_id)
+        try:
+            if job.conversation is not None:
+                logger.info(f"Resuming job {job.job_id} from its checkpoint after {len(job.conversation.messages)} messages (attempt {job.attempts})")
+            conversation_generator = self.create_generator(job)
+            conversation = conversation_generator.generate_conversation(
+                job.job_id,
+                job.conversation,
+                on_turn=lambda conversation: self.job_store.checkpoint(job.job_id, self.worker_id, conversation)
+            )
+            self.job_store.complete(job.job_id, self.worker_id, conversation)
+            with self._lock:
+                self.completed += 1
+        except LeaseLostError as e:
+            logger.warning(f"Abandoning job {job.job_id}: {e}")
+            with self._lock:
+                self.abandoned_job_ids.append(job.job_id)
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed")
+            self.job_store.fail(job.job_id, self.worker_id, str(e))
+            with self._lock:
+                self.failed_job_ids.append(job.job_id)
+        finally:
+            with self._lock:
+                self._held.discard(job.job_id)
+
+    def _work(self):
+        while True:
+            jobs = self.job_store.lease(self.worker_id)
+            if jobs:
+                self._run_job(jobs[0])
+            elif self.job_store.is_drained():
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+    def run(self):
+        """Work on jobs until none are pending or leased by any worker."""
+        logger.info(f"Worker {self.worker_id} starting with concurrency {self.concurrency}")
+        heartbeat_thread = threading.Thread(target=self._heartbeat, name=f"heartbeat-{self.worker_id}", daemon=True)
+        heartbeat_thread.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for future in [executor.submit(self._work) for _ in range(self.concurrency)]:
+                    future.result()
+        finally:
+            self._stopped.set()
+            heartbeat_thread.join()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    status_parser = subparsers.add_parser("status", help="Show how many jobs are pending, leased, done and failed")
+    status_parser.add_argument("--job-store", type=str, required=True, help="Path to the SQLite job store")
+    status_parser.add_argument("--show-failures", action="store_true", help="Also list failed jobs with their last error")
+
+    export_parser = subparsers.add_parser("export", help="Write completed conversations to JSONL")
+    export_parser.add_argument("--job-store", type=str, required=True, help="Path to the SQLite job store")
+    export_parser.add_argument("--output-path", type=str, required=True, help="Path to save the conversations")
+    export_parser.add_argument("--output-format", type=str, choices=["jsonl", "parquet", "arrow"], default="jsonl", help="JSONL, or a columnar Parquet or Arrow IPC dataset with one row per message")
+    export_parser.add_argument("--output-mode", type=str, choices=["per_cell", "tagged"], default="per_cell", help="With several endpoints or repetitions, write one file per endpoint and repetition, or one stream tagged with both")
+
+    retry_parser = subparsers.add_parser("retry-failed", help="Return failed jobs to the queue")
+    retry_parser.add_argument("--job-store", type=str, required=True, help="Path to the SQLite job store")
+
+
+def run(args: argparse.Namespace):
+    job_store = JobStore(args.job_store)
+
+    if args.command == "status":
+        print(json.dumps(job_store.status(), indent=2))
+        if args.show_failures:
+            for job_id, error in job_store.failures().items():
+                print(f"{job_id}: {error}")
+    elif args.command == "export":
+        if not job_store.is_drained():
+            logger.warning(f"Exporting while jobs are still pending or leased: {job_store.status()}")
+        exported = job_store.export(args.output_path, per_cell=args.output_mode == "per_cell", output_format=args.output_format)
+        logger.info(f"Exported {exported} conversations")
+    elif args.command == "retry-failed":
+        logger.info(f"Returned {job_store.retry_failed()} failed jobs to the queue")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and export a conversation job store. Run conversation_generator.py with --job-store to enqueue and work on jobs.")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging()
+    run(args)
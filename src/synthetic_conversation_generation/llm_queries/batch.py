@@ -0,0 +1,267 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass
+import io
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.errors import ErrorKind, classify_error
+from synthetic_conversation_generation.llm_queries.llm_query import AnthropicModelProvider, LLMQuery, ModelProvider, OpenAIModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    prompt: Union[str, Prompt]
+    response_schema: Dict
+    model_id: str
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    # Decoded JSON response, as ModelProvider.query would return it
+    response: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class BatchBackend(ABC):
+    """
+    Provider-agnostic interface to an asynchronous batch API.
+
+    A batch is submitted once, polled until the provider has processed every request,
+    and then its results are fanned back out by custom_id.
+    """
+
+    def __init__(self, poll_interval: float = 60):
+        self.poll_interval = poll_interval
+
+    @abstractmethod
+    def submit(self, requests: List[BatchRequest]) -> str:
+        """Submit requests as one batch job and return its id."""
+        pass
+
+    @abstractmethod
+    def is_complete(self, batch_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        pass
+
+    def run(self, requests: List[BatchRequest]) -> Dict[str, BatchResult]:
+        """Submit a batch, wait for it to finish and return its results by custom_id."""
+        with metrics.span("batch", requests=len(requests)) as span:
+            batch_id = self.submit(requests)
+            span["batch_id"] = batch_id
+            logger.info(f"Submitted batch {batch_id} with {len(requests)} requests")
+            while True:
+                try:
+                    if self.is_complete(batch_id):
+                        break
+                except Exception as e:
+                    # A batch can run for hours, so don't abandon it over one failed status check
+                    if classify_error(e) == ErrorKind.fatal:
+                        raise
+                    logger.warning(f"Unable to check status of batch {batch_id}: {e}")
+                time.sleep(self.poll_interval)
+            results = self.results(batch_id)
+        logger.info(f"Batch {batch_id} finished with {sum(1 for result in results.values() if result.error is None)} of {len(requests)} requests succeeded")
+        return results
+
+    def run_queries(self, queries: Sequence[LLMQuery], max_retries: int = 3) -> List[Optional[Any]]:
+        """
+        Execute LLM queries as batch jobs.
+
+        Requests that fail, or whose responses fail to parse, are resubmitted in a further
+        batch up to max_retries times.
+
+        Args:
+            queries: Queries to execute
+            max_retries: Maximum number of batches to submit
+
+        Returns:
+            The parsed response for each query, in order, or None where every attempt failed
+        """
+        parsed: List[Optional[Any]] = [None] * len(queries)
+        if not queries:
+            return parsed
+
+        with metrics.stage(queries[0].stage):
+            pending = list(range(len(queries)))
+            cpu_start = time.thread_time()
+            prompts = [query.generate_prompt() for query in queries]
+            metrics.record_prompt_cpu(time.thread_time() - cpu_start)
+
+            for attempt in range(max_retries):
+                if not pending:
+                    break
+                if attempt > 0:
+                    metrics.increment("batch_resubmitted_requests", len(pending))
+
+                requests = [
+                    BatchRequest(f"request-{index}", prompts[index], queries[index].response_schema(), queries[index].model_id)
+                    for index in pending
+                ]
+                results = self.run(requests)
+
+                failed = []
+                for index in pending:
+                    result = results.get(f"request-{index}")
+                    if result is None or result.error is not None:
+                        failed.append(index)
+                        logger.error(f"Batch request {index} failed: {result.error if result else 'missing result'}")
+                        continue
+                    try:
+                        parsed[index] = queries[index].parse_response(result.response)
+                    except Exception as e:
+                        failed.append(index)
+                        logger.error(f"Unable to parse batch response {index}: {e}")
+                pending = failed
+
+        return parsed
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API over /v1/chat/completions."""
+
+    def __init__(self, provider: OpenAIModelProvider, poll_interval: float = 60):
+        super().__init__(poll_interval)
+        self.provider = provider
+        self.client = provider.client
+        self._model_ids: Dict[str, Dict[str, str]] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        lines = [
+            json.dumps({
+                "custom_id": request.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self.provider.request_params(request.prompt, request.response_schema, request.model_id)
+            })
+            for request in requests
+        ]
+        input_file = self.client.files.create(file=("batch.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))), purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        self._model_ids[batch.id] = {request.custom_id: request.model_id for request in requests}
+        return batch.id
+
+    def is_complete(self, batch_id: str) -> bool:
+        return self.client.batches.retrieve(batch_id).status in ("completed", "failed", "expired", "cancelled")
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        batch = self.client.batches.retrieve(batch_id)
+        model_ids = self._model_ids.pop(batch_id, {})
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                custom_id = record["custom_id"]
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    results[custom_id] = BatchResult(custom_id, error=json.dumps(record.get("error") or response.get("body")))
+                    continue
+                try:
+                    import openai
+                    completion = openai.types.chat.ChatCompletion.model_validate(response["body"])
+                    results[custom_id] = BatchResult(custom_id, response=self.provider.parse_completion(completion, model_ids.get(custom_id, completion.model)))
+                except Exception as e:
+                    results[custom_id] = BatchResult(custom_id, error=str(e))
+        return results
+
+
+class AnthropicBatchBackend(BatchBackend):
+    """Anthropic Message Batches API."""
+
+    def __init__(self, provider: AnthropicModelProvider, poll_interval: float = 60):
+        super().__init__(poll_interval)
+        self.provider = provider
+        self.client = provider.client
+        self._model_ids: Dict[str, Dict[str, str]] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        batch = self.client.messages.batches.create(requests=[
+            {
+                "custom_id": request.custom_id,
+                "params": self.provider.request_params(request.prompt, request.response_schema, request.model_id)
+            }
+            for request in requests
+        ])
+        self._model_ids[batch.id] = {request.custom_id: request.model_id for request in requests}
+        return batch.id
+
+    def is_complete(self, batch_id: str) -> bool:
+        return self.client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        model_ids = self._model_ids.pop(batch_id, {})
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                error = getattr(entry.result, "error", None)
+                results[entry.custom_id] = BatchResult(entry.custom_id, error=str(error) if error else entry.result.type)
+                continue
+            try:
+                message = entry.result.message
+                results[entry.custom_id] = BatchResult(entry.custom_id, response=self.provider.parse_message(message, model_ids.get(entry.custom_id, message.model)))
+            except Exception as e:
+                results[entry.custom_id] = BatchResult(entry.custom_id, error=str(e))
+        return results
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Runs batches in-process against any ModelProvider.
+
+    Stands in for a provider's batch service in tests and offline runs: requests are
+    executed on a thread pool in the background and polled like a remote batch.
+    """
+
+    def __init__(self, provider: ModelProvider, poll_interval: float = 0.1, concurrency: int = 8, timeout: int = 60):
+        super().__init__(poll_interval)
+        self.provider = provider
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._batches: Dict[str, Dict[str, Future]] = {}
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        batch_id = f"local-batch-{uuid.uuid4().hex}"
+        self._batches[batch_id] = {
+            request.custom_id: self._executor.submit(copy_context().run, self.provider.query, request.prompt, request.response_schema, request.model_id, self.timeout)
+            for request in requests
+        }
+        return batch_id
+
+    def is_complete(self, batch_id: str) -> bool:
+        return all(future.done() for future in self._batches[batch_id].values())
+
+    def results(self, batch_id: str) -> Dict[str, BatchResult]:
+        results = {}
+        for custom_id, future in self._batches.pop(batch_id).items():
+            try:
+                results[custom_id] = BatchResult(custom_id, response=future.result())
+            except Exception as e:
+                results[custom_id] = BatchResult(custom_id, error=str(e))
+        return results
+
+
+def create_batch_backend(provider: ModelProvider, poll_interval: float = 60) -> BatchBackend:
+    """Create the batch backend matching a provider, falling back to running batches locally."""
+    if isinstance(provider, OpenAIModelProvider):
+        return OpenAIBatchBackend(provider, poll_interval)
+    if isinstance(provider, AnthropicModelProvider):
+        return AnthropicBatchBackend(provider, poll_interval)
+    return LocalBatchBackend(provider)
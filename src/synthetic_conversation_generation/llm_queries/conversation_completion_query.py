@@ -1,22 +1,32 @@
 from dataclasses import asdict
 import json
+from typing import Optional
 
 from synthetic_conversation_generation.data_models.assistant import Assistant
 from synthetic_conversation_generation.data_models.conversation import Conversation
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.llm_queries.history_window import HistoryWindow
 from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
 
 class ConversationCompletionQuery(LLMQuery):
 
+    stage = "completion_check"
+
     def __init__(self, model_provider: ModelProvider, model_id: str, conversation: Conversation,
-                 user_persona: CharacterCard, assistant: Assistant):
+                 user_persona: CharacterCard, assistant: Assistant, history_window: Optional[HistoryWindow] = None):
+        """
+        Args:
+            history_window: Show a summary of older turns and only the recent ones instead of the whole conversation
+        """
         super().__init__(model_provider, model_id)
         self.conversation = conversation
         self.user_persona = user_persona
         self.assistant = assistant
+        self.history_window = history_window
 
-    def generate_prompt(self):
-        return f"""Determine whether the conversation below between a human user and an AI assistant has concluded.
+    def generate_prompt(self) -> Prompt:
+        system = """Determine whether the conversation below between a human user and an AI assistant has concluded.
 
 ### Considerations
 - Has the primary user need or question been addressed satisfactorily?
@@ -24,17 +34,30 @@ class ConversationCompletionQuery(LLMQuery):
 - Are there closure signals like gratitude, goodbyes, or acknowledgment of completion?
 - Does the conversation feel complete based on natural human conversation patterns?
 - Would a typical user naturally respond again or has the conversation concluded?
+"""
 
-### User Definition
+        context = f"""### User Definition
 {json.dumps(asdict(self.user_persona), indent=4)}
 
 ### Assistant Definition
 {json.dumps(asdict(self.assistant), indent=4)}
+"""
 
-### Conversation
+        if self.history_window is not None:
+            history = self.history_window.render("### Conversation")
+        else:
+            history = f"""### Conversation
 {json.dumps(self.conversation.prompt_format, indent=4)}
 """
 
+        return Prompt(system=system, context=context, history=history)
+
+    def query(self, *args, **kwargs):
+        # Fold any turns that have left the window into the summary before the prompt is built from it
+        if self.history_window is not None:
+            self.history_window.update()
+        return super().query(*args, **kwargs)
+
     def response_schema(self):
         return {
             "type": "object",
@@ -0,0 +1,69 @@
+from dataclasses import asdict
+import json
+from typing import Dict, List
+
+from synthetic_conversation_generation.data_models.assistant import Assistant
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+class ConversationSummaryQuery(LLMQuery):
+
+    stage = "history_summary"
+
+    def __init__(self, model_provider: ModelProvider, model_id: str, summary: str, messages: List[Dict],
+                 user_persona: CharacterCard, assistant: Assistant, max_words: int = 300):
+        """
+        Args:
+            summary: Summary of the messages folded in so far, empty for the first fold
+            messages: Messages to fold into the summary, in prompt format
+            max_words: Length the updated summary should stay within
+        """
+        super().__init__(model_provider, model_id)
+        self.summary = summary
+        self.messages = messages
+        self.user_persona = user_persona
+        self.assistant = assistant
+        self.max_words = max_words
+
+    def generate_prompt(self) -> Prompt:
+        system = f"""Update the running summary of a conversation between a human user and an AI assistant so that it also covers the new messages below. Later messages will only see this summary, not the messages themselves.
+
+### Instructions
+- Keep what the user wants, what they have already been told or shown, and what remains unresolved
+- Keep details that later messages may refer back to, such as names, numbers, choices and commitments
+- Keep how the user's mood and engagement have changed, including any frustration
+- Write in the third person and past tense, in at most {self.max_words} words
+"""
+
+        context = f"""### User Definition
+{json.dumps(asdict(self.user_persona), indent=4)}
+
+### Assistant Definition
+{json.dumps(asdict(self.assistant), indent=4)}
+"""
+
+        history = f"""### Summary So Far
+{self.summary or "(none yet)"}
+
+### New Messages
+{json.dumps(self.messages, indent=4)}
+"""
+
+        return Prompt(system=system, context=context, history=history)
+
+    def response_schema(self):
+        return {
+            "type": "object",
+            "properties": {
+                "summary": {
+                    "type": "string",
+                    "description": "The updated summary of the conversation so far"
+                }
+            },
+            "required": ["summary"],
+            "additionalProperties": False
+        }
+
+    def parse_response(self, json_response) -> str:
+        return json_response["summary"]
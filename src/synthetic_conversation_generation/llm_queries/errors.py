@@ -0,0 +1,65 @@
+from email.utils import parsedate_to_datetime
+from enum import Enum, auto
+import time
+from typing import Optional
+
+
+class ResponseSchemaError(Exception):
+    """The provider returned a response that does not match the query's response schema."""
+    pass
+
+
+class ErrorKind(Enum):
+    # Worth retrying after a backoff, e.g. timeouts, connection errors and 5xx responses
+    transient = auto()
+    # The provider asked us to slow down (HTTP 429)
+    rate_limited = auto()
+    # Retrying cannot help, e.g. 4xx request errors and schema violations
+    fatal = auto()
+
+
+def http_status_code(error: Exception) -> Optional[int]:
+    """HTTP status code carried by a provider SDK or HTTP client error, if any."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def classify_error(error: Exception) -> ErrorKind:
+    """Classify an error raised by a provider SDK, an HTTP client or response parsing."""
+    if isinstance(error, ResponseSchemaError):
+        return ErrorKind.fatal
+
+    status_code = http_status_code(error)
+    if status_code == 429:
+        return ErrorKind.rate_limited
+    if status_code is not None and 400 <= status_code < 500 and status_code not in (408, 409):
+        return ErrorKind.fatal
+    return ErrorKind.transient
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait before retrying, from the Retry-After headers if present."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
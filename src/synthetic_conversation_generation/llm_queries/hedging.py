@@ -0,0 +1,277 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from dataclasses import dataclass
+import logging
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.errors import ErrorKind, classify_error
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """A provider's circuit breaker is open and no fallback is configured."""
+    pass
+
+
+class LatencyTracker:
+    """Latencies of recent successful calls per route, model and stage, to learn when a call is running late."""
+
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        """
+        Args:
+            window: Most recent latencies kept per key
+            min_samples: Latencies needed before a key has a percentile
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: Dict[Tuple[str, str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Tuple[str, str, str], seconds: float):
+        with self._lock:
+            if key not in self._latencies:
+                self._latencies[key] = deque(maxlen=self.window)
+            self._latencies[key].append(seconds)
+
+    def percentile(self, key: Tuple[str, str, str], q: float) -> Optional[float]:
+        """The q-th percentile latency for a key, or None until it has min_samples latencies."""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        return metrics.percentile(latencies, q)
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a route after repeated failures.
+
+    After failure_threshold consecutive transient or rate limit errors the circuit opens
+    and calls are refused for reset_seconds. It then lets a single trial call through,
+    which closes the circuit if it succeeds and reopens it if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or (self.opened_at is None and self.consecutive_failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+
+@dataclass
+class _Route:
+    name: str
+    provider: ModelProvider
+    breaker: CircuitBreaker
+    # Model IDs to use on this route in place of the ones queries ask for, with "*" standing for any other model
+    model_ids: Dict[str, str]
+
+    def model_id(self, model_id: str) -> str:
+        return self.model_ids.get(model_id, self.model_ids.get("*", model_id))
+
+
+class HedgedModelProvider(ModelProvider):
+    """
+    Bounds the tail latency of provider calls with hedged requests, and fails over to a
+    secondary provider or model when the primary keeps failing.
+
+    Each call that is still running after the hedge_percentile latency learned for its
+    route, model and stage gets one duplicate request, and whichever answers first is
+    used. A loser that has not started yet is cancelled; one already in flight cannot be
+    interrupted through the provider SDKs, so it runs to completion in the background and
+    its result only feeds the latency statistics. Nothing is hedged until min_samples
+    latencies have been seen.
+
+    When every attempt on the primary fails with a transient or rate limit error, or the
+    primary's circuit breaker is open, the query is sent to the fallback instead. Errors
+    that no retry can fix, such as invalid requests, are raised straight away.
+    """
+
+    def __init__(self, primary: ModelProvider, fallback: Optional[ModelProvider] = None, fallback_model_ids: Optional[Dict[str, str]] = None,
+                 hedge_percentile: Optional[float] = 95, min_samples: int = 20, min_hedge_delay: float = 1.0,
+                 failure_threshold: int = 5, reset_seconds: float = 30, max_workers: int = 256):
+        """
+        Args:
+            primary: Provider to send queries to
+            fallback: Provider to fail over to (default: the primary, with fallback_model_ids)
+            fallback_model_ids: Model to use on the fallback for each primary model, with "*" matching any model not listed
+            hedge_percentile: Latency percentile after which a call is hedged, or None to never hedge
+            min_samples: Successful calls per route, model and stage needed before hedging
+            min_hedge_delay: Seconds a call always gets before it is hedged, however fast its percentile
+            failure_threshold: Consecutive failures that open a route's circuit breaker
+            reset_seconds: Seconds an open circuit refuses calls before letting a trial call through
+            max_workers: Most provider calls in flight at once, including hedges
+        """
+        super().__init__()
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.latencies = LatencyTracker(min_samples=min_samples)
+        self.routes: List[_Route] = [_Route("primary", primary, CircuitBreaker(failure_threshold, reset_seconds), {})]
+        if fallback is not None or fallback_model_ids:
+            self.routes.append(_Route("fallback", fallback or primary, CircuitBreaker(failure_threshold, reset_seconds), fallback_model_ids or {}))
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._stats_lock = threading.Lock()
+        # The route that answered the last query made on each thread
+        self._answered = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedged-query")
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+        metrics.increment(name)
+
+    def _submit(self, route: _Route, key: Tuple[str, str, str], user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int) -> Future:
+        started_at = time.monotonic()
+        future = self._executor.submit(copy_context().run, route.provider.query, user_msg, response_schema, model_id, timeout)
+
+        def record_outcome(future: Future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                self.latencies.record(key, time.monotonic() - started_at)
+            if error is None or classify_error(error) == ErrorKind.fatal:
+                # A request error still shows the provider is up
+                route.breaker.record_success()
+            else:
+                route.breaker.record_failure()
+
+        future.add_done_callback(record_outcome)
+        return future
+
+    def _query_route(self, route: _Route, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int):
+        """Query one route, hedging the call if it runs past the learned percentile."""
+        key = (route.name, model_id, metrics.current_stage())
+        hedge_delay = None
+        if self.hedge_percentile is not None:
+            learned = self.latencies.percentile(key, self.hedge_percentile)
+            if learned is not None:
+                hedge_delay = max(self.min_hedge_delay, learned)
+
+        pending = {self._submit(route, key, user_msg, response_schema, model_id, timeout)}
+        hedge = None
+        if hedge_delay is not None:
+            done, pending = wait(pending, timeout=hedge_delay)
+            if not done:
+                logger.debug(f"Hedging {route.name}/{model_id} call after {hedge_delay:.1f} seconds")
+                self._count("hedges")
+                hedge = self._submit(route, key, user_msg, response_schema, model_id, timeout)
+                pending.add(hedge)
+            else:
+                pending = done
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = error or future.exception()
+                if classify_error(future.exception()) == ErrorKind.fatal:
+                    for loser in pending:
+                        loser.cancel()
+                    raise future.exception()
+        raise error
+
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
+        error: Optional[Exception] = None
+        for route in self.routes:
+            if not route.breaker.allow():
+                logger.debug(f"Skipping {route.name} route for {model_id}: circuit breaker is open")
+                continue
+            if route is not self.routes[0]:
+                # After the primary's circuit opens every query fails over, so only log the ones that just failed
+                log = logger.warning if error is not None else logger.debug
+                log(f"Failing over {model_id} query to {route.name} model {route.model_id(model_id)}")
+                self._count("failovers")
+            try:
+                response = self._query_route(route, user_msg, response_schema, route.model_id(model_id), timeout)
+                self._answered.route = route
+                return response
+            except Exception as e:
+                if classify_error(e) == ErrorKind.fatal:
+                    raise
+                error = e
+
+        if error is not None:
+            raise error
+        raise CircuitOpenError(f"Every route for {model_id} has an open circuit breaker")
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return self.routes[0].provider.response_format(response_schema)
+
+    def cache_identity(self) -> str:
+        return self.routes[0].provider.cache_identity()
+
+    def discard_response(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str):
+        for route in self.routes:
+            route.provider.discard_response(user_msg, response_schema, route.model_id(model_id))
+
+    def answered_as_requested(self) -> bool:
+        route = getattr(self._answered, "route", self.routes[0])
+        return route is self.routes[0] and route.provider.answered_as_requested()
+
+    def usage_summary(self) -> Dict[str, Dict[str, int]]:
+        usage = {}
+        for provider in {id(route.provider): route.provider for route in self.routes}.values():
+            for model_id, counts in provider.usage_summary().items():
+                totals = usage.setdefault(model_id, dict.fromkeys(counts, 0))
+                for name, count in counts.items():
+                    totals[name] += count
+        return usage
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            stats = {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers}
+        stats["circuit_breakers"] = {route.name: {"state": route.breaker.state, "times_opened": route.breaker.times_opened} for route in self.routes}
+        return stats
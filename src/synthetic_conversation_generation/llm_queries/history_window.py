@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+import json
+import re
+import threading
+from typing import Dict, List, Optional
+
+from synthetic_conversation_generation.data_models.assistant import Assistant
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.conversation import Conversation, ROLE
+from synthetic_conversation_generation.llm_queries.conversation_summary_query import ConversationSummaryQuery
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|[0-9]+|\s*\n\s*|[^\sA-Za-z0-9]")
+
+# Tokens of a truncated message's content that are always kept, split between its start and end
+_MIN_TRUNCATED_TOKENS = 32
+
+_TRUNCATION_MARKER = " [...] "
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a BPE tokenizer splits text into, without loading one.
+
+    Runs of letters count one token per six characters, runs of digits one per three,
+    a line break together with the indentation around it one, and every other
+    non-space character one; spaces are absorbed into the word that follows. Meant
+    for budgeting prompt size, not for billing.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isascii() and piece[0].isalpha():
+            tokens += (len(piece) + 5) // 6
+        elif piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+@dataclass
+class HistoryWindowPolicy:
+    """How much of a conversation the user simulator and the completion check see."""
+    # Model that folds older turns into the summary
+    summary_model_id: str
+    # Most recent turns shown verbatim (default: as many as fit max_tokens)
+    recent_turns: Optional[int] = None
+    # Approximate tokens the history section of each simulator prompt may take (default: no limit)
+    max_tokens: Optional[int] = None
+    # Length the summary is asked to stay within, and what is set aside for it when fitting turns into max_tokens
+    summary_max_tokens: int = 400
+
+    def __post_init__(self):
+        if self.recent_turns is not None and self.recent_turns < 1:
+            raise ValueError("recent_turns must be at least 1")
+
+
+class HistoryWindow:
+    """
+    The conversation history shown to a conversation's simulator prompts: a rolling
+    summary of older turns followed by the most recent turns verbatim.
+
+    The conversation itself is never changed, so the assistant endpoint still receives
+    the full history. Each update folds only the turns that have just left the window
+    into the summary, so keeping it current costs one small query per turn however long
+    the conversation gets. The latest turn is always kept verbatim; if it alone exceeds
+    the token budget, the longest messages are cut in the middle when rendered.
+    """
+
+    def __init__(self, policy: HistoryWindowPolicy, model_provider: ModelProvider, conversation: Conversation, user_persona: CharacterCard, assistant: Assistant):
+        self.policy = policy
+        self.model_provider = model_provider
+        self.conversation = conversation
+        self.user_persona = user_persona
+        self.assistant = assistant
+        self.summary = ""
+        # Messages before this index are covered by the summary
+        self.folded_messages = 0
+        self._message_tokens: List[int] = []
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def _tokens(self, start: int) -> List[int]:
+        """Estimated tokens of each message from start on, as rendered in a prompt."""
+        with self._lock:
+            for message in self.conversation.messages[len(self._message_tokens):]:
+                self._message_tokens.append(count_tokens(json.dumps(message.prompt_format, indent=4)))
+            return self._message_tokens[start:]
+
+    def _fold_point(self) -> int:
+        """Index of the first message to keep verbatim once the window is up to date."""
+        turn_starts = [i for i, message in enumerate(self.conversation.messages) if message.role == ROLE.user and i >= self.folded_messages]
+        if not turn_starts:
+            return self.folded_messages
+
+        kept_turns = len(turn_starts)
+        if self.policy.recent_turns is not None:
+            kept_turns = min(kept_turns, self.policy.recent_turns)
+
+        if self.policy.max_tokens is not None:
+            message_tokens = self._tokens(self.folded_messages)
+            while kept_turns > 1:
+                start = turn_starts[-kept_turns]
+                summary_tokens = self.policy.summary_max_tokens if start > 0 else 0
+                if summary_tokens + sum(message_tokens[start - self.folded_messages:]) <= self.policy.max_tokens:
+                    break
+                kept_turns -= 1
+
+        return turn_starts[-kept_turns]
+
+    def summary_query(self) -> Optional[ConversationSummaryQuery]:
+        """The query that folds the turns that have left the window into the summary, or None if there are none."""
+        fold_point = self._fold_point()
+        if fold_point <= self.folded_messages:
+            return None
+        return ConversationSummaryQuery(
+            model_provider=self.model_provider,
+            model_id=self.policy.summary_model_id,
+            summary=self.summary,
+            messages=[message.prompt_format for message in self.conversation.messages[self.folded_messages:fold_point]],
+            user_persona=self.user_persona,
+            assistant=self.assistant,
+            # Roughly three words for every four tokens
+            max_words=self.policy.summary_max_tokens * 3 // 4
+        )
+
+    def apply_summary(self, query: ConversationSummaryQuery, summary: str):
+        """Record the result of a query from summary_query."""
+        self.summary = summary
+        self.folded_messages += len(query.messages)
+
+    def update(self):
+        """
+        Fold any turns that have left the window into the summary.
+
+        Queries that read the window call this first; concurrent callers, such as a
+        speculative user message and a completion check, wait for a single summary query.
+        """
+        with self._update_lock:
+            query = self.summary_query()
+            if query is not None:
+                self.apply_summary(query, query.query())
+
+    def fork(self, conversation: Conversation) -> "HistoryWindow":
+        """A window over a copy of this window's conversation, e.g. a branch forked from it, that starts from the same summary."""
+        with self._update_lock, self._lock:
+            window = HistoryWindow(self.policy, self.model_provider, conversation, self.user_persona, self.assistant)
+            window.summary = self.summary
+            window.folded_messages = self.folded_messages
+            window._message_tokens = list(self._message_tokens)
+        return window
+
+    def _fit(self, messages: List[Dict], message_tokens: List[int], max_tokens: int) -> List[Dict]:
+        message_tokens = list(message_tokens)
+        while sum(message_tokens) > max_tokens:
+            longest = max(range(len(messages)), key=lambda i: message_tokens[i])
+            content = messages[longest]["content"]
+            content_tokens = count_tokens(content)
+            target_tokens = max(_MIN_TRUNCATED_TOKENS, content_tokens - (sum(message_tokens) - max_tokens) - count_tokens(_TRUNCATION_MARKER))
+            if target_tokens >= content_tokens:
+                # The longest message is already as short as it gets
+                break
+            kept_chars = len(content) * target_tokens // content_tokens // 2
+            truncated = dict(messages[longest], content=content[:kept_chars] + _TRUNCATION_MARKER + content[len(content) - kept_chars:])
+            truncated_tokens = count_tokens(json.dumps(truncated, indent=4))
+            if truncated_tokens >= message_tokens[longest]:
+                break
+            messages[longest] = truncated
+            message_tokens[longest] = truncated_tokens
+        return messages
+
+    def render(self, heading: str) -> str:
+        """
+        The history section of a simulator prompt.
+
+        Args:
+            heading: Markdown heading to put above the verbatim messages
+        """
+        summary = ""
+        if self.summary:
+            summary = f"""### Summary of Earlier Conversation
+{self.summary}
+
+"""
+        messages = [message.prompt_format for message in self.conversation.messages[self.folded_messages:]]
+        if self.policy.max_tokens is not None:
+            messages = self._fit(messages, self._tokens(self.folded_messages), self.policy.max_tokens - count_tokens(summary) - count_tokens(heading) - 2)
+
+        return f"""{summary}{heading}
+{json.dumps(messages, indent=4)}
+"""
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import asdict, dataclass
 import json
+import random
+import threading
 import time
 import logging
-from typing import Dict
+from typing import TYPE_CHECKING, Dict, Optional, Union
 
-import anthropic
-import openai
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.errors import ErrorKind, ResponseSchemaError, classify_error, retry_after_seconds
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+if TYPE_CHECKING:
+    # The SDKs are slow to import, so only the provider actually used is imported, by create_model_provider
+    import anthropic
+    import openai
 
 
 logger = logging.getLogger(__name__)
@@ -15,14 +25,17 @@ logger = logging.getLogger(__name__)
 
 class LLMQuery(ABC):
     """Base abstract class for LLM queries that defines the common interface."""
-    
+
+    # Pipeline stage that metrics for this query are attributed to
+    stage = "llm_query"
+
     @abstractmethod
     def __init__(self, model_provider: ModelProvider, model_id: str):
         self.model_provider = model_provider
         self.model_id = model_id
     
     @abstractmethod
-    def generate_prompt(self) -> str:
+    def generate_prompt(self) -> Union[str, Prompt]:
         """Generate the prompt to send to the LLM."""
         pass
     
@@ -36,55 +49,164 @@ class LLMQuery(ABC):
         """Parse the JSON response from the LLM."""
         pass
     
-    def query(self, max_retries=3, retry_delay=2, timeout=60):
-        """Send the query to the LLM and return the parsed response."""
-        user_msg = self.generate_prompt()
-        response_schema = self.response_schema()
-
-        retries = 0
-        while retries < max_retries:
-            try:
-                response = self.model_provider.query(user_msg, response_schema, self.model_id, timeout)
-                return self.parse_response(response)
-            except Exception as e:
-                retries += 1
-                logger.error(f"Error: {e}")
-                logger.info(f"Retrying in {retry_delay} seconds... (Attempt {retries}/{max_retries})")
-                time.sleep(retry_delay)
-                retry_delay += 2
-
-        raise Exception("Unable to complete llm query.")
+    def query(self, max_retries=3, retry_delay=2, timeout=60, max_retry_delay=60):
+        """
+        Send the query to the LLM and return the parsed response.
+
+        Transient errors and rate limits are retried with exponential backoff and jitter,
+        waiting at least as long as any Retry-After header asks. Errors that retrying
+        cannot fix, such as 4xx request errors or responses that do not match the
+        schema, fail immediately.
+
+        Raises:
+            ValueError: If max_retries is less than 1
+        """
+        if max_retries < 1:
+            raise ValueError("max_retries must be at least 1")
+
+        with metrics.stage(self.stage), metrics.span("llm_query", model_id=self.model_id) as span:
+            cpu_start = time.thread_time()
+            user_msg = self.generate_prompt()
+            metrics.record_prompt_cpu(time.thread_time() - cpu_start)
+            response_schema = self.response_schema()
+
+            for attempt in range(1, max_retries + 1):
+                span["attempts"] = attempt
+                try:
+                    response = self.model_provider.query(user_msg, response_schema, self.model_id, timeout)
+                    try:
+                        return self.parse_response(response)
+                    except Exception as e:
+                        self.model_provider.discard_response(user_msg, response_schema, self.model_id)
+                        raise ResponseSchemaError(f"Unable to parse response: {e}") from e
+                except Exception as e:
+                    error_kind = classify_error(e)
+                    logger.error(f"Error ({error_kind.name}): {e}")
+                    if error_kind == ErrorKind.fatal:
+                        raise Exception("Unable to complete llm query.") from e
+                    if attempt == max_retries:
+                        raise Exception("Unable to complete llm query.") from e
+
+                    metrics.record_retry(error_kind.name)
+                    backoff = min(max_retry_delay, retry_delay * 2 ** (attempt - 1))
+                    delay = backoff / 2 + random.uniform(0, backoff / 2)
+                    retry_after = retry_after_seconds(e)
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                    logger.info(f"Retrying in {delay:.1f} seconds... (Attempt {attempt}/{max_retries})")
+                    time.sleep(delay)
 
     
+@dataclass
+class TokenUsage:
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+
+
 class ModelProvider(ABC):
 
+    def __init__(self):
+        self.token_usage: Dict[str, TokenUsage] = defaultdict(TokenUsage)
+        self._usage_lock = threading.Lock()
+
     @abstractmethod
-    def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
         pass
 
     @abstractmethod
     def response_format(self, response_schema: Dict) -> Dict:
         pass
 
+    def record_usage(self, model_id: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0):
+        """Accumulate token counts reported by the provider, including input tokens served from its prompt cache."""
+        with self._usage_lock:
+            usage = self.token_usage[model_id]
+            usage.requests += 1
+            usage.input_tokens += input_tokens
+            usage.output_tokens += output_tokens
+            usage.cached_input_tokens += cached_input_tokens
+        metrics.record_tokens(model_id, input_tokens, output_tokens, cached_input_tokens)
+
+    def usage_summary(self) -> Dict[str, Dict[str, int]]:
+        with self._usage_lock:
+            return {model_id: asdict(usage) for model_id, usage in self.token_usage.items()}
+
+    def cache_identity(self) -> str:
+        """
+        Identifies the backend that answers this provider's queries, for keying cached responses.
+
+        Wrappers such as rate limiting return the identity of the provider they wrap, so
+        turning them on or off keeps the cache valid.
+        """
+        return type(self).__name__
+
+    def answered_as_requested(self) -> bool:
+        """
+        Whether the last response returned on this thread came from this provider's cache
+        identity and the model asked for, rather than a stand-in such as a failover model.
+
+        Only such responses may be cached under the requested model.
+        """
+        return True
+
+    def discard_response(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str):
+        """Forget a response that its query could not parse, so that no cache serves it again."""
+        pass
+
 class OpenAIModelProvider(ModelProvider):
+    """
+    OpenAI caches prompt prefixes automatically, so structured prompts are sent with the
+    static instructions as the system message followed by the per-conversation context,
+    keeping the longest possible prefix identical across turns.
+    """
 
     def __init__(self, client: openai.OpenAI):
+        super().__init__()
         self.client = client
 
-    def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):      
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):      
+
+        with metrics.span("provider_query", provider="openai", model_id=model_id):
+            response = self.client.chat.completions.create(
+                timeout=timeout,
+                **self.request_params(user_msg, response_schema, model_id)
+            )
 
-        response = self.client.chat.completions.create(
-            model=model_id,
-            messages=[
-                {"role": "user", "content": user_msg}
-            ],
-            seed=42,
-            response_format=self.response_format(response_schema),
-            timeout=timeout,
-            temperature=1.0
-        ).choices[0].message.content
+        return self.parse_completion(response, model_id)
 
-        return json.loads(response)
+    def request_params(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str) -> Dict:
+        """Chat completion request body, shared by synchronous queries and batch jobs."""
+        return {
+            "model": model_id,
+            "messages": self.messages(user_msg),
+            "seed": 42,
+            "response_format": self.response_format(response_schema),
+            "temperature": 1.0
+        }
+
+    def parse_completion(self, response, model_id: str):
+        """Record token usage and decode the JSON content of a chat completion."""
+        usage = response.usage
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+            self.record_usage(model_id, usage.prompt_tokens, usage.completion_tokens, cached_tokens)
+
+        return json.loads(response.choices[0].message.content)
+
+    def cache_identity(self) -> str:
+        return f"{type(self).__name__}:{self.client.base_url}"
+
+    def messages(self, user_msg: Union[str, Prompt]):
+        if isinstance(user_msg, str):
+            return [{"role": "user", "content": user_msg}]
+
+        return [
+            {"role": "system", "content": user_msg.system},
+            {"role": "user", "content": user_msg.user_content}
+        ]
     
     def response_format(self, response_schema: Dict):
         return {
@@ -97,25 +219,56 @@ class OpenAIModelProvider(ModelProvider):
         }
 
 class AnthropicModelProvider(ModelProvider):
+    """
+    Structured prompts are sent with cache_control breakpoints after the static
+    instructions and after the per-conversation context, so turns 2..N only pay full
+    price for the conversation history.
+    """
     
     def __init__(self, client: anthropic.Anthropic):
+        super().__init__()
         self.client = client
     
-    def query(self, user_msg: str, response_schema: Dict, model_id: str, timeout: int=60):
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
         """Handle API calls to Anthropic Claude using the tools API for schema enforcement"""
+        with metrics.span("provider_query", provider="anthropic", model_id=model_id):
+            response = self.client.messages.create(
+                timeout=timeout,
+                **self.request_params(user_msg, response_schema, model_id)
+            )
+
+        return self.parse_message(response, model_id)
+
+    def request_params(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str) -> Dict:
+        """Messages request body, shared by synchronous queries and batch jobs."""
         response_format = self.response_format(response_schema)
-        
-        response = self.client.messages.create(
-            model=model_id,
-            max_tokens=4096,
-            messages=[
-                {"role": "user", "content": user_msg}
-            ],
-            tools=[response_format],
-            tool_choice={"type": "tool", "name": response_format["name"]},
-            timeout=timeout,
-            temperature=1.0
-        )
+
+        request = {
+            "model": model_id,
+            "max_tokens": 4096,
+            "tools": [response_format],
+            "tool_choice": {"type": "tool", "name": response_format["name"]},
+            "temperature": 1.0
+        }
+        if isinstance(user_msg, str):
+            request["messages"] = [{"role": "user", "content": user_msg}]
+        else:
+            request["system"] = [{"type": "text", "text": user_msg.system, "cache_control": {"type": "ephemeral"}}]
+            request["messages"] = [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": user_msg.context, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": user_msg.history}
+                ]
+            }]
+        return request
+
+    def parse_message(self, response, model_id: str):
+        """Record token usage and extract the tool input from a message."""
+        usage = response.usage
+        cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_creation_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+        self.record_usage(model_id, usage.input_tokens + cache_read_tokens + cache_creation_tokens, usage.output_tokens, cache_read_tokens)
         
         # Parse the response to get the tool use
         for content in response.content:
@@ -124,10 +277,39 @@ class AnthropicModelProvider(ModelProvider):
         
         # Fallback in case the model didn't use the tool
         raise Exception("Anthropic model did not return a tool use response")
+
+    def cache_identity(self) -> str:
+        return f"{type(self).__name__}:{self.client.base_url}"
     
     def response_format(self, response_schema: Dict) -> Dict:
         return {
             "name": "json_extractor",
             "description": "Extract structured data according to the provided schema",
             "input_schema": response_schema
-        }
\ No newline at end of file
+        }
+
+MODEL_PROVIDERS = ("openai", "anthropic", "openai_compatible")
+
+
+def create_model_provider(provider_name: str, config_path: Optional[str] = None) -> ModelProvider:
+    """
+    Create an OpenAI, Anthropic or self-hosted model provider, importing only that provider's SDK.
+
+    Clients are created with SDK retries disabled; LLMQuery retries with its own backoff.
+
+    Args:
+        provider_name: "openai", "anthropic" or "openai_compatible"
+        config_path: Path to the YAML configuration of an "openai_compatible" server
+    """
+    if provider_name == "openai":
+        import openai
+        return OpenAIModelProvider(openai.OpenAI(max_retries=0))
+    if provider_name == "anthropic":
+        import anthropic
+        return AnthropicModelProvider(anthropic.Anthropic(max_retries=0))
+    if provider_name == "openai_compatible":
+        if config_path is None:
+            raise ValueError("The openai_compatible model provider needs a configuration file with the server's base_url")
+        from synthetic_conversation_generation.llm_queries.openai_compatible import OpenAICompatibleModelProvider
+        return OpenAICompatibleModelProvider.from_yaml(config_path)
+    raise ValueError(f"Unknown model provider '{provider_name}', expected one of {', '.join(MODEL_PROVIDERS)}")
@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+import yaml
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.data_models.inference_endpoint import InferenceEndpoint
+from synthetic_conversation_generation.http_client import create_http_client
+from synthetic_conversation_generation.llm_queries.errors import ResponseSchemaError
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+# How each supported server family is asked to constrain decoding to a JSON schema
+GUIDED_DECODING_MODES = (
+    # OpenAI-style structured outputs, accepted by recent vLLM, SGLang and llama.cpp servers
+    "response_format",
+    # vLLM's guided decoding extension
+    "guided_json",
+    # llama.cpp's grammar-from-schema extension
+    "json_schema",
+)
+
+# Sampling used for any query type the configuration does not override, matching the hosted OpenAI provider
+DEFAULT_SAMPLING: Dict[str, Any] = {"temperature": 1.0, "seed": 42}
+
+class ConcurrencyLimiter:
+    """
+    Bounds how many requests are in flight to the server at once.
+
+    Each request is sent from its calling thread as soon as a slot is free, without
+    waiting for others to group with. Servers with continuous batching already schedule
+    concurrent requests into shared forward passes, so keeping up to max_in_flight
+    requests outstanding on keep-alive connections is what keeps the server busy.
+    """
+
+    def __init__(self, max_in_flight: int = 64):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waited_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the slots, waiting for one to free up if all are taken."""
+        started_at = time.monotonic()
+        with self._slots:
+            with self._lock:
+                self.requests += 1
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                self.waited_seconds += time.monotonic() - started_at
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "peak_in_flight": self.peak_in_flight,
+                "mean_wait_seconds": round(self.waited_seconds / self.requests, 4) if self.requests else 0.0
+            }
+
+
+class OpenAICompatibleModelProvider(ModelProvider):
+    """
+    Queries a self-hosted server with an OpenAI-compatible chat completions API, such as
+    vLLM, SGLang or llama.cpp's llama-server.
+
+    Responses are constrained to the query's schema by the server's guided decoding, and
+    up to pool_size concurrent queries are kept in flight for the server's continuous
+    batching to schedule together. Sampling parameters are chosen per query type from the stage
+    the query runs in, e.g. a deterministic completion check alongside varied user messages.
+    """
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, guided_decoding: str = "response_format",
+                 sampling: Optional[Dict[str, Dict[str, Any]]] = None, pool_size: int = 64, connect_timeout: float = 10, read_timeout: float = 300, http2: bool = False):
+        """
+        Args:
+            base_url: Base URL of the server's OpenAI-compatible API, e.g. http://localhost:8000/v1
+            api_key: Sent as a bearer token if the server requires one
+            guided_decoding: How the server is asked to follow the response schema, one of GUIDED_DECODING_MODES
+            sampling: Request parameters by query stage, e.g. {"completion_check": {"temperature": 0}}, with "default" applying to every stage
+            pool_size: Keep-alive connections to the server, and so the most queries in flight at once
+        """
+        super().__init__()
+        if guided_decoding not in GUIDED_DECODING_MODES:
+            raise ValueError(f"Unknown guided decoding mode '{guided_decoding}', expected one of {', '.join(GUIDED_DECODING_MODES)}")
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.guided_decoding = guided_decoding
+        self.sampling = sampling or {}
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.http_client = create_http_client(pool_size, connect_timeout, read_timeout, http2)
+        self.concurrency = ConcurrencyLimiter(pool_size)
+
+    @classmethod
+    def from_yaml(cls, config_path: str):
+        with open(config_path, 'r') as f:
+            config = InferenceEndpoint._interpolate_env_vars(yaml.safe_load(f))
+
+        return cls(
+            base_url=config['base_url'],
+            api_key=config.get('api_key'),
+            guided_decoding=config.get('guided_decoding', 'response_format'),
+            sampling=config.get('sampling'),
+            pool_size=config.get('pool_size', 64),
+            connect_timeout=config.get('connect_timeout', 10),
+            read_timeout=config.get('read_timeout', 300),
+            http2=config.get('http2', False)
+        )
+
+    def sampling_params(self, stage: str) -> Dict[str, Any]:
+        """Sampling parameters for queries in a stage, layered over the configured and built-in defaults."""
+        return {**DEFAULT_SAMPLING, **self.sampling.get("default", {}), **self.sampling.get(stage, {})}
+
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
+        with metrics.span("provider_query", provider="openai_compatible", model_id=model_id):
+            request = self.request_params(user_msg, response_schema, model_id, metrics.current_stage())
+            with self.concurrency.slot():
+                response = self.http_client.post_json(self.url, json.dumps(request).encode("utf-8"), self.headers, read_timeout=timeout)
+
+        return self.parse_completion(response, model_id)
+
+    def request_params(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, stage: str) -> Dict:
+        return {
+            "model": model_id,
+            "messages": self.messages(user_msg),
+            **self.sampling_params(stage),
+            **self.response_format(response_schema)
+        }
+
+    def parse_completion(self, response: Dict, model_id: str):
+        """Record token usage and decode the JSON content of a chat completion."""
+        usage = response.get("usage")
+        if usage:
+            cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            self.record_usage(model_id, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached_tokens)
+
+        choice = response["choices"][0]
+        if choice.get("finish_reason") == "length":
+            # Sampling is seeded, so retrying would cut the response off at the same place
+            raise ResponseSchemaError("Response was cut off by max_tokens before the JSON was complete")
+        return json.loads(choice["message"]["content"])
+
+    def messages(self, user_msg: Union[str, Prompt]):
+        if isinstance(user_msg, str):
+            return [{"role": "user", "content": user_msg}]
+
+        return [
+            {"role": "system", "content": user_msg.system},
+            {"role": "user", "content": user_msg.user_content}
+        ]
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        """Request body fields asking the server to constrain decoding to the schema."""
+        if self.guided_decoding == "guided_json":
+            return {"guided_json": response_schema}
+        if self.guided_decoding == "json_schema":
+            return {"json_schema": response_schema}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "response",
+                    "strict": True,
+                    "schema": response_schema
+                }
+            }
+        }
+
+    def cache_identity(self) -> str:
+        # Different servers, decoding modes or sampling can answer the same prompt differently
+        return f"{type(self).__name__}:{self.url}:{self.guided_decoding}:{json.dumps(self.sampling, sort_keys=True)}"
+
+    def concurrency_stats(self) -> Dict[str, float]:
+        return self.concurrency.stats()
+
+    def close(self):
+        self.http_client.close()
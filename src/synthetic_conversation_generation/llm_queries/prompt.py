@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+import json
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """
+    A prompt split by how often each part changes.
+
+    Providers send the parts in this order and mark the boundaries as cache
+    breakpoints where supported, so the static instructions and the
+    per-conversation context form a prefix that is reused on every turn.
+    """
+    # Instructions that are identical for every query of a given type
+    system: str
+    # Content that is fixed for the lifetime of a conversation, e.g. persona and assistant definitions
+    context: str
+    # Content that changes on every query, e.g. the conversation history
+    history: str
+
+    @property
+    def user_content(self) -> str:
+        return f"{self.context}\n{self.history}"
+
+    @property
+    def text(self) -> str:
+        return f"{self.system}\n{self.user_content}"
+
+    def serialize(self) -> str:
+        return json.dumps({"system": self.system, "context": self.context, "history": self.history})
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.errors import ErrorKind, classify_error, retry_after_seconds
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rough characters-per-token ratio for English text with common tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(user_msg: Union[str, Prompt], expected_output_tokens: int = 256) -> int:
+    """Estimate the tokens a request counts against a tokens-per-minute budget from its prompt length."""
+    text = user_msg if isinstance(user_msg, str) else user_msg.text
+    return len(text) // CHARS_PER_TOKEN + expected_output_tokens
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at capacity per minute.
+
+    Reservations may drive the level negative; callers then wait until the bucket
+    has refilled past their reservation, so waiting requests are served in order.
+    """
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = capacity_per_minute
+        self.rate = capacity_per_minute / 60
+        self.level = capacity_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket and return the seconds to wait before using it."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.level
+
+
+@dataclass
+class _Budget:
+    requests: Optional[TokenBucket]
+    tokens: Optional[TokenBucket]
+    paused_until: float = 0.0
+    acquired: int = 0
+    rate_limited: int = 0
+    waited_seconds: float = 0.0
+
+
+class RateLimiter:
+    """
+    Shared requests-per-minute and tokens-per-minute budgets per provider and model.
+
+    A single limiter should be shared by every worker calling the same account, so
+    that together they stay under quota. A 429 pauses the whole budget for the
+    duration the provider asks for, rather than just the request that hit it.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None, default_pause_seconds: float = 5):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.default_pause_seconds = default_pause_seconds
+        self._budgets: Dict[Tuple[str, str], _Budget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, provider: str, model_id: str) -> _Budget:
+        key = (provider, model_id)
+        if key not in self._budgets:
+            self._budgets[key] = _Budget(
+                requests=TokenBucket(self.requests_per_minute) if self.requests_per_minute else None,
+                tokens=TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+            )
+        return self._budgets[key]
+
+    def acquire(self, provider: str, model_id: str, estimated_tokens: int):
+        """Block until a request of the estimated size fits within the budget."""
+        with self._lock:
+            now = time.monotonic()
+            budget = self._budget(provider, model_id)
+            wait = max(0.0, budget.paused_until - now)
+            if budget.requests is not None:
+                wait = max(wait, budget.requests.reserve(1, now))
+            if budget.tokens is not None:
+                wait = max(wait, budget.tokens.reserve(estimated_tokens, now))
+            budget.acquired += 1
+            budget.waited_seconds += wait
+
+        if wait > 0:
+            metrics.increment("rate_limit_wait_seconds", wait)
+            logger.debug(f"Rate limiter delaying {provider}/{model_id} request by {wait:.2f} seconds")
+            time.sleep(wait)
+
+    def pause(self, provider: str, model_id: str, seconds: Optional[float] = None):
+        """Hold back every request for a provider and model, e.g. after a 429."""
+        if seconds is None:
+            seconds = self.default_pause_seconds
+        with self._lock:
+            budget = self._budget(provider, model_id)
+            budget.rate_limited += 1
+            budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current state of every budget, to see how close a run is to its quota."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                f"{provider}/{model_id}": {
+                    "requests_available": budget.requests.available(now) if budget.requests is not None else None,
+                    "requests_per_minute": self.requests_per_minute,
+                    "tokens_available": budget.tokens.available(now) if budget.tokens is not None else None,
+                    "tokens_per_minute": self.tokens_per_minute,
+                    "paused_seconds_remaining": max(0.0, budget.paused_until - now),
+                    "acquired": budget.acquired,
+                    "rate_limited": budget.rate_limited,
+                    "waited_seconds": budget.waited_seconds
+                }
+                for (provider, model_id), budget in self._budgets.items()
+            }
+
+
+class RateLimitedModelProvider(ModelProvider):
+    """Admits queries to the wrapped provider only within the RateLimiter's budget."""
+
+    def __init__(self, provider: ModelProvider, rate_limiter: RateLimiter):
+        super().__init__()
+        self.provider = provider
+        self.rate_limiter = rate_limiter
+
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
+        provider_name = type(self.provider).__name__
+        self.rate_limiter.acquire(provider_name, model_id, estimate_tokens(user_msg))
+        try:
+            return self.provider.query(user_msg, response_schema, model_id, timeout)
+        except Exception as e:
+            if classify_error(e) == ErrorKind.rate_limited:
+                metrics.increment("rate_limited_responses")
+                self.rate_limiter.pause(provider_name, model_id, retry_after_seconds(e))
+            raise
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return self.provider.response_format(response_schema)
+
+    def usage_summary(self) -> Dict[str, Dict[str, int]]:
+        return self.provider.usage_summary()
+
+    def cache_identity(self) -> str:
+        return self.provider.cache_identity()
+
+    def answered_as_requested(self) -> bool:
+        return self.provider.answered_as_requested()
+
+    def discard_response(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str):
+        self.provider.discard_response(user_msg, response_schema, model_id)
@@ -0,0 +1,202 @@
+from enum import Enum, auto
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+from synthetic_conversation_generation import metrics
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMode(Enum):
+    read_write = auto()
+    read_only = auto()
+    bypass = auto()
+
+
+class ResponseCache:
+    """
+    On-disk cache of LLM responses backed by SQLite.
+
+    The database runs in WAL mode with a busy timeout, so threads and separate
+    processes can share one cache file. Each thread gets its own connection.
+    """
+
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path: str, mode: CacheMode = CacheMode.read_write, max_entries: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        """
+        Args:
+            path: Path to the SQLite cache file, created if it does not exist
+            mode: Whether to read and write, only read, or ignore the cache
+            max_entries: Evict least recently used responses beyond this many entries
+            max_age_seconds: Evict responses older than this
+        """
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        if mode != CacheMode.bypass:
+            connection = self._connection()
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        provider TEXT NOT NULL,
+                        model_id TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_accessed REAL NOT NULL
+                    )
+                """)
+                connection.execute("CREATE INDEX IF NOT EXISTS responses_last_accessed ON responses (last_accessed)")
+            if mode == CacheMode.read_write:
+                self.evict()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(provider: str, model_id: str, prompt: str, response_schema: Dict) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        schema_hash = hashlib.sha256(json.dumps(response_schema, sort_keys=True).encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{provider}\0{model_id}\0{prompt_hash}\0{schema_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.mode == CacheMode.bypass:
+            return None
+
+        connection = self._connection()
+        row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None and self.max_age_seconds is not None and row[1] < now - self.max_age_seconds:
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if row is None:
+            return None
+
+        if self.mode == CacheMode.read_write:
+            with connection:
+                connection.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, provider: str, model_id: str, response: Any):
+        if self.mode != CacheMode.read_write:
+            return
+
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model_id, response, created_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model_id, json.dumps(response), now, now)
+            )
+
+        with self._lock:
+            self.writes += 1
+            should_evict = self.writes % self.EVICTION_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def delete(self, key: str):
+        if self.mode != CacheMode.read_write:
+            return
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def evict(self):
+        """Delete expired responses and trim the cache to max_entries, least recently used first."""
+        connection = self._connection()
+        with connection:
+            if self.max_age_seconds is not None:
+                connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            if self.max_entries is not None:
+                connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+class CachedModelProvider(ModelProvider):
+    """
+    Serves repeated queries from a ResponseCache and forwards the rest to the wrapped provider.
+
+    Responses are keyed on the cache identity of the backend behind any wrappers, such as
+    its class and base URL, so rate limiting or hedging do not affect which entries match.
+    Responses from a stand-in, such as a failover model, are returned but not cached, so
+    later runs query the requested model again, and a response its query fails to parse
+    is deleted again through discard_response.
+    """
+
+    def __init__(self, provider: ModelProvider, cache: ResponseCache):
+        super().__init__()
+        self.provider = provider
+        self.cache = cache
+
+    def _key(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str) -> str:
+        prompt = user_msg if isinstance(user_msg, str) else user_msg.serialize()
+        return self.cache.key(self.provider.cache_identity(), model_id, prompt, response_schema)
+
+    def query(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str, timeout: int=60):
+        if self.cache.mode == CacheMode.bypass:
+            return self.provider.query(user_msg, response_schema, model_id, timeout)
+
+        provider_name = self.provider.cache_identity()
+        key = self._key(user_msg, response_schema, model_id)
+        response = self.cache.get(key)
+        if response is not None:
+            metrics.increment("cache_hits")
+            return response
+        metrics.increment("cache_misses")
+
+        response = self.provider.query(user_msg, response_schema, model_id, timeout)
+        if self.provider.answered_as_requested():
+            self.cache.put(key, provider_name, model_id, response)
+        return response
+
+    def response_format(self, response_schema: Dict) -> Dict:
+        return self.provider.response_format(response_schema)
+
+    def usage_summary(self) -> Dict[str, Dict[str, int]]:
+        return self.provider.usage_summary()
+
+    def cache_identity(self) -> str:
+        return self.provider.cache_identity()
+
+    def answered_as_requested(self) -> bool:
+        return self.provider.answered_as_requested()
+
+    def discard_response(self, user_msg: Union[str, Prompt], response_schema: Dict, model_id: str):
+        if self.cache.mode != CacheMode.bypass:
+            self.cache.delete(self._key(user_msg, response_schema, model_id))
+        self.provider.discard_response(user_msg, response_schema, model_id)
@@ -2,22 +2,38 @@
 from dataclasses import asdict
 from datetime import datetime
 import json
+from typing import Optional
 
 from synthetic_conversation_generation.data_models.assistant import Assistant
 from synthetic_conversation_generation.data_models.conversation import Conversation, Message, ROLE
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.llm_queries.history_window import HistoryWindow
 from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider
+from synthetic_conversation_generation.llm_queries.prompt import Prompt
 
 class UserMessageQuery(LLMQuery):
 
-    def __init__(self, model_provider: ModelProvider, model_id: str, conversation: Conversation, user_persona: CharacterCard, assistant: Assistant):
+    stage = "user_message"
+
+    def __init__(self, model_provider: ModelProvider, model_id: str, conversation: Conversation, user_persona: CharacterCard, assistant: Assistant, sample_number: Optional[int] = None, history_window: Optional[HistoryWindow] = None, branch_number: Optional[int] = None):
+        """
+        Args:
+            sample_number: Distinguishes repeated conversations with the same persona, which would otherwise
+                send identical prompts and be served identical (or identically cached) responses
+            history_window: Show a summary of older turns and only the recent ones instead of the whole conversation
+            branch_number: Distinguishes the continuations forked from the same conversation prefix; marked after the
+                history, so the forks still share the cached prompt prefix
+        """
         super().__init__(model_provider, model_id)
         self.conversation = conversation
         self.user_persona = user_persona
         self.assistant = assistant
-        
-    def generate_prompt(self):
-        return f"""Generate a realistic, conversational user response that would naturally follow next in this dialogue between a human user and an AI assistant.
+        self.sample_number = sample_number
+        self.history_window = history_window
+        self.branch_number = branch_number
+
+    def generate_prompt(self) -> Prompt:
+        system = """Generate a realistic, conversational user response that would naturally follow next in this dialogue between a human user and an AI assistant.
 
 ### Instructions
 - Authentically reflect the user's defined personality, background, and communication style
@@ -25,17 +41,48 @@ class UserMessageQuery(LLMQuery):
 - Avoid overusing the assistant's name (humans rarely address others by name in every message)
 - Include appropriate human emotions, hesitations, or thought processes based on the conversation context
 - Mimic human behavior when chatting with AI (generally concise, direct questions, sometimes abrupt topic changes, occasional follow-ups without pleasantries, varying engagement depth based on interest level, etc.)
+"""
 
-### User Definition
+        context = f"""### User Definition
 {json.dumps(asdict(self.user_persona), indent=4)}
 
 ### Assistant Definition
 {json.dumps(asdict(self.assistant), indent=4)}
+{self.sample_prompt()}"""
 
-### Conversation History
+        if self.history_window is not None:
+            history = self.history_window.render("### Conversation History")
+        else:
+            history = f"""### Conversation History
 {json.dumps(self.conversation.prompt_format, indent=4)}
 """
 
+        return Prompt(system=system, context=context, history=history + self.branch_prompt())
+
+    def sample_prompt(self) -> str:
+        if self.sample_number is None:
+            return ""
+
+        return f"""
+### Conversation Sample
+This is independent sample #{self.sample_number} of a conversation with this user. Let it unfold on its own rather than along the most predictable path.
+"""
+
+    def branch_prompt(self) -> str:
+        if self.branch_number is None:
+            return ""
+
+        return f"""
+### Conversation Branch
+This is alternative continuation #{self.branch_number} of the conversation from this point. Take the user's next message somewhere other than the most predictable path.
+"""
+
+    def query(self, *args, **kwargs):
+        # Fold any turns that have left the window into the summary before the prompt is built from it
+        if self.history_window is not None:
+            self.history_window.update()
+        return super().query(*args, **kwargs)
+
     def response_schema(self):
         properties = {}
         properties["user_message"] = {
@@ -1,23 +1,78 @@
 from dataclasses import asdict
 import json
+import random
 from typing import List, Optional
 
 from synthetic_conversation_generation.data_models.assistant import Assistant
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
 from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery, ModelProvider
+from synthetic_conversation_generation.similarity import PersonaIndex, persona_text
 
 class UserPersonaQuery(LLMQuery):
 
+    stage = "persona"
+
     def __init__(
         self, 
         model_provider: ModelProvider, 
         model_id: str, 
         assistant: Assistant, 
-        previous_personas: List[CharacterCard]
+        previous_personas: List[CharacterCard],
+        max_full_personas: Optional[int] = None,
+        persona_index: Optional[PersonaIndex] = None,
+        request_number: Optional[int] = None,
+        max_summarized_personas: int = 100
     ):
+        """
+        Args:
+            max_full_personas: If set, include full cards for only this many previous personas, the
+                nearest neighbours of an anchor persona picked for this request, and summaries of the
+                next max_summarized_personas nearest, so the prompt stays the same size however large
+                the pool grows
+            persona_index: Similarity index over previous_personas, reused across queries to avoid reindexing
+            request_number: Distinguishes requests made in parallel from the same previous personas, which
+                would otherwise send identical prompts and tend to produce identical personas
+            max_summarized_personas: Most previous personas to summarize when max_full_personas is set
+        """
         super().__init__(model_provider, model_id)
         self.assistant = assistant
         self.previous_personas = previous_personas
+        self.max_full_personas = max_full_personas
+        self.persona_index = persona_index
+        self.request_number = request_number
+        self.max_summarized_personas = max_summarized_personas
+
+    def anchor_persona(self) -> CharacterCard:
+        """
+        The previous persona whose neighbourhood is shown in full.
+
+        It differs between the requests of a wave and from one wave to the next, so over a run
+        every part of the pool is shown in full, and is the same whenever the same request is
+        made from the same pool, so prompts stay cacheable.
+        """
+        return random.Random(f"{len(self.previous_personas)}:{self.request_number}").choice(self.previous_personas)
+
+    def previous_personas_prompt(self) -> str:
+        if self.max_full_personas is None or len(self.previous_personas) <= self.max_full_personas:
+            return json.dumps([asdict(persona) for persona in self.previous_personas], indent=4)
+
+        if self.persona_index is None:
+            self.persona_index = PersonaIndex(self.previous_personas)
+        self.persona_index.update(self.previous_personas)
+
+        nearest = self.persona_index.most_similar(persona_text(self.anchor_persona()), self.max_full_personas + self.max_summarized_personas)
+        full_personas = nearest[:self.max_full_personas]
+        summarized_personas = nearest[self.max_full_personas:]
+        omitted = len(self.previous_personas) - len(nearest)
+
+        prompt = f"""A group of closely related previous personas in full, followed by summaries of the personas most similar to them.
+{json.dumps([asdict(persona) for persona in full_personas], indent=4)}
+
+### Summaries of Other Previous User Personas
+{json.dumps([{"name": persona.name, "summary": persona.summary} for persona in summarized_personas])}"""
+        if omitted > 0:
+            prompt += f"\n\n{omitted} less similar previous personas are not shown."
+        return prompt
 
     def generate_prompt(self):
         return f"""Create a distinct, realistic, and well-defined user persona that represents someone likely to interact with the AI assistant defined below. You'll later use these personas to drive simulated conversations and evaluate the assistant's performance. Thus, each generated persona should fill a gap left by existing personas.
@@ -34,7 +89,16 @@ These personas will be utilized to generate simulated conversations and evaluate
 {json.dumps(asdict(self.assistant), indent=4)}
 
 ### Previous User Personas
-{json.dumps([asdict(persona) for persona in self.previous_personas], indent=4)}
+{self.previous_personas_prompt()}
+{self.parallel_generation_prompt()}"""
+
+    def parallel_generation_prompt(self) -> str:
+        if self.request_number is None:
+            return ""
+
+        return f"""
+### Parallel Generation
+Several personas are being generated at the same time from this same list of previous personas, and this is request #{self.request_number}. Fill a gap that the other parallel requests would be unlikely to choose.
 """
     
     def response_schema(self):
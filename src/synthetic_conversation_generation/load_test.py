@@ -0,0 +1,666 @@
+from abc import ABC, abstractmethod
+import argparse
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+import heapq
+import itertools
+import json
+import logging
+import math
+import queue
+import random
+import threading
+import time
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from synthetic_conversation_generation.cli_support import add_model_provider_arguments, configure_logging, create_model_provider_stack
+from synthetic_conversation_generation.data_models.assistant import Assistant
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.conversation import Conversation, Message, ROLE
+from synthetic_conversation_generation.data_models.conversation_characters import iter_personas
+from synthetic_conversation_generation.data_models.inference_endpoint import InferenceEndpoint
+from synthetic_conversation_generation.llm_queries.conversation_completion_query import ConversationCompletionQuery
+from synthetic_conversation_generation.llm_queries.errors import http_status_code
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+from synthetic_conversation_generation.llm_queries.rate_limiter import CHARS_PER_TOKEN
+from synthetic_conversation_generation.llm_queries.user_message_query import UserMessageQuery
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Latency histogram in the style of HdrHistogram.
+
+    Values are counted in logarithmic buckets of fixed relative width, so percentiles
+    keep the same precision from microseconds to minutes in constant memory, and
+    histograms from different threads or breakdowns can be merged exactly.
+    """
+
+    def __init__(self, significant_digits: int = 2):
+        """
+        Args:
+            significant_digits: Decimal digits of precision kept for every value, e.g. 2 for 1%
+        """
+        self.significant_digits = significant_digits
+        self._log_base = math.log1p(10 ** -significant_digits)
+        self.counts: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, seconds: float):
+        # Buckets are indexed in microseconds; anything faster shares the first bucket
+        microseconds = max(seconds * 1e6, 1.0)
+        self.counts[int(math.log(microseconds) / self._log_base)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def _highest_equivalent_value(self, index: int) -> float:
+        # Upper edge of the bucket, capped at the largest value actually recorded
+        return min(math.exp((index + 1) * self._log_base) / 1e6, self.max)
+
+    def value_at_percentile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return self._highest_equivalent_value(index)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.value_at_percentile(50),
+            "p90": self.value_at_percentile(90),
+            "p99": self.value_at_percentile(99),
+            "p999": self.value_at_percentile(99.9),
+            "max": self.max
+        }
+
+    def percentile_distribution(self, ticks_per_half_distance: int = 5) -> str:
+        """Percentile distribution in HdrHistogram's text output format, with values in milliseconds."""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        if self.count == 0:
+            return "\n".join(lines)
+
+        # Percentile steps halve with every halving of the distance to 100%, as in HdrHistogram
+        percentiles = []
+        half_distance = 0
+        while True:
+            start = 100 - 100 / 2 ** half_distance
+            end = 100 - 100 / 2 ** (half_distance + 1)
+            percentiles.extend(start + (end - start) * tick / ticks_per_half_distance for tick in range(ticks_per_half_distance))
+            if 100 / 2 ** (half_distance + 1) < 100 / self.count:
+                break
+            half_distance += 1
+        percentiles.append(100.0)
+
+        indices = iter(sorted(self.counts))
+        index = next(indices)
+        cumulative = self.counts[index]
+        for q in percentiles:
+            target = max(1, math.ceil(q / 100 * self.count))
+            while cumulative < target:
+                index = next(indices)
+                cumulative += self.counts[index]
+            inverse = f"{1 / (1 - q / 100):>14.2f}" if q < 100 else ""
+            lines.append(f"{self._highest_equivalent_value(index) * 1000:>12.3f} {q / 100:>14.12f} {cumulative:>10} {inverse}")
+
+        mean_ms = self.total / self.count * 1000
+        lines.append(f"#[Mean    = {mean_ms:>12.3f}, Max        = {self.max * 1000:>12.3f}]")
+        lines.append(f"#[Total count    = {self.count:>12}, Significant digits = {self.significant_digits}]")
+        return "\n".join(lines)
+
+
+def context_bucket(tokens: int, smallest: int = 256) -> str:
+    """Power-of-two range of context lengths, e.g. 700 tokens -> "512-1023"."""
+    if tokens < smallest:
+        return f"0-{smallest - 1}"
+    lower = 2 ** int(math.log2(tokens))
+    return f"{lower}-{2 * lower - 1}"
+
+
+def error_label(error: Exception) -> str:
+    status_code = http_status_code(error)
+    return f"http_{status_code}" if status_code is not None else type(error).__name__
+
+
+@dataclass
+class RampStage:
+    """Arrival rate changing linearly from start_rate to end_rate over duration_seconds."""
+    duration_seconds: float
+    start_rate: float
+    end_rate: float
+
+
+class ArrivalSchedule:
+    """
+    Open-loop arrival times: a Poisson process whose rate follows piecewise-linear ramp stages.
+
+    Arrivals do not wait for earlier requests to finish, so a slow assistant builds up
+    a queue exactly as it would under real traffic.
+    """
+
+    def __init__(self, stages: List[RampStage], seed: int = 42):
+        if not stages:
+            raise ValueError("An arrival schedule needs at least one stage")
+        self.stages = stages
+        self.seed = seed
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = 42) -> "ArrivalSchedule":
+        """
+        Parse comma-separated "duration:start_rate[:end_rate]" stages, e.g. "60:1:10,300:10" to ramp from 1 to 10 per second over a minute and hold for five.
+        """
+        stages = []
+        for stage in spec.split(","):
+            parts = [float(part) for part in stage.split(":")]
+            if len(parts) not in (2, 3):
+                raise ValueError(f"Invalid ramp stage {stage!r}, expected duration:start_rate[:end_rate]")
+            stages.append(RampStage(parts[0], parts[1], parts[2] if len(parts) == 3 else parts[1]))
+        return cls(stages, seed)
+
+    @property
+    def duration_seconds(self) -> float:
+        return sum(stage.duration_seconds for stage in self.stages)
+
+    def rate_at(self, t: float) -> float:
+        for stage in self.stages:
+            if t < stage.duration_seconds:
+                return stage.start_rate + (stage.end_rate - stage.start_rate) * t / stage.duration_seconds
+            t -= stage.duration_seconds
+        return 0.0
+
+    def arrival_times(self) -> Iterator[float]:
+        """Seconds from the start of the test at which each arrival is due."""
+        peak_rate = max(max(stage.start_rate, stage.end_rate) for stage in self.stages)
+        if peak_rate <= 0:
+            return
+        rng = random.Random(self.seed)
+        t = 0.0
+        while True:
+            # Thinning: draw from a process at the peak rate and keep each draw in proportion to the current rate
+            t += rng.expovariate(peak_rate)
+            if t >= self.duration_seconds:
+                return
+            if rng.random() * peak_rate < self.rate_at(t):
+                yield t
+
+
+class UserSource(ABC):
+    """Supplies the user side of load-test conversations."""
+
+    @abstractmethod
+    def start_conversation(self, index: int) -> Conversation:
+        pass
+
+    @abstractmethod
+    def next_user_message(self, conversation: Conversation) -> Optional[Message]:
+        """The user's next message, or None once the conversation is over."""
+        pass
+
+
+class ReplayedUsers(UserSource):
+    """Replays the user messages of recorded conversations, cycling through them as often as needed."""
+
+    def __init__(self, records: List[Dict]):
+        """
+        Args:
+            records: Conversation records as written by the conversation generator
+        """
+        self.conversations = [
+            (record.get("persona_name", ""), [message["content"] for message in record["messages"] if message["role"] == ROLE.user.name])
+            for record in records
+        ]
+        self.conversations = [conversation for conversation in self.conversations if conversation[1]]
+        if not self.conversations:
+            raise ValueError("No recorded conversations with user messages to replay")
+        self._user_messages: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_jsonl(cls, path: str) -> "ReplayedUsers":
+        with open(path, "r") as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def start_conversation(self, index: int) -> Conversation:
+        persona_name, user_messages = self.conversations[index % len(self.conversations)]
+        conversation = Conversation(id=str(index), user_id=persona_name, messages=[])
+        with self._lock:
+            self._user_messages[conversation.id] = user_messages
+        return conversation
+
+    def next_user_message(self, conversation: Conversation) -> Optional[Message]:
+        turn = sum(1 for message in conversation.messages if message.role == ROLE.user)
+        with self._lock:
+            user_messages = self._user_messages[conversation.id]
+            if turn >= len(user_messages):
+                del self._user_messages[conversation.id]
+                return None
+        return Message(role=ROLE.user, content=user_messages[turn], timestamp=datetime.now(), message_id=len(conversation.messages))
+
+
+class SimulatedUsers(UserSource):
+    """
+    Generates users on the fly with the same queries as the conversation generator.
+
+    Personas are reused as often as needed; each reuse is marked as another sample so it
+    is not served from the response cache.
+    """
+
+    def __init__(self, model_provider: ModelProvider, model_id: str, conversation_completion_query_model_id: str, assistant: Assistant, user_personas: List[CharacterCard], max_conversation_turns: int):
+        if not user_personas:
+            raise ValueError("No user personas to simulate")
+        self.model_provider = model_provider
+        self.model_id = model_id
+        self.conversation_completion_query_model_id = conversation_completion_query_model_id
+        self.assistant = assistant
+        self.user_personas = user_personas
+        self.max_conversation_turns = max_conversation_turns
+
+    def _persona(self, conversation: Conversation) -> Tuple[CharacterCard, Optional[int]]:
+        index = int(conversation.id)
+        repetition = index // len(self.user_personas)
+        return self.user_personas[index % len(self.user_personas)], (repetition + 1 if repetition > 0 else None)
+
+    def start_conversation(self, index: int) -> Conversation:
+        return Conversation(id=str(index), user_id=self.user_personas[index % len(self.user_personas)].name, messages=[])
+
+    def next_user_message(self, conversation: Conversation) -> Optional[Message]:
+        user_persona, sample_number = self._persona(conversation)
+        turns = sum(1 for message in conversation.messages if message.role == ROLE.user)
+        if turns >= self.max_conversation_turns:
+            return None
+        if turns > 0 and ConversationCompletionQuery(self.model_provider, self.conversation_completion_query_model_id, conversation, user_persona, self.assistant).query():
+            return None
+        return UserMessageQuery(self.model_provider, self.model_id, conversation, user_persona, self.assistant, sample_number).query()
+
+
+class LoadTestReport:
+    """Thread-safe latency and error histograms of assistant requests, by turn index and context length."""
+
+    def __init__(self):
+        self.response_time = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.time_to_first_token = LatencyHistogram()
+        self.by_turn: Dict[int, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.by_context: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.errors: Counter = Counter()
+        self.errors_by_turn: Dict[int, Counter] = defaultdict(Counter)
+        self.errors_by_context: Dict[str, Counter] = defaultdict(Counter)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, turn: int, context_tokens: int, response_seconds: float, service_seconds: float, error: Optional[str] = None, time_to_first_token_seconds: Optional[float] = None):
+        """
+        Args:
+            turn: Zero-based turn index of the request within its conversation
+            context_tokens: Estimated tokens of conversation history sent with the request
+            response_seconds: Time from when the request was due to its response, including any queueing
+            service_seconds: Time from when the request was sent to its response
+            error: Label of the error the request failed with, if any
+            time_to_first_token_seconds: Time from when a streamed request was sent to its first token
+        """
+        bucket = context_bucket(context_tokens)
+        with self._lock:
+            self.response_time.record(response_seconds)
+            self.service_time.record(service_seconds)
+            if time_to_first_token_seconds is not None:
+                self.time_to_first_token.record(time_to_first_token_seconds)
+            self.by_turn[turn].record(response_seconds)
+            self.by_context[bucket].record(response_seconds)
+            if error is not None:
+                self.errors[error] += 1
+                self.errors_by_turn[turn][error] += 1
+                self.errors_by_context[bucket][error] += 1
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def summary(self, duration_seconds: float) -> Dict:
+        def breakdown(histograms, errors, sort_key):
+            return {
+                str(key): {**histograms[key].summary(), "errors": dict(errors.get(key, {}))}
+                for key in sorted(histograms, key=sort_key)
+            }
+
+        with self._lock:
+            requests = self.response_time.count
+            return {
+                "requests": requests,
+                "achieved_requests_per_second": requests / duration_seconds if duration_seconds > 0 else None,
+                "error_rate": sum(self.errors.values()) / requests if requests else None,
+                "errors": dict(self.errors),
+                "counters": dict(self.counters),
+                "response_time": self.response_time.summary(),
+                "service_time": self.service_time.summary(),
+                "time_to_first_token": self.time_to_first_token.summary(),
+                "by_turn": breakdown(self.by_turn, self.errors_by_turn, lambda turn: turn),
+                "by_context_tokens": breakdown(self.by_context, self.errors_by_context, lambda bucket: int(bucket.split("-")[0]))
+            }
+
+
+@dataclass
+class _Session:
+    conversation: Conversation
+    next_message: Message
+
+
+class LoadTest:
+    """
+    Drives an assistant endpoint with multi-turn conversations on an open-loop schedule.
+
+    In "conversations" mode every arrival starts a new conversation, whose later turns
+    follow as soon as the user has replied plus any think time. In "requests" mode every
+    arrival is a single request, taken from a conversation waiting on its next turn, or a
+    new one if none is waiting.
+
+    User messages are prepared on a separate thread pool before their request is due, so
+    slow user-simulation LLM calls never count towards assistant latency. If no prepared
+    user is ready when an arrival is due, the arrival is skipped and counted rather than
+    delayed. Response times are measured from when each request was due, not when it was
+    sent, so queueing behind a saturated endpoint is included.
+    """
+
+    def __init__(self, inference_endpoint: InferenceEndpoint, user_source: UserSource, schedule: ArrivalSchedule, mode: str = "conversations", max_in_flight: int = 64, user_concurrency: int = 16, ready_conversations: Optional[int] = None, think_time_seconds: float = 0.0):
+        """
+        Args:
+            inference_endpoint: Assistant endpoint under test
+            user_source: Replayed or simulated users
+            schedule: When conversations ("conversations" mode) or requests ("requests" mode) arrive
+            mode: "conversations" or "requests"
+            max_in_flight: Maximum concurrent requests to the endpoint; later arrivals queue and their wait counts as latency
+            user_concurrency: Threads preparing user messages
+            ready_conversations: New conversations to keep prepared for arrivals (default: twice user_concurrency)
+            think_time_seconds: Pause between an assistant response and the user's next request in "conversations" mode
+        """
+        if mode not in ("conversations", "requests"):
+            raise ValueError(f"Unknown load test mode: {mode}")
+        self.inference_endpoint = inference_endpoint
+        self.user_source = user_source
+        self.schedule = schedule
+        self.mode = mode
+        self.max_in_flight = max_in_flight
+        self.user_concurrency = user_concurrency
+        self.ready_conversations = ready_conversations or 2 * user_concurrency
+        self.think_time_seconds = think_time_seconds
+        self.report = LoadTestReport()
+
+        self._conversation_index = itertools.count()
+        self._fresh: queue.Queue = queue.Queue()
+        self._fresh_pending = 0
+        # Conversations waiting on their next turn in "requests" mode
+        self._continuing: Deque[_Session] = deque()
+        # (due time, sequence, session) of later turns in "conversations" mode
+        self._scheduled: List[Tuple[float, int, _Session]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._request_executor: Optional[ThreadPoolExecutor] = None
+        self._user_executor: Optional[ThreadPoolExecutor] = None
+
+    def _top_up(self):
+        with self._condition:
+            missing = self.ready_conversations - self._fresh_pending
+            self._fresh_pending += max(missing, 0)
+        for _ in range(missing):
+            self._user_executor.submit(self._prepare_conversation)
+
+    def _prepare_conversation(self):
+        if self._stopped.is_set():
+            return
+        try:
+            conversation = self.user_source.start_conversation(next(self._conversation_index))
+            user_message = self.user_source.next_user_message(conversation)
+        except Exception as e:
+            logger.warning(f"Unable to start a simulated conversation: {e}")
+            self.report.increment("user_simulation_errors")
+            with self._condition:
+                self._fresh_pending -= 1
+            return
+        if user_message is None:
+            with self._condition:
+                self._fresh_pending -= 1
+            return
+        self._fresh.put(_Session(conversation, user_message))
+
+    def _prepare_next_turn(self, session: _Session):
+        if self._stopped.is_set():
+            self.report.increment("conversations_cut_off")
+            return
+        try:
+            user_message = self.user_source.next_user_message(session.conversation)
+        except Exception as e:
+            logger.warning(f"Unable to continue simulated conversation {session.conversation.id}: {e}")
+            self.report.increment("user_simulation_errors")
+            return
+        if user_message is None:
+            self.report.increment("conversations_completed")
+            return
+
+        session.next_message = user_message
+        with self._condition:
+            if self.mode == "requests":
+                self._continuing.append(session)
+            else:
+                heapq.heappush(self._scheduled, (time.monotonic() + self.think_time_seconds, next(self._sequence), session))
+                self._condition.notify()
+
+    def _send(self, session: _Session, due: float):
+        conversation = session.conversation
+        conversation.messages.append(session.next_message)
+        turn = sum(1 for message in conversation.messages if message.role == ROLE.user) - 1
+        context_tokens = sum(len(message.content) for message in conversation.messages) // CHARS_PER_TOKEN
+
+        sent = time.monotonic()
+        try:
+            assistant_message = self.inference_endpoint.get_assistant_message(conversation)
+            error = None
+            time_to_first_token_seconds = assistant_message.timing.time_to_first_token_seconds if assistant_message.timing is not None else None
+        except Exception as e:
+            error = error_label(e)
+            time_to_first_token_seconds = None
+        finished = time.monotonic()
+        self.report.record(turn, context_tokens, finished - due, finished - sent, error, time_to_first_token_seconds)
+
+        if error is not None:
+            self.report.increment("conversations_failed")
+        elif self._stopped.is_set():
+            self.report.increment("conversations_cut_off")
+        else:
+            conversation.messages.append(assistant_message)
+            self._user_executor.submit(self._prepare_next_turn, session)
+
+    def _arrive(self, due: float):
+        session = None
+        with self._condition:
+            if self.mode == "requests" and self._continuing:
+                session = self._continuing.popleft()
+        if session is None:
+            try:
+                session = self._fresh.get_nowait()
+            except queue.Empty:
+                self.report.increment("skipped_arrivals")
+                return
+            with self._condition:
+                self._fresh_pending -= 1
+            self.report.increment("conversations_started")
+            self._top_up()
+        self._request_executor.submit(self._send, session, due)
+
+    def _dispatch(self, start: float):
+        end = start + self.schedule.duration_seconds
+        arrivals = (start + t for t in self.schedule.arrival_times())
+        next_arrival = next(arrivals, None)
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                next_turn = self._scheduled[0][0] if self._scheduled else None
+                due = min(t for t in (next_arrival, next_turn, end) if t is not None)
+                if due > now:
+                    # Woken early when a conversation schedules its next turn
+                    self._condition.wait(due - now)
+                    continue
+                if due >= end:
+                    return
+                session = None
+                if next_turn is not None and next_turn == due:
+                    _, _, session = heapq.heappop(self._scheduled)
+            if session is not None:
+                self._request_executor.submit(self._send, session, due)
+            else:
+                self._arrive(due)
+                next_arrival = next(arrivals, None)
+
+    def run(self) -> Dict:
+        """Run the schedule, wait for requests in flight to finish and return the summary."""
+        self._request_executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="load-test-request")
+        self._user_executor = ThreadPoolExecutor(max_workers=self.user_concurrency, thread_name_prefix="load-test-user")
+
+        # Prepare the first users before starting the clock so the first arrivals are not skipped
+        self._top_up()
+        while self._fresh.qsize() < self.ready_conversations and self._fresh_pending > self._fresh.qsize():
+            time.sleep(0.05)
+
+        logger.info(f"Starting {self.mode} load test for {self.schedule.duration_seconds:.0f}s with {self.ready_conversations} users prepared")
+        start = time.monotonic()
+        try:
+            self._dispatch(start)
+        finally:
+            self._stopped.set()
+            self._request_executor.shutdown(wait=True)
+            self._user_executor.shutdown(wait=True)
+        duration_seconds = time.monotonic() - start
+
+        with self._condition:
+            self.report.increment("conversations_cut_off", len(self._scheduled) + len(self._continuing))
+        summary = {
+            "mode": self.mode,
+            "schedule": [asdict(stage) for stage in self.schedule.stages],
+            "duration_seconds": duration_seconds,
+            **self.report.summary(duration_seconds)
+        }
+        if summary["counters"].get("skipped_arrivals"):
+            logger.warning(f"{summary['counters']['skipped_arrivals']} arrivals were skipped because user simulation could not keep up; raise --user-concurrency or --ready-conversations")
+        return summary
+
+
+def format_summary(summary: Dict) -> str:
+    def number(value, scale=1000):
+        return "-" if value is None else f"{value * scale:.1f}"
+
+    lines = [f"{'':<18} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'max ms':>8}"]
+
+    def row(label, stats, errors):
+        lines.append(f"{label:<18} {stats['count']:>8} {sum(errors.values()):>6} {number(stats['p50']):>8} {number(stats['p99']):>8} {number(stats['p999']):>8} {number(stats['max']):>8}")
+
+    row("all", summary["response_time"], summary["errors"])
+    for turn, stats in summary["by_turn"].items():
+        row(f"turn {turn}", stats, stats["errors"])
+    for bucket, stats in summary["by_context_tokens"].items():
+        row(f"{bucket} tokens", stats, stats["errors"])
+    return "\n".join(lines)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--inference-endpoint-path", type=str, required=True, help="Path to YAML file specifying how to call your AI assistant via HTTP")
+    parser.add_argument("--replay-path", type=str, help="Path to recorded conversations (JSONL output of conversation_generator.py) whose user messages to replay")
+    parser.add_argument("--assistant-path", type=str, help="Path to YAML file containing assistant definition, to simulate users instead of replaying them")
+    parser.add_argument("--conversation-characters-path", type=str, help="Path to YAML or JSONL file containing the user personas to simulate")
+    parser.add_argument("--model-id", type=str, default="gpt-4o", help="Model ID for generating user messages")
+    parser.add_argument("--conversation-completion-query-model-id", type=str, default="o3", help="Model ID for determining when simulated conversations should end")
+    parser.add_argument("--max-conversation-turns", type=int, default=3, help="Maximum number of turns a simulated conversation can have")
+    parser.add_argument("--mode", type=str, choices=["conversations", "requests"], default="conversations", help="Whether the target rate counts new conversations or individual requests")
+    parser.add_argument("--rate", type=float, default=1.0, help="Target arrivals per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run at the target rate")
+    parser.add_argument("--ramp", type=str, help="Comma-separated duration:start_rate[:end_rate] stages, e.g. 60:1:10,300:10; overrides --rate and --duration")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Maximum concurrent requests to the endpoint")
+    parser.add_argument("--user-concurrency", type=int, default=16, help="Threads preparing user messages")
+    parser.add_argument("--ready-conversations", type=int, help="New conversations to keep prepared for arrivals (default: twice --user-concurrency)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between an assistant response and the user's next request in conversations mode")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for arrival times")
+    parser.add_argument("--output-path", type=str, help="Path to save the summary with latency percentiles and errors by turn and context length (JSON format)")
+    parser.add_argument("--hgrm-path", type=str, help="Path to save the overall response time percentile distribution in HdrHistogram text format")
+    parser.add_argument("--verbose", action="store_true", help="Log the progress of every simulated conversation and LLM call, not just the load test's own messages")
+    add_model_provider_arguments(parser, "simulating users")
+
+
+def check_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    if not args.replay_path and not (args.assistant_path and args.conversation_characters_path):
+        parser.error("Give --replay-path, or --assistant-path and --conversation-characters-path to simulate users")
+
+
+def logger_levels(args: argparse.Namespace) -> Dict[str, int]:
+    """Levels for configure_logging: per-request progress logs would swamp the output at load-test rates unless --verbose."""
+    if args.verbose:
+        return {}
+    return {"synthetic_conversation_generation": logging.WARNING, __name__: logging.INFO, "synthetic_conversation_generation.cli_support": logging.INFO}
+
+
+def run(args: argparse.Namespace):
+    provider_stack = None
+    if args.replay_path:
+        user_source = ReplayedUsers.from_jsonl(args.replay_path)
+    else:
+        # User simulation shares the rate limits, hedging and cache of every other command
+        provider_stack = create_model_provider_stack(args)
+        user_source = SimulatedUsers(
+            provider_stack.model_provider,
+            args.model_id,
+            args.conversation_completion_query_model_id,
+            Assistant.from_yaml(args.assistant_path),
+            list(iter_personas(args.conversation_characters_path)),
+            args.max_conversation_turns
+        )
+
+    schedule = ArrivalSchedule.parse(args.ramp, args.seed) if args.ramp else ArrivalSchedule([RampStage(args.duration, args.rate, args.rate)], args.seed)
+    inference_endpoint = InferenceEndpoint.from_yaml(args.inference_endpoint_path)
+    if inference_endpoint.pool_size < args.max_in_flight:
+        logger.warning(f"The endpoint's pool_size ({inference_endpoint.pool_size}) is below --max-in-flight; requests beyond it open short-lived connections")
+
+    load_test = LoadTest(inference_endpoint, user_source, schedule, args.mode, args.max_in_flight, args.user_concurrency, args.ready_conversations, args.think_time)
+    summary = load_test.run()
+    inference_endpoint.close()
+
+    print(format_summary(summary))
+    logger.info(f"Conversations: {summary['counters']}")
+    if provider_stack is not None:
+        provider_stack.log_summary()
+
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.hgrm_path:
+        with open(args.hgrm_path, "w") as f:
+            f.write(load_test.report.response_time.percentile_distribution() + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test an assistant endpoint with multi-turn conversations arriving at a target rate")
+    add_arguments(parser)
+    args = parser.parse_args()
+    check_arguments(parser, args)
+    configure_logging(logger_levels=logger_levels(args))
+    run(args)
@@ -0,0 +1,394 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import json
+import logging
+import math
+import pstats
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+
+logger = logging.getLogger(__name__)
+
+
+# Pipeline stage the current call belongs to, e.g. user_message, completion_check, persona or assistant
+_current_stage: ContextVar[Optional[str]] = ContextVar("stage", default=None)
+# (trace_id, span_id) of the innermost open span
+_current_span: ContextVar[Optional[Tuple[str, str]]] = ContextVar("span", default=None)
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def current_stage() -> str:
+    return _current_stage.get() or "unknown"
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Attribute every call made inside the block to a pipeline stage."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    sorted_values = sorted(values)
+    summary = {
+        "count": len(sorted_values),
+        "sum": sum(sorted_values),
+        "mean": sum(sorted_values) / len(sorted_values) if sorted_values else None,
+        "max": sorted_values[-1] if sorted_values else None
+    }
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(sorted_values, q)
+    return summary
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def load_prices(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Load model prices from a YAML file mapping each model ID to USD per million tokens.
+
+    Example:
+        gpt-4o: {input: 2.5, cached_input: 1.25, output: 10}
+    """
+    with open(path, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+
+class MetricsRecorder:
+    """
+    Thread-safe collector of per-call latency, token usage, retries and conversation outcomes.
+
+    Calls are timed with span(), which attributes them to the current stage and, when
+    span_path is given, also appends an OpenTelemetry-style span record per call to a
+    JSONL file. Spans opened inside another span share its trace, so each conversation
+    forms one trace.
+    """
+
+    def __init__(self, span_path: Optional[str] = None, prices: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        Args:
+            span_path: Path to a JSONL file to append one span per timed call to
+            prices: USD per million input, cached_input and output tokens, by model ID
+        """
+        self.prices = prices or {}
+        self.started_at = time.time()
+        self.durations: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.retries: Counter = Counter()
+        self.tokens: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        self.prompt_cpu_seconds: Dict[str, float] = defaultdict(float)
+        self.counters: Counter = Counter()
+        self.terminations: Counter = Counter()
+        self.conversation_turns: List[int] = []
+        self._lock = threading.Lock()
+        self._span_file = open(span_path, "a") if span_path else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Time the block as one call; attributes added to the yielded dict are exported with the span."""
+        parent = _current_span.get()
+        trace_id = parent[0] if parent is not None else uuid.uuid4().hex
+        span_id = uuid.uuid4().hex[:16]
+        token = _current_span.set((trace_id, span_id))
+        stage_name = current_stage()
+        start_time = time.time_ns()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            _current_span.reset(token)
+            with self._lock:
+                self.durations[(name, stage_name)].append(duration)
+                if error is not None:
+                    self.errors[(name, stage_name)] += 1
+                if self._span_file is not None:
+                    self._span_file.write(json.dumps({
+                        "trace_id": trace_id,
+                        "span_id": span_id,
+                        "parent_span_id": parent[1] if parent is not None else None,
+                        "name": name,
+                        "start_time_unix_nano": start_time,
+                        "end_time_unix_nano": start_time + int(duration * 1e9),
+                        "attributes": {"stage": stage_name, **attributes},
+                        "status": {"code": "ERROR", "message": str(error)} if error is not None else {"code": "OK"}
+                    }, default=str) + "\n")
+
+    def record_latency(self, name: str, seconds: float):
+        """Record a latency measured inside a call, such as time to first token, alongside the timed calls."""
+        with self._lock:
+            self.durations[(name, current_stage())].append(seconds)
+
+    def record_tokens(self, model_id: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0):
+        with self._lock:
+            tokens = self.tokens[(current_stage(), model_id)]
+            tokens["requests"] += 1
+            tokens["input_tokens"] += input_tokens
+            tokens["output_tokens"] += output_tokens
+            tokens["cached_input_tokens"] += cached_input_tokens
+
+    def record_retry(self, error_kind: str):
+        with self._lock:
+            self.retries[(current_stage(), error_kind)] += 1
+
+    def record_prompt_cpu(self, seconds: float):
+        with self._lock:
+            self.prompt_cpu_seconds[current_stage()] += seconds
+
+    def increment(self, name: str, amount: float = 1):
+        with self._lock:
+            self.counters[(name, current_stage())] += amount
+
+    def record_termination(self, conversation_id: str, reason: str, turns: int):
+        logger.debug(f"Conversation {conversation_id} ended after {turns} turns: {reason}")
+        with self._lock:
+            self.terminations[reason] += 1
+            self.conversation_turns.append(turns)
+
+    def cost(self, model_id: str, tokens: Counter) -> Optional[float]:
+        """USD cost of the given token counts, or None if the model has no price."""
+        prices = self.prices.get(model_id)
+        if prices is None:
+            return None
+        uncached_input_tokens = tokens["input_tokens"] - tokens["cached_input_tokens"]
+        return (
+            uncached_input_tokens * prices.get("input", 0)
+            + tokens["cached_input_tokens"] * prices.get("cached_input", prices.get("input", 0))
+            + tokens["output_tokens"] * prices.get("output", 0)
+        ) / 1_000_000
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate everything recorded so far into a JSON-serializable run summary."""
+        with self._lock:
+            calls: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+            for (name, stage_name), durations in sorted(self.durations.items()):
+                calls[name][stage_name] = {**distribution(durations), "errors": self.errors[(name, stage_name)]}
+
+            tokens: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+            cost_by_stage: Dict[str, float] = defaultdict(float)
+            for (stage_name, model_id), counts in sorted(self.tokens.items()):
+                cost = self.cost(model_id, counts)
+                tokens[stage_name][model_id] = {**counts, "cost_usd": cost}
+                if cost is not None:
+                    cost_by_stage[stage_name] += cost
+
+            retries: Dict[str, Dict[str, int]] = defaultdict(dict)
+            for (stage_name, error_kind), count in sorted(self.retries.items()):
+                retries[stage_name][error_kind] = count
+
+            counters: Dict[str, Dict[str, float]] = defaultdict(dict)
+            for (name, stage_name), value in sorted(self.counters.items()):
+                counters[name][stage_name] = value
+
+            return {
+                "wall_seconds": time.time() - self.started_at,
+                "calls": dict(calls),
+                "tokens": dict(tokens),
+                "cost_usd": dict(cost_by_stage),
+                "retries": dict(retries),
+                "prompt_cpu_seconds": dict(self.prompt_cpu_seconds),
+                "counters": dict(counters),
+                "terminations": dict(self.terminations),
+                "conversation_turns": distribution(self.conversation_turns)
+            }
+
+    def latency_overview(self) -> Dict[str, Dict[str, float]]:
+        """Compact per-call, per-stage latency overview for logging at the end of a run."""
+        return {
+            f"{name}/{stage_name}": {key: round(stats[key], 3) for key in ("count", "sum", "p50", "p95")}
+            for name, stages in self.summary()["calls"].items() for stage_name, stats in stages.items()
+        }
+
+    def write_summary(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path: str, prefix: str = "synthetic_conversation"):
+        """Write the run summary in the Prometheus text exposition format, e.g. for the node exporter textfile collector."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: List[Tuple[str, Dict[str, str], float]]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}")
+
+        duration_samples = []
+        error_samples = []
+        for name, stages in summary["calls"].items():
+            for stage_name, stats in stages.items():
+                labels = {"call": name, "stage": stage_name}
+                for q in PERCENTILES:
+                    duration_samples.append(("", {**labels, "quantile": str(q / 100)}, stats[f"p{q}"]))
+                duration_samples.append(("_sum", labels, stats["sum"]))
+                duration_samples.append(("_count", labels, stats["count"]))
+                error_samples.append(("", labels, stats["errors"]))
+        metric("call_duration_seconds", "summary", "Latency of each call by pipeline stage.", duration_samples)
+        metric("call_errors_total", "counter", "Calls that raised, by pipeline stage.", error_samples)
+
+        token_samples = []
+        cost_samples = []
+        for stage_name, models in summary["tokens"].items():
+            for model_id, counts in models.items():
+                for token_type in ("input_tokens", "output_tokens", "cached_input_tokens"):
+                    token_samples.append(("", {"stage": stage_name, "model_id": model_id, "type": token_type}, counts.get(token_type, 0)))
+                if counts["cost_usd"] is not None:
+                    cost_samples.append(("", {"stage": stage_name, "model_id": model_id}, counts["cost_usd"]))
+        metric("tokens_total", "counter", "Tokens reported by the model provider.", token_samples)
+        metric("cost_usd_total", "counter", "Estimated spend from the configured model prices.", cost_samples)
+
+        metric("retries_total", "counter", "LLM query attempts that were retried, by error kind.", [
+            ("", {"stage": stage_name, "error_kind": error_kind}, count)
+            for stage_name, kinds in summary["retries"].items() for error_kind, count in kinds.items()
+        ])
+        metric("prompt_cpu_seconds_total", "counter", "CPU time spent building prompts.", [
+            ("", {"stage": stage_name}, seconds) for stage_name, seconds in summary["prompt_cpu_seconds"].items()
+        ])
+        metric("events_total", "counter", "Other counted events.", [
+            ("", {"event": name, "stage": stage_name}, value)
+            for name, stages in summary["counters"].items() for stage_name, value in stages.items()
+        ])
+        metric("conversation_terminations_total", "counter", "Finished conversations by why they ended.", [
+            ("", {"reason": reason}, count) for reason, count in summary["terminations"].items()
+        ])
+
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._span_file is not None:
+                self._span_file.close()
+                self._span_file = None
+
+
+class ThreadProfiler:
+    """
+    cProfile of local CPU time across the calling thread and every thread started while it runs.
+
+    Before Python 3.12, cProfile only profiles the thread that enables it, so a profiler is
+    started in each new worker thread and their stats are merged when the run ends. Profiles
+    measure thread CPU time, so time spent waiting on the network does not drown out prompt
+    building and parsing.
+
+    From Python 3.12, cProfile is built on sys.monitoring, which sees every thread but allows
+    only one active profiler, so a single process-wide profiler measuring process CPU time is
+    used instead. Its per-function totals are still meaningful, but calls from different
+    threads share one call stack, so caller and callee attribution is approximate.
+    """
+
+    # Whether one enabled profiler sees every thread, and a second one cannot be enabled
+    PROCESS_WIDE = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _start_thread_profile(self, *args):
+        profile = cProfile.Profile(time.thread_time)
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self.PROCESS_WIDE:
+            profile = cProfile.Profile(time.process_time)
+            self._profiles.append(profile)
+            profile.enable()
+            return
+        threading.setprofile(self._start_thread_profile)
+        self._start_thread_profile()
+
+    def stop(self, path: str):
+        """Stop profiling and write the merged stats to path, readable with pstats or snakeviz."""
+        if not self.PROCESS_WIDE:
+            threading.setprofile(None)
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(path)
+
+
+# Recorder the pipeline's instrumentation hooks report to; nothing is recorded until one is set
+_recorder: Optional[MetricsRecorder] = None
+
+
+def set_recorder(recorder: Optional[MetricsRecorder]):
+    global _recorder
+    _recorder = recorder
+
+
+def get_recorder() -> Optional[MetricsRecorder]:
+    return _recorder
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    recorder = _recorder
+    if recorder is None:
+        yield attributes
+        return
+    with recorder.span(name, **attributes) as span_attributes:
+        yield span_attributes
+
+
+def record_latency(name: str, seconds: float):
+    if _recorder is not None:
+        _recorder.record_latency(name, seconds)
+
+
+def record_tokens(model_id: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0):
+    if _recorder is not None:
+        _recorder.record_tokens(model_id, input_tokens, output_tokens, cached_input_tokens)
+
+
+def record_retry(error_kind: str):
+    if _recorder is not None:
+        _recorder.record_retry(error_kind)
+
+
+def record_prompt_cpu(seconds: float):
+    if _recorder is not None:
+        _recorder.record_prompt_cpu(seconds)
+
+
+def increment(name: str, amount: float = 1):
+    if _recorder is not None:
+        _recorder.increment(name, amount)
+
+
+def record_termination(conversation_id: str, reason: str, turns: int):
+    if _recorder is not None:
+        _recorder.record_termination(conversation_id, reason, turns)
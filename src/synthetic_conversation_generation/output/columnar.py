@@ -0,0 +1,290 @@
+import argparse
+from datetime import datetime
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from synthetic_conversation_generation.cli_support import configure_logging
+from synthetic_conversation_generation.data_models.conversation import Conversation, Message, MessageTiming, ROLE
+from synthetic_conversation_generation.output.conversation_writer import ConversationWriter
+
+
+logger = logging.getLogger(__name__)
+
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+TIMING_COLUMNS = ["total_seconds", "time_to_first_token_seconds", "mean_inter_token_seconds", "max_inter_token_seconds", "tokens"]
+
+# Conversation metadata that has its own column, e.g. the cell of an experiment run
+METADATA_COLUMNS = ["endpoint", "repetition"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow output need pyarrow: pip install 'synthetic_conversation_generation[arrow]'") from e
+    return pyarrow
+
+
+def message_schema():
+    """One row per message, in conversation order."""
+    pa = _pyarrow()
+    return pa.schema([
+        ("conversation_id", pa.string()),
+        ("persona_name", pa.string()),
+        ("endpoint", pa.string()),
+        ("repetition", pa.int32()),
+        ("parent_id", pa.string()),
+        ("branch_id", pa.string()),
+        ("turn_index", pa.int32()),
+        ("message_index", pa.int32()),
+        ("role", pa.string()),
+        ("content", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("total_seconds", pa.float64()),
+        ("time_to_first_token_seconds", pa.float64()),
+        ("mean_inter_token_seconds", pa.float64()),
+        ("max_inter_token_seconds", pa.float64()),
+        ("tokens", pa.int32()),
+    ])
+
+
+def detect_format(path: str) -> str:
+    """Tell Parquet and Arrow IPC files apart by their magic bytes."""
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic[:4] == b"PAR1":
+        return "parquet"
+    if magic == b"ARROW1":
+        return "arrow"
+    raise ValueError(f"{path} is neither a Parquet nor an Arrow IPC file")
+
+
+class ColumnarConversationWriter(ConversationWriter):
+    """
+    Writes conversations as a columnar dataset with one row per message.
+
+    Rows are buffered and written as a Parquet row group or Arrow record batch once
+    row_group_size rows have accumulated, so memory stays bounded however long the run.
+    Unlike the JSONL writer, the file is only readable once the writer is closed; for
+    runs that may crash, write JSONL and convert it afterwards.
+    """
+
+    def __init__(self, output_path: str, file_format: str = "parquet", row_group_size: int = 50_000, compression: Optional[str] = None):
+        """
+        Args:
+            output_path: Path to the Parquet or Arrow IPC file to create
+            file_format: "parquet" or "arrow"
+            row_group_size: Messages to buffer before writing a row group or record batch
+            compression: Codec name (default: zstd for Parquet, none for Arrow so the file can be memory-mapped without decompression)
+        """
+        if file_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format '{file_format}', expected one of {', '.join(COLUMNAR_FORMATS)}")
+        pa = _pyarrow()
+        self.output_path = output_path
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.schema = message_schema()
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.schema.names}
+        self._rows = 0
+        self._lock = threading.Lock()
+
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+            self._sink = None
+            self._writer = pq.ParquetWriter(output_path, self.schema, compression=compression or "zstd")
+        else:
+            import pyarrow.ipc
+            self._sink = pa.OSFile(output_path, "wb")
+            self._writer = pyarrow.ipc.new_file(self._sink, self.schema, options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+
+    def write(self, conversation: Conversation, metadata: Optional[Dict[str, Any]] = None):
+        metadata = metadata or {}
+        unknown = set(metadata) - set(METADATA_COLUMNS)
+        if unknown:
+            raise ValueError(f"Columnar output has no column for metadata {', '.join(sorted(unknown))}")
+
+        with self._lock:
+            turn_index = -1
+            for message_index, message in enumerate(conversation.messages):
+                if message.role == ROLE.user or turn_index < 0:
+                    turn_index += 1
+                timing = message.timing
+                row = {
+                    "conversation_id": conversation.id,
+                    "persona_name": conversation.user_id,
+                    "endpoint": metadata.get("endpoint"),
+                    "repetition": metadata.get("repetition"),
+                    "parent_id": conversation.parent_id,
+                    "branch_id": conversation.branch_id,
+                    "turn_index": turn_index,
+                    "message_index": message_index,
+                    "role": message.role.name,
+                    "content": message.content,
+                    "timestamp": message.timestamp,
+                    **{name: getattr(timing, name) if timing is not None else None for name in TIMING_COLUMNS}
+                }
+                for name, value in row.items():
+                    self._columns[name].append(value)
+            self._rows += len(conversation.messages)
+            if self._rows >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        if self._rows == 0:
+            return
+        pa = _pyarrow()
+        self._writer.write_table(pa.Table.from_pydict(self._columns, schema=self.schema))
+        self._columns = {name: [] for name in self.schema.names}
+        self._rows = 0
+
+    def close(self):
+        with self._lock:
+            if self._writer is None:
+                return
+            self._flush()
+            self._writer.close()
+            self._writer = None
+            if self._sink is not None:
+                self._sink.close()
+
+
+class ColumnarConversationReader:
+    """
+    Reads a Parquet or Arrow IPC conversation dataset written by ColumnarConversationWriter.
+
+    Files are memory-mapped, and filters are pushed down to the scan, so only the
+    matching row groups and requested columns are read; Parquet row groups whose
+    statistics rule out a filter are skipped entirely.
+    """
+
+    def __init__(self, path: str):
+        _pyarrow()
+        import pyarrow.dataset as ds
+        import pyarrow.fs
+
+        self.path = path
+        self.file_format = detect_format(path)
+        self.dataset = ds.dataset(path, format="parquet" if self.file_format == "parquet" else "ipc", filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+    def _filter(self, conversation_ids: Optional[Iterable[str]] = None, persona_names: Optional[Iterable[str]] = None, turns: Optional[Iterable[int]] = None, roles: Optional[Iterable[ROLE]] = None, endpoints: Optional[Iterable[str]] = None, parent_ids: Optional[Iterable[str]] = None):
+        import pyarrow.dataset as ds
+
+        expression = None
+        for column, values in (
+            ("conversation_id", conversation_ids),
+            ("persona_name", persona_names),
+            ("turn_index", turns),
+            ("role", [role.name for role in roles] if roles is not None else None),
+            ("endpoint", endpoints),
+            ("parent_id", parent_ids),
+        ):
+            if values is None:
+                continue
+            condition = ds.field(column).isin(list(values))
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def messages(self, columns: Optional[List[str]] = None, batch_size: int = 65_536, **filters) -> Iterator[Any]:
+        """
+        Scan matching messages without materialising whole conversations.
+
+        Args:
+            columns: Columns to read (default: all)
+            batch_size: Maximum rows per record batch
+            **filters: Any of conversation_ids, persona_names, turns, roles, endpoints and parent_ids, each a collection of accepted values
+
+        Yields:
+            pyarrow RecordBatches of matching rows
+        """
+        yield from self.dataset.to_batches(columns=columns, filter=self._filter(**filters), batch_size=batch_size)
+
+    def table(self, columns: Optional[List[str]] = None, **filters) -> Any:
+        """Matching messages as one pyarrow Table, taking the same filters as messages()."""
+        return self.dataset.to_table(columns=columns, filter=self._filter(**filters))
+
+    def conversations(self, **filters) -> Iterator[Conversation]:
+        """
+        Rebuild Conversation objects from the dataset, in file order.
+
+        A turn filter yields conversations holding only the messages of those turns.
+        """
+        conversation = None
+        for batch in self.messages(**filters):
+            for row in batch.to_pylist():
+                if conversation is None or row["conversation_id"] != conversation.id:
+                    if conversation is not None:
+                        yield conversation
+                    conversation = Conversation(id=row["conversation_id"], user_id=row["persona_name"], messages=[], parent_id=row.get("parent_id"), branch_id=row.get("branch_id"))
+                conversation.messages.append(Message(
+                    role=ROLE[row["role"]],
+                    content=row["content"],
+                    timestamp=row["timestamp"],
+                    message_id=row["message_index"],
+                    timing=MessageTiming(**{name: row[name] for name in TIMING_COLUMNS}) if row["total_seconds"] is not None else None
+                ))
+        if conversation is not None:
+            yield conversation
+
+    def count_rows(self, **filters) -> int:
+        return self.dataset.count_rows(filter=self._filter(**filters))
+
+
+def convert_jsonl(jsonl_path: str, output_path: str, file_format: str = "parquet", row_group_size: int = 50_000) -> int:
+    """
+    Convert a JSONL conversation file into a columnar dataset.
+
+    Records without a conversation_id are numbered by line, and messages without
+    timestamps get a null timestamp.
+
+    Returns:
+        Number of conversations converted
+    """
+    converted = 0
+    with open(jsonl_path, "r") as f, ColumnarConversationWriter(output_path, file_format, row_group_size) as writer:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            conversation = Conversation(
+                id=str(record.get("conversation_id", line_number)),
+                user_id=record.get("persona_name", ""),
+                messages=[
+                    Message(
+                        role=ROLE[message["role"]],
+                        content=message["content"],
+                        timestamp=datetime.fromisoformat(message["timestamp"]) if message.get("timestamp") else None,
+                        message_id=message_index,
+                        timing=MessageTiming(**message["timing"]) if message.get("timing") else None
+                    )
+                    for message_index, message in enumerate(record["messages"])
+                ],
+                parent_id=record.get("parent_id"),
+                branch_id=record.get("branch_id")
+            )
+            writer.write(conversation, {key: record[key] for key in METADATA_COLUMNS if key in record})
+            converted += 1
+    return converted
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--input-path", type=str, required=True, help="Path to JSONL conversations, as written by conversation_generator.py")
+    parser.add_argument("--output-path", type=str, required=True, help="Path to write the columnar dataset")
+    parser.add_argument("--format", type=str, choices=COLUMNAR_FORMATS, default="parquet", help="Parquet for compact storage, Arrow IPC for zero-copy memory-mapped reads")
+    parser.add_argument("--row-group-size", type=int, default=50_000, help="Messages per row group or record batch")
+
+
+def run(args: argparse.Namespace):
+    converted = convert_jsonl(args.input_path, args.output_path, args.format, args.row_group_size)
+    logger.info(f"Converted {converted} conversations to {args.output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSONL conversations into a columnar Parquet or Arrow IPC dataset")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging()
+    run(args)
@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Set
+
+from synthetic_conversation_generation.data_models.conversation import Conversation
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationWriter(ABC):
+    """Base class for writers that persist conversations as soon as they are generated."""
+
+    @abstractmethod
+    def write(self, conversation: Conversation, metadata: Optional[Dict[str, Any]] = None):
+        """Persist a conversation, tagged with any extra metadata fields such as its experiment cell."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def conversation_to_record(conversation: Conversation, metadata: Optional[Dict[str, Any]] = None) -> Dict:
+    """Convert a conversation into the JSONL output record."""
+    return {
+        "conversation_id": conversation.id,
+        **({"parent_id": conversation.parent_id, "branch_id": conversation.branch_id} if conversation.branch_id is not None else {}),
+        **(metadata or {}),
+        "persona_name": conversation.user_id,
+        "messages": [
+            {"role": message.role.name, "content": message.content, **({"timing": asdict(message.timing)} if message.timing is not None else {})}
+            for message in conversation.messages
+        ]
+    }
+
+
+class JSONLConversationWriter(ConversationWriter):
+    """
+    Appends one JSON line per conversation and syncs it to disk before returning.
+
+    Each line is written with a single append-mode write, so concurrent writers never
+    interleave and a crash can leave at most one torn final line, which
+    `load_conversation_ids` repairs on resume.
+    """
+
+    def __init__(self, output_path: str, append: bool = False, fsync: bool = True):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if not append:
+            flags |= os.O_TRUNC
+        self.output_path = output_path
+        self.fsync = fsync
+        self._fd = os.open(output_path, flags, 0o644)
+        self._lock = threading.Lock()
+
+    def write(self, conversation: Conversation, metadata: Optional[Dict[str, Any]] = None):
+        line = (json.dumps(conversation_to_record(conversation, metadata)) + "\n").encode("utf-8")
+        with self._lock:
+            written = 0
+            while written < len(line):
+                written += os.write(self._fd, line[written:])
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def create_conversation_writer(output_path: str, output_format: str = "jsonl", append: bool = False, fsync: bool = True) -> ConversationWriter:
+    """
+    Open a writer for the given output format.
+
+    Args:
+        output_path: Path to the output file
+        output_format: "jsonl", or "parquet" or "arrow" for a columnar dataset with one row per message (requires pyarrow)
+        append: Append to an existing JSONL file instead of overwriting it; columnar files cannot be appended to
+        fsync: Sync each JSONL line to disk before returning
+
+    Returns:
+        ConversationWriter instance
+    """
+    if output_format == "jsonl":
+        return JSONLConversationWriter(output_path, append=append, fsync=fsync)
+
+    from synthetic_conversation_generation.output.columnar import ColumnarConversationWriter
+    if append:
+        raise ValueError(f"Cannot append to {output_format} output")
+    return ColumnarConversationWriter(output_path, output_format)
+
+
+def load_conversation_ids(output_path: str) -> Set[str]:
+    """
+    Index the conversation ids already written to a JSONL output file.
+
+    A torn final line left behind by a crash is truncated away so that new
+    conversations can be appended cleanly.
+
+    Args:
+        output_path: Path to an existing JSONL output file
+
+    Returns:
+        Set of conversation ids present in the file
+    """
+    conversation_ids = set()
+    if not os.path.exists(output_path):
+        return conversation_ids
+
+    valid_length = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_length += len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed record in {output_path}")
+                continue
+            if "conversation_id" in record:
+                conversation_ids.add(str(record["conversation_id"]))
+
+    if valid_length < os.path.getsize(output_path):
+        logger.warning(f"Truncating incomplete trailing record in {output_path}")
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_length)
+
+    return conversation_ids
+
+
+def drop_conversations(output_path: str, conversation_ids: Set[str]) -> int:
+    """
+    Remove conversations from a JSONL output file, e.g. ones that must be generated again.
+
+    The remaining records are written to a temporary file next to the output file, which
+    then replaces it, so a crash leaves either the old or the new file in place.
+
+    Args:
+        output_path: Path to an existing JSONL output file
+        conversation_ids: Ids of the conversations to remove
+
+    Returns:
+        Number of records removed
+    """
+    dropped = 0
+    temporary_path = f"{output_path}.tmp"
+    with open(output_path, "rb") as source, open(temporary_path, "wb") as destination:
+        for line in source:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {}
+            if str(record.get("conversation_id")) in conversation_ids:
+                dropped += 1
+                continue
+            destination.write(line)
+        destination.flush()
+        os.fsync(destination.fileno())
+    os.replace(temporary_path, output_path)
+    return dropped
@@ -0,0 +1,51 @@
+from dataclasses import asdict
+import json
+import threading
+
+import yaml
+
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.conversation_characters import YAML_DUMPER
+
+
+class PersonaWriter:
+    """
+    Appends personas to a file as they are generated, so a long run keeps everything accepted so far.
+
+    Files ending in .jsonl get one JSON object per line; anything else is written as
+    the YAML `users` list read by ConversationCharacters.from_yaml and iter_personas.
+    Each persona is flushed as soon as it is written.
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.is_jsonl = output_path.endswith('.jsonl')
+        self.count = 0
+        self._file = open(output_path, 'w')
+        self._lock = threading.Lock()
+
+    def write(self, persona: CharacterCard):
+        if self.is_jsonl:
+            content = json.dumps(asdict(persona)) + '\n'
+        else:
+            # A top-level one-item list dumps as a `- ` entry that continues the users list
+            content = ('users:\n' if self.count == 0 else '') + yaml.dump([asdict(persona)], Dumper=YAML_DUMPER, sort_keys=False)
+        with self._lock:
+            self._file.write(content)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            if self.count == 0 and not self.is_jsonl:
+                self._file.write('users: []\n')
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,82 +1,163 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import yaml
 
-from anthropic import Anthropic
-from openai import OpenAI
-
+from synthetic_conversation_generation.cli_support import RunMetrics, add_metrics_arguments, add_model_provider_arguments, configure_logging, create_model_provider_stack
 from synthetic_conversation_generation.data_models.assistant import Assistant
 from synthetic_conversation_generation.data_models.character_card import CharacterCard
-from synthetic_conversation_generation.data_models.conversation_characters import ConversationCharacters
+from synthetic_conversation_generation.data_models.conversation_characters import iter_personas
 
-from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider, OpenAIModelProvider, AnthropicModelProvider
+from synthetic_conversation_generation.llm_queries.batch import BatchBackend, create_batch_backend
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
 from synthetic_conversation_generation.llm_queries.user_persona_query import UserPersonaQuery
+from synthetic_conversation_generation.output.persona_writer import PersonaWriter
+from synthetic_conversation_generation.similarity import NearDuplicateDetector, PersonaIndex
 
-# Configure root logger to WARNING to silence third-party libraries
-logging.basicConfig(
-    level=logging.WARNING,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-# Set loggers within this application to INFO
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-logging.getLogger('openai').setLevel(logging.WARNING)
-logging.getLogger('anthropic').setLevel(logging.WARNING)
 
 
 class PersonaGenerator:
     
-    def __init__(self, model_provider: ModelProvider, model_id: str, assistant: Assistant, previous_personas: List[CharacterCard]):
+    def __init__(self, model_provider: ModelProvider, model_id: str, assistant: Assistant, previous_personas: List[CharacterCard], max_full_personas: Optional[int] = None, max_summarized_personas: int = 100):
         self.model_provider = model_provider
         self.model_id = model_id
         self.assistant = assistant
         self.previous_personas = previous_personas
-
-    def generate_persona(self) -> CharacterCard:
-        user_persona_generator = UserPersonaQuery(self.model_provider, self.model_id, self.assistant, self.previous_personas)
-        return user_persona_generator.query(max_retries=1, timeout=120)
-
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+        self.max_full_personas = max_full_personas
+        self.max_summarized_personas = max_summarized_personas
+        self.persona_index = PersonaIndex() if max_full_personas is not None else None
+
+    def persona_query(self, previous_personas: Optional[List[CharacterCard]] = None, request_number: Optional[int] = None) -> UserPersonaQuery:
+        if previous_personas is None:
+            previous_personas = self.previous_personas
+        return UserPersonaQuery(self.model_provider, self.model_id, self.assistant, previous_personas, self.max_full_personas, self.persona_index, request_number, self.max_summarized_personas)
+
+    def generate_persona(self, previous_personas: Optional[List[CharacterCard]] = None, request_number: Optional[int] = None) -> CharacterCard:
+        return self.persona_query(previous_personas, request_number).query(max_retries=1, timeout=120)
+
+    def _run_wave(self, executor: ThreadPoolExecutor, batch_backend: Optional[BatchBackend], snapshot: List[CharacterCard], request_numbers: List[Optional[int]]) -> Iterator[Optional[CharacterCard]]:
+        """Yield each persona of a wave as it becomes available, or None for each failed request."""
+        if batch_backend is not None:
+            yield from batch_backend.run_queries([self.persona_query(snapshot, request_number) for request_number in request_numbers], max_retries=1)
+            return
+
+        futures = [executor.submit(self.generate_persona, snapshot, request_number) for request_number in request_numbers]
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(f"Persona generation failed: {e}")
+                yield None
+
+    def generate_personas(self, num_personas: int, concurrency: int = 1, similarity_threshold: Optional[float] = None, max_rejections: Optional[int] = None, batch_backend: Optional[BatchBackend] = None) -> Iterator[CharacterCard]:
+        """
+        Generate personas in concurrent waves, each wave prompted with a snapshot of the accepted pool.
+
+        Personas generated within the same wave cannot see each other, so when a similarity
+        threshold is given each new persona is checked against every accepted persona and
+        near-duplicates are rejected and regenerated in a later wave. Accepted personas are
+        appended to previous_personas.
+
+        Args:
+            num_personas: Number of personas to accept
+            concurrency: Maximum number of persona queries per wave
+            similarity_threshold: Estimated Jaccard similarity at or above which a persona is rejected
+            max_rejections: Maximum number of rejected or failed personas before giving up (default: num_personas)
+            batch_backend: Submit each wave as one batch job instead of concurrent queries
+
+        Yields:
+            Each accepted persona
+        """
+        if max_rejections is None:
+            max_rejections = num_personas
+
+        duplicate_detector = None
+        if similarity_threshold is not None:
+            duplicate_detector = NearDuplicateDetector(threshold=similarity_threshold)
+            duplicate_detector.update(self.previous_personas)
+
+        accepted = 0
+        rejections = 0
+        requests = 0
+        # Number parallel and regenerated requests so they never share an identical (and identically cached) prompt
+        number_requests = concurrency > 1 or duplicate_detector is not None
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while accepted < num_personas:
+                if rejections > max_rejections:
+                    raise Exception(f"Gave up after {rejections} rejected or failed personas; accepted {accepted} of {num_personas}")
+
+                snapshot = list(self.previous_personas)
+                wave_size = min(concurrency, num_personas - accepted)
+                request_numbers = [requests + i + 1 if number_requests else None for i in range(wave_size)]
+                requests += wave_size
+
+                for persona in self._run_wave(executor, batch_backend, snapshot, request_numbers):
+                    if persona is None:
+                        rejections += 1
+                        continue
+
+                    if duplicate_detector is not None:
+                        duplicate = duplicate_detector.find_duplicate(persona)
+                        if duplicate is not None:
+                            rejections += 1
+                            logger.info(f"Rejected {persona.name} as a near-duplicate of {duplicate[0].name} (similarity {duplicate[1]:.2f})")
+                            continue
+                        duplicate_detector.add(persona)
+
+                    self.previous_personas.append(persona)
+                    accepted += 1
+                    logger.info(f"Accepted persona {accepted} of {num_personas}: {persona.name}")
+                    yield persona
+
+
+def add_arguments(parser: argparse.ArgumentParser):
     parser.add_argument("--assistant-path", type=str, required=True, help="Path to YAML file containing assistant definition")
     parser.add_argument("--num-personas", type=int, default=5, help="Number of user personas to generate")
-    parser.add_argument("--output-path", type=str, required=True, help="Path to save the generated personas (YAML format)")
-    parser.add_argument("--model-provider", type=str, choices=["openai", "anthropic"], default="openai", help="LLM provider to use for generating personas")
+    parser.add_argument("--output-path", type=str, required=True, help="Path to save the generated personas as they are accepted (JSONL if it ends in .jsonl, YAML otherwise)")
     parser.add_argument("--model-id", type=str, default="o3", help="Model ID for persona generation")
-    parser.add_argument("--previous-personas-path", type=str, help="Path to YAML file containing previous personas to avoid duplication")
-    args = parser.parse_args()
-
-    if args.model_provider == "openai":
-        openai_client = OpenAI()
-        model_provider = OpenAIModelProvider(openai_client)
-    else:
-        anthropic_client = Anthropic()
-        model_provider = AnthropicModelProvider(anthropic_client)
+    parser.add_argument("--previous-personas-path", type=str, help="Path to YAML or JSONL file containing previous personas to avoid duplication")
+    parser.add_argument("--max-full-personas", type=int, help="Include full definitions for only this many previous personas, the neighbours of one picked per request, and summaries of the next most similar")
+    parser.add_argument("--max-summarized-personas", type=int, default=100, help="Most previous personas to summarize when --max-full-personas is set")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of personas to generate at once in each wave")
+    parser.add_argument("--similarity-threshold", type=float, help="Reject and regenerate personas whose estimated Jaccard similarity to an accepted persona is at or above this value")
+    parser.add_argument("--batch", action="store_true", help="Submit each wave of --concurrency persona queries as one job through the provider's batch API")
+    parser.add_argument("--batch-poll-interval", type=float, default=60, help="Seconds between batch status checks in batch mode")
+    add_model_provider_arguments(parser, "generating personas")
+    add_metrics_arguments(parser)
+
+
+def load_previous_personas(previous_personas_path: Optional[str]) -> List[CharacterCard]:
+    if not previous_personas_path:
+        return []
+    logger.info(f"Loading previous personas from {previous_personas_path}")
+    previous_personas = list(iter_personas(previous_personas_path))
+    logger.info(f"Loaded {len(previous_personas)} previous personas")
+    return previous_personas
+
+
+def run(args: argparse.Namespace):
+    run_metrics = RunMetrics(args)
+    provider_stack = create_model_provider_stack(args)
+    batch_backend = create_batch_backend(provider_stack.base_provider, args.batch_poll_interval) if args.batch else None
 
     assistant = Assistant.from_yaml(args.assistant_path)
+    persona_generator = PersonaGenerator(provider_stack.model_provider, args.model_id, assistant, load_previous_personas(args.previous_personas_path), args.max_full_personas, args.max_summarized_personas)
+    
+    # Save only the new personas, each as soon as it is accepted
+    with PersonaWriter(args.output_path) as persona_writer:
+        for persona in persona_generator.generate_personas(args.num_personas, args.concurrency, args.similarity_threshold, batch_backend=batch_backend):
+            persona_writer.write(persona)
+    logger.info(f"Saved {persona_writer.count} personas to {args.output_path}")
 
-    # Load previous personas if provided
-    previous_personas = []
-    if args.previous_personas_path:
-        logger.info(f"Loading previous personas from {args.previous_personas_path}")
-        conversation_characters = ConversationCharacters.from_yaml(args.previous_personas_path)
-        previous_personas = conversation_characters.users
-        logger.info(f"Loaded {len(previous_personas)} previous personas")
+    provider_stack.log_summary()
+    run_metrics.finish()
 
-    persona_generator = PersonaGenerator(model_provider, args.model_id, assistant, previous_personas)
-    
-    # Generate new personas
-    new_personas = []
-    for i in range(args.num_personas):
-        print(f"Generating persona {i+1} of {args.num_personas}")
-        persona = persona_generator.generate_persona()
-        new_personas.append(persona)
-        persona_generator.previous_personas.append(persona)
-
-    # Save only the new personas to the output file
-    conversation_characters = ConversationCharacters(users=new_personas)
-    conversation_characters.to_yaml(args.output_path)
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging()
+    run(args)
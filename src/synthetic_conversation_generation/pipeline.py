@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import logging
+import queue
+import threading
+from typing import Callable, Iterator, Optional
+
+from synthetic_conversation_generation.cli_support import RunMetrics, add_metrics_arguments, add_model_provider_arguments, configure_logging, create_model_provider_stack
+from synthetic_conversation_generation.conversation_generator import ConversationGenerator, ConversationRunner, SpeculationStats, add_conversation_arguments, create_branching_policy, create_completion_precheck, create_history_window_policy, log_conversation_summary
+from synthetic_conversation_generation.data_models.assistant import Assistant
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.data_models.conversation import Conversation
+from synthetic_conversation_generation.data_models.inference_endpoint import InferenceEndpoint
+from synthetic_conversation_generation.output.conversation_writer import create_conversation_writer
+from synthetic_conversation_generation.output.persona_writer import PersonaWriter
+from synthetic_conversation_generation.persona_generator import PersonaGenerator, load_previous_personas
+
+
+logger = logging.getLogger(__name__)
+
+
+_DONE = object()
+
+
+class PersonaConversationPipeline:
+    """
+    Generates conversations for personas while later personas are still being generated.
+
+    Persona generation runs on its own thread and hands each accepted persona to the
+    conversation runner through a bounded queue, and the runner only takes a persona
+    when one of its conversation slots is free. When conversations fall behind, the
+    queue fills up and persona generation waits, so neither stage runs ahead of the
+    other by more than buffer_size personas.
+
+    If persona generation fails, the conversations already started are finished and
+    yielded before the error is raised.
+    """
+
+    def __init__(self, persona_generator: PersonaGenerator, create_conversation_generator: Callable[[CharacterCard], ConversationGenerator], conversation_runner: ConversationRunner, buffer_size: int = 1):
+        """
+        Args:
+            persona_generator: Generator of the personas to hold conversations with
+            create_conversation_generator: Creates the ConversationGenerator for an accepted persona
+            conversation_runner: Runs the conversations, with its own concurrency limit
+            buffer_size: Accepted personas to hold while every conversation slot is busy
+        """
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be at least 1")
+        self.persona_generator = persona_generator
+        self.create_conversation_generator = create_conversation_generator
+        self.conversation_runner = conversation_runner
+        self.buffer_size = buffer_size
+
+    def _generate_personas(self, personas: queue.Queue, stopped: threading.Event, num_personas: int, concurrency: int, similarity_threshold: Optional[float], on_persona: Optional[Callable[[CharacterCard], None]]):
+        def put(item) -> bool:
+            # Give up on a full queue once the consumer has stopped, instead of blocking forever
+            while not stopped.is_set():
+                try:
+                    personas.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for persona in self.persona_generator.generate_personas(num_personas, concurrency, similarity_threshold):
+                if on_persona is not None:
+                    on_persona(persona)
+                if not put(persona):
+                    return
+        except BaseException as e:
+            put(e)
+        else:
+            put(_DONE)
+
+    def run(self, num_personas: int, persona_concurrency: int = 1, similarity_threshold: Optional[float] = None, on_persona: Optional[Callable[[CharacterCard], None]] = None) -> Iterator[Conversation]:
+        """
+        Generate personas and a conversation with each of them.
+
+        Args:
+            num_personas: Number of personas to accept, and so of conversations to generate
+            persona_concurrency: Maximum number of persona queries per wave
+            similarity_threshold: Estimated Jaccard similarity at or above which a persona is rejected
+            on_persona: Called with each accepted persona, in order, before its conversation is queued, e.g. to save it
+
+        Yields:
+            Successfully generated conversations, with the index of their persona in acceptance order as the id
+        """
+        personas: queue.Queue = queue.Queue(maxsize=self.buffer_size)
+        stopped = threading.Event()
+        persona_error = []
+
+        def conversation_jobs():
+            for persona_index in itertools.count():
+                item = personas.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    persona_error.append(item)
+                    return
+                logger.info(f"Generating conversation {persona_index} for user {item.name}")
+                yield str(persona_index), self.create_conversation_generator(item)
+
+        thread = threading.Thread(target=self._generate_personas, args=(personas, stopped, num_personas, persona_concurrency, similarity_threshold, on_persona), name="pipeline-personas", daemon=True)
+        thread.start()
+        try:
+            yield from self.conversation_runner.run(conversation_jobs())
+        finally:
+            stopped.set()
+
+        if persona_error:
+            raise persona_error[0]
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--assistant-path", type=str, required=True, help="Path to YAML file containing assistant definition")
+    parser.add_argument("--inference-endpoint-path", type=str, required=True, help="Path to YAML file specifying how to call your AI assistant via HTTP")
+    parser.add_argument("--num-personas", type=int, default=5, help="Number of user personas to generate, each with one conversation")
+    parser.add_argument("--personas-output-path", type=str, required=True, help="Path to save the generated personas as they are accepted (JSONL if it ends in .jsonl, YAML otherwise)")
+    parser.add_argument("--output-path", type=str, required=True, help="Path to save the generated conversations as they finish")
+    parser.add_argument("--output-format", type=str, choices=["jsonl", "parquet", "arrow"], default="jsonl", help="JSONL, or a columnar Parquet or Arrow IPC dataset with one row per message (requires pyarrow)")
+    parser.add_argument("--persona-model-id", type=str, default="o3", help="Model ID for persona generation")
+    parser.add_argument("--previous-personas-path", type=str, help="Path to YAML or JSONL file containing previous personas to avoid duplication")
+    parser.add_argument("--max-full-personas", type=int, help="Include full definitions for only this many previous personas, the neighbours of one picked per request, and summaries of the next most similar")
+    parser.add_argument("--max-summarized-personas", type=int, default=100, help="Most previous personas to summarize when --max-full-personas is set")
+    parser.add_argument("--persona-concurrency", type=int, default=1, help="Number of personas to generate at once in each wave")
+    parser.add_argument("--similarity-threshold", type=float, help="Reject and regenerate personas whose estimated Jaccard similarity to an accepted persona is at or above this value")
+    parser.add_argument("--persona-buffer", type=int, help="Accepted personas to hold while every conversation slot is busy before persona generation waits (default: the conversation concurrency)")
+    add_conversation_arguments(parser)
+    add_model_provider_arguments(parser, "generating personas and user messages")
+    add_metrics_arguments(parser)
+
+
+def run(args: argparse.Namespace):
+    run_metrics = RunMetrics(args)
+    # Both stages share one provider, and so its rate limits and cache
+    provider_stack = create_model_provider_stack(args)
+    model_provider = provider_stack.model_provider
+
+    assistant = Assistant.from_yaml(args.assistant_path)
+    inference_endpoint = InferenceEndpoint.from_yaml(args.inference_endpoint_path)
+    persona_generator = PersonaGenerator(model_provider, args.persona_model_id, assistant, load_previous_personas(args.previous_personas_path), args.max_full_personas, args.max_summarized_personas)
+
+    speculation_stats = SpeculationStats()
+    completion_precheck = create_completion_precheck(args)
+    history_window_policy = create_history_window_policy(args)
+    branching_policy = create_branching_policy(args)
+
+    def create_generator(user_persona):
+        return ConversationGenerator(model_provider, args.model_id, inference_endpoint, assistant, user_persona, args.max_conversation_turns, args.conversation_completion_query_model_id, args.speculative, speculation_stats, completion_precheck, history_window_policy=history_window_policy, branching_policy=branching_policy)
+
+    concurrency = inference_endpoint.max_concurrency or args.concurrency
+    conversation_runner = ConversationRunner(concurrency=concurrency)
+    pipeline = PersonaConversationPipeline(persona_generator, create_generator, conversation_runner, args.persona_buffer or concurrency)
+
+    ## Save each persona as soon as it is accepted and each conversation as soon as it is generated
+    conversations = 0
+    with PersonaWriter(args.personas_output_path) as persona_writer, create_conversation_writer(args.output_path, args.output_format) as conversation_writer:
+        for conversation in pipeline.run(args.num_personas, args.persona_concurrency, args.similarity_threshold, on_persona=persona_writer.write):
+            conversation_writer.write(conversation)
+            conversations += 1
+    logger.info(f"Saved {persona_writer.count} personas to {args.personas_output_path} and {conversations} conversations to {args.output_path}")
+
+    if conversation_runner.failed_conversation_ids:
+        logger.warning(f"{len(conversation_runner.failed_conversation_ids)} conversations failed: {', '.join(conversation_runner.failed_conversation_ids)}")
+
+    inference_endpoint.close()
+
+    log_conversation_summary(args, speculation_stats, completion_precheck)
+    provider_stack.log_summary()
+    run_metrics.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate personas and hold a conversation with each as soon as it is accepted")
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_logging()
+    run(args)
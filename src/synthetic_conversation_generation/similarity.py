@@ -0,0 +1,168 @@
+import math
+import random
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def persona_text(persona: CharacterCard) -> str:
+    """The free-text fields that distinguish one persona from another."""
+    return " ".join([persona.description, persona.personality, persona.scenario])
+
+
+class HashingTfidfIndex:
+    """
+    Local TF-IDF index over hashed token features.
+
+    Documents are stored as sparse term counts so the index can grow incrementally
+    without refitting. Their normalized TF-IDF vectors are computed on the first query
+    after the document frequencies change and reused until the next add.
+    """
+
+    def __init__(self, num_features: int = 2 ** 20):
+        self.num_features = num_features
+        self.documents: List[Dict[int, int]] = []
+        self.document_frequency: Counter = Counter()
+        # Normalized document vectors, or None when an add has made them stale
+        self._vectors: Optional[List[Dict[int, float]]] = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _features(self, text: str) -> Dict[int, int]:
+        return dict(Counter(zlib.crc32(token.encode("utf-8")) % self.num_features for token in tokenize(text)))
+
+    def _idf(self, feature: int) -> float:
+        return math.log((1 + len(self.documents)) / (1 + self.document_frequency[feature])) + 1
+
+    def _weights(self, features: Dict[int, int]) -> Dict[int, float]:
+        weights = {feature: count * self._idf(feature) for feature, count in features.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if norm == 0:
+            return weights
+        return {feature: weight / norm for feature, weight in weights.items()}
+
+    def add(self, text: str) -> int:
+        """Add a document and return its position in the index."""
+        features = self._features(text)
+        self.documents.append(features)
+        self.document_frequency.update(features.keys())
+        self._vectors = None
+        return len(self.documents) - 1
+
+    def most_similar(self, text: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Find the documents most similar to the given text.
+
+        Args:
+            text: Query text
+            k: Maximum number of results
+
+        Returns:
+            List of (document position, cosine similarity), most similar first
+        """
+        if self._vectors is None:
+            self._vectors = [self._weights(features) for features in self.documents]
+        query = self._weights(self._features(text))
+        scores = []
+        for position, document in enumerate(self._vectors):
+            score = sum(weight * document.get(feature, 0.0) for feature, weight in query.items())
+            scores.append((position, score))
+
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:k]
+
+
+class PersonaIndex:
+    """Similarity index over a growing list of personas."""
+
+    def __init__(self, personas: Sequence[CharacterCard] = ()):
+        self.personas: List[CharacterCard] = []
+        self.index = HashingTfidfIndex()
+        self._lock = threading.Lock()
+        self.update(personas)
+
+    def __len__(self):
+        return len(self.personas)
+
+    def update(self, personas: Sequence[CharacterCard]):
+        """Index any personas beyond those already indexed, for lists that only ever grow."""
+        with self._lock:
+            for persona in personas[len(self.personas):]:
+                self.personas.append(persona)
+                self.index.add(persona_text(persona))
+
+    def most_similar(self, text: str, k: int) -> List[CharacterCard]:
+        with self._lock:
+            return [self.personas[position] for position, _ in self.index.most_similar(text, k)]
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Overlapping word n-grams of the text."""
+    tokens = tokenize(text)
+    if len(tokens) < size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class NearDuplicateDetector:
+    """
+    Flags personas whose shingled text is too similar to one already accepted.
+
+    Jaccard similarity is estimated with MinHash signatures, so each check costs a
+    fixed number of integer comparisons per accepted persona.
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold: float = 0.3, num_permutations: int = 128, shingle_size: int = 3, seed: int = 42):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(num_permutations)]
+        self.personas: List[CharacterCard] = []
+        self.signatures: List[Tuple[int, ...]] = []
+
+    def signature(self, persona: CharacterCard) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(persona_text(persona), self.shingle_size)]
+        return tuple(min((a * h + b) % self._PRIME for h in hashes) for a, b in self._permutations)
+
+    @staticmethod
+    def similarity(signature_a: Tuple[int, ...], signature_b: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+    def update(self, personas: Sequence[CharacterCard]):
+        """Accept any personas beyond those already accepted, for lists that only ever grow."""
+        for persona in personas[len(self.personas):]:
+            self.add(persona)
+
+    def add(self, persona: CharacterCard):
+        self.personas.append(persona)
+        self.signatures.append(self.signature(persona))
+
+    def find_duplicate(self, persona: CharacterCard) -> Optional[Tuple[CharacterCard, float]]:
+        """
+        Find an accepted persona that the given persona nearly duplicates.
+
+        Returns:
+            (accepted persona, estimated Jaccard similarity) for the closest match at or above
+            the threshold, or None if the persona is distinct
+        """
+        signature = self.signature(persona)
+        best = None
+        for accepted, accepted_signature in zip(self.personas, self.signatures):
+            score = self.similarity(signature, accepted_signature)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (accepted, score)
+        return best
@@ -0,0 +1,94 @@
+import anthropic
+import openai
+import pytest
+
+from synthetic_conversation_generation.benchmark.fakes import FakeBatchServer, FakeModelProvider, FakeServiceConfig, LatencyModel, synthetic_personas
+from synthetic_conversation_generation.benchmark.run_benchmark import BENCHMARK_ASSISTANT
+from synthetic_conversation_generation.data_models.character_card import CharacterCard
+from synthetic_conversation_generation.llm_queries.batch import AnthropicBatchBackend, BatchRequest, LocalBatchBackend, OpenAIBatchBackend
+from synthetic_conversation_generation.llm_queries.llm_query import AnthropicModelProvider, OpenAIModelProvider
+from synthetic_conversation_generation.llm_queries.user_persona_query import UserPersonaQuery
+
+
+def persona_queries(provider, count):
+    previous_personas = synthetic_personas(3)
+    return [UserPersonaQuery(provider, "batch-model", BENCHMARK_ASSISTANT, previous_personas, request_number=i + 1) for i in range(count)]
+
+
+def remote_backend(api, server):
+    if api == "openai":
+        provider = OpenAIModelProvider(openai.OpenAI(api_key="test", base_url=server.openai_base_url, max_retries=0))
+        return OpenAIBatchBackend(provider, poll_interval=0.01)
+    provider = AnthropicModelProvider(anthropic.Anthropic(api_key="test", base_url=server.anthropic_base_url, max_retries=0))
+    return AnthropicBatchBackend(provider, poll_interval=0.01)
+
+
+@pytest.fixture
+def batch_server():
+    with FakeBatchServer(polls_until_complete=2) as server:
+        yield server
+
+
+@pytest.fixture
+def failing_batch_server():
+    with FakeBatchServer(FakeServiceConfig(error_rate=0.4)) as server:
+        yield server
+
+
+@pytest.mark.parametrize("api", ["openai", "anthropic"])
+def test_remote_batch_runs_queries(api, batch_server):
+    backend = remote_backend(api, batch_server)
+    queries = persona_queries(backend.provider, 6)
+
+    personas = backend.run_queries(queries)
+
+    assert len(personas) == 6
+    assert all(isinstance(persona, CharacterCard) for persona in personas)
+    assert batch_server.batches_created == 1
+    assert backend.provider.usage_summary()["batch-model"]["requests"] == 6
+
+
+@pytest.mark.parametrize("api", ["openai", "anthropic"])
+def test_remote_batch_reports_failed_requests(api, failing_batch_server):
+    backend = remote_backend(api, failing_batch_server)
+    queries = persona_queries(backend.provider, 10)
+    requests = [BatchRequest(f"request-{i}", query.generate_prompt(), query.response_schema(), query.model_id) for i, query in enumerate(queries)]
+
+    results = backend.run(requests)
+
+    assert set(results) == {request.custom_id for request in requests}
+    failed = [result for result in results.values() if result.error is not None]
+    assert len(failed) == failing_batch_server.failed_requests > 0
+    assert all(result.response is None for result in failed)
+    assert all(set(result.response) == {"name", "description", "personality", "scenario", "summary"} for result in results.values() if result.error is None)
+
+
+@pytest.mark.parametrize("api", ["openai", "anthropic"])
+def test_remote_batch_resubmits_failed_requests(api, failing_batch_server):
+    backend = remote_backend(api, failing_batch_server)
+    queries = persona_queries(backend.provider, 10)
+
+    personas = backend.run_queries(queries, max_retries=10)
+
+    assert all(isinstance(persona, CharacterCard) for persona in personas)
+    assert failing_batch_server.batches_created > 1
+    assert failing_batch_server.requests == 10 + failing_batch_server.failed_requests
+
+
+def test_local_batch_returns_none_where_every_attempt_failed():
+    provider = FakeModelProvider(FakeServiceConfig(LatencyModel(0.001, 0), error_rate=1.0))
+    backend = LocalBatchBackend(provider, poll_interval=0.01)
+
+    personas = backend.run_queries(persona_queries(provider, 3), max_retries=2)
+
+    assert personas == [None, None, None]
+
+
+def test_local_batch_runs_queries():
+    provider = FakeModelProvider(FakeServiceConfig(LatencyModel(0.001, 0)))
+    backend = LocalBatchBackend(provider, poll_interval=0.01)
+
+    personas = backend.run_queries(persona_queries(provider, 5))
+
+    assert all(isinstance(persona, CharacterCard) for persona in personas)
+    assert provider.usage_summary()["batch-model"]["requests"] == 5
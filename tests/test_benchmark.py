@@ -0,0 +1,61 @@
+from synthetic_conversation_generation.benchmark.fakes import FakeServiceConfig, LatencyModel
+from synthetic_conversation_generation.benchmark.run_benchmark import BenchmarkConfig, Scenario, run_scenario
+
+
+def fast_config(completion_rate: float = 0.3) -> BenchmarkConfig:
+    return BenchmarkConfig(
+        llm=FakeServiceConfig(LatencyModel(0.001, 0)),
+        endpoint=FakeServiceConfig(LatencyModel(0.001, 0)),
+        completion_rate=completion_rate
+    )
+
+
+def test_conversations_complete_against_fakes():
+    scenario = Scenario("conversations-test", "conversations", num_personas=12, max_conversation_turns=3, concurrency=4)
+
+    result = run_scenario(scenario, fast_config())
+
+    assert result["completed"] == 12
+    assert result["failed"] == 0
+    assert result["retries"] == 0
+    # Every conversation makes at least one user message and one completion check
+    assert result["llm_calls"] >= 2 * 12
+    assert result["latency_p50"] is not None
+
+
+def test_conversations_run_to_max_turns_when_never_complete():
+    scenario = Scenario("conversations-test", "conversations", num_personas=5, max_conversation_turns=3, concurrency=5)
+
+    result = run_scenario(scenario, fast_config(completion_rate=0.0))
+
+    assert result["completed"] == 5
+    # One user message and one completion check per turn
+    assert result["llm_calls"] == 5 * 3 * 2
+
+
+def test_conversation_scenario_is_reproducible():
+    scenario = Scenario("conversations-test", "conversations", num_personas=8, max_conversation_turns=4, concurrency=8)
+
+    first = run_scenario(scenario, fast_config())
+    second = run_scenario(scenario, fast_config())
+
+    assert first["llm_calls"] == second["llm_calls"]
+
+
+def test_personas_complete_against_fakes():
+    scenario = Scenario("personas-test", "personas", num_personas=10, concurrency=3)
+
+    result = run_scenario(scenario, fast_config())
+
+    assert result["completed"] == 10
+    assert result["failed"] == 0
+    assert result["llm_calls"] == 10
+
+
+def test_personas_complete_with_summarized_previous_personas():
+    scenario = Scenario("personas-test", "personas", num_personas=12, concurrency=2, max_full_personas=3)
+
+    result = run_scenario(scenario, fast_config())
+
+    assert result["completed"] == 12
+    assert result["failed"] == 0
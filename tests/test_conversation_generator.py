@@ -0,0 +1,76 @@
+import json
+
+from synthetic_conversation_generation.benchmark.fakes import FakeInferenceServer, FakeModelProvider, FakeServiceConfig, LatencyModel, synthetic_personas
+from synthetic_conversation_generation.benchmark.run_benchmark import BENCHMARK_ASSISTANT
+from synthetic_conversation_generation.conversation_generator import BranchingPolicy, ConversationGenerator, SpeculationStats, resume_branch_trees
+
+
+def fast_service() -> FakeServiceConfig:
+    return FakeServiceConfig(LatencyModel(0.001, 0))
+
+
+def requests(provider) -> int:
+    return sum(usage["requests"] for usage in provider.usage_summary().values())
+
+
+def generate(completion_rate: float, speculation_stats: SpeculationStats, num_conversations: int = 4, max_conversation_turns: int = 3):
+    provider = FakeModelProvider(fast_service(), completion_rate=completion_rate)
+    with FakeInferenceServer(fast_service()) as server:
+        endpoint = server.inference_endpoint()
+        conversations = [
+            ConversationGenerator(provider, "user-model", endpoint, BENCHMARK_ASSISTANT, persona, max_conversation_turns, "completion-model", speculative=True, speculation_stats=speculation_stats).generate_conversation(str(i))
+            for i, persona in enumerate(synthetic_personas(num_conversations))
+        ]
+        endpoint.close()
+    return provider, conversations
+
+
+def test_discarded_speculative_messages_are_counted_as_spent():
+    stats = SpeculationStats()
+
+    provider, conversations = generate(completion_rate=1.0, speculation_stats=stats)
+
+    # Every conversation ends after its first completion check, discarding one speculative message
+    assert all(len(conversation.messages) == 2 for conversation in conversations)
+    assert stats.calls == 4
+    assert stats.wasted + stats.cancelled == 4
+    # The first user message and completion check, plus every speculative message that was sent
+    assert requests(provider) == 4 * 2 + stats.wasted
+
+
+def test_used_speculative_messages_are_not_counted_as_wasted():
+    stats = SpeculationStats()
+
+    provider, conversations = generate(completion_rate=0.0, speculation_stats=stats)
+
+    assert all(len(conversation.messages) == 6 for conversation in conversations)
+    # No speculation after the last turn
+    assert stats.calls == 4 * 2
+    assert stats.wasted == stats.cancelled == 0
+    assert requests(provider) == 4 * 3 * 2
+
+
+def test_tree_is_complete_only_with_every_continuation_of_each_fork():
+    policy = BranchingPolicy([1, 3], branches=2)
+
+    assert policy.is_complete_tree(["1.1", "1.2", "2.1", "2.2"])
+    # The second branch ended before the second fork
+    assert policy.is_complete_tree(["1.1", "1.2", "2"])
+    # The conversation ended before the first fork
+    assert policy.is_complete_tree(["0"])
+    assert not policy.is_complete_tree(["1.1", "1.2", "2.1"])
+    assert not policy.is_complete_tree(["1.1", "1.2"])
+
+
+def test_resume_removes_partly_written_trees(tmp_path):
+    output_path = str(tmp_path / "conversations.jsonl")
+    written = ["0/1.1", "0/1.2", "0/2", "1/1.1", "1/1.2", "1/2.1"]
+    with open(output_path, "w") as f:
+        for conversation_id in written:
+            f.write(json.dumps({"conversation_id": conversation_id}) + "\n")
+
+    completed = resume_branch_trees({output_path: set(written)}, BranchingPolicy([1, 3], branches=2))
+
+    assert completed == {"0"}
+    with open(output_path) as f:
+        assert [json.loads(line)["conversation_id"] for line in f] == ["0/1.1", "0/1.2", "0/2"]
@@ -0,0 +1,123 @@
+import time
+from typing import Optional
+
+import pytest
+
+from synthetic_conversation_generation.benchmark.fakes import FakeAPIError, FakeModelProvider, FakeServiceConfig, LatencyModel
+from synthetic_conversation_generation.llm_queries.hedging import CircuitBreaker, CircuitOpenError, HedgedModelProvider
+
+
+SCHEMA = {"type": "object", "properties": {"answer": {"type": "string"}}}
+RESET_SECONDS = 0.1
+
+
+class CountingProvider(FakeModelProvider):
+    """Fake provider that counts every call, including failed ones, and can reject requests outright."""
+
+    def __init__(self, error_rate: float = 0.0, status_code: Optional[int] = None):
+        super().__init__(FakeServiceConfig(LatencyModel(0.001, 0), error_rate=error_rate))
+        self.status_code = status_code
+        self.calls = 0
+
+    def query(self, user_msg, response_schema, model_id, timeout=60):
+        self.calls += 1
+        if self.status_code is not None:
+            raise FakeAPIError(self.status_code)
+        return super().query(user_msg, response_schema, model_id, timeout)
+
+
+def hedged(primary, fallback=None, failure_threshold: int = 2) -> HedgedModelProvider:
+    return HedgedModelProvider(primary, fallback, hedge_percentile=None, failure_threshold=failure_threshold, reset_seconds=RESET_SECONDS)
+
+
+def settle(breaker: CircuitBreaker, state: str):
+    """Wait for outcomes recorded by done callbacks, which can run just after the caller wakes."""
+    deadline = time.monotonic() + 1
+    while breaker.state != state and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert breaker.state == state
+
+
+def test_circuit_breaker_opens_then_half_opens_then_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=RESET_SECONDS)
+
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(RESET_SECONDS * 1.5)
+    assert breaker.state == "half_open"
+    # A single trial call is let through
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.times_opened == 1
+
+
+def test_failed_trial_call_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=RESET_SECONDS)
+    breaker.record_failure()
+    time.sleep(RESET_SECONDS * 1.5)
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_transient_error_fails_over_to_fallback():
+    primary, fallback = CountingProvider(error_rate=1.0), CountingProvider()
+    provider = hedged(primary, fallback)
+
+    assert "answer" in provider.query("hello", SCHEMA, "model")
+
+    assert (primary.calls, fallback.calls) == (1, 1)
+    assert provider.failovers == 1
+    assert not provider.answered_as_requested()
+
+
+def test_open_circuit_skips_primary_until_trial():
+    primary, fallback = CountingProvider(error_rate=1.0), CountingProvider()
+    provider = hedged(primary, fallback)
+    primary_breaker = provider.routes[0].breaker
+
+    for _ in range(2):
+        provider.query("hello", SCHEMA, "model")
+    settle(primary_breaker, "open")
+    provider.query("hello", SCHEMA, "model")
+    assert primary.calls == 2
+
+    time.sleep(RESET_SECONDS * 1.5)
+    primary.config.error_rate = 0.0
+    provider.query("hello", SCHEMA, "model")
+
+    assert primary.calls == 3
+    assert provider.answered_as_requested()
+    settle(primary_breaker, "closed")
+
+
+def test_fatal_error_is_raised_without_failover():
+    primary, fallback = CountingProvider(status_code=400), CountingProvider()
+    provider = hedged(primary, fallback)
+
+    with pytest.raises(FakeAPIError):
+        provider.query("hello", SCHEMA, "model")
+
+    assert fallback.calls == 0
+    assert provider.failovers == 0
+    # A rejected request still shows the provider is up
+    settle(provider.routes[0].breaker, "closed")
+    assert provider.routes[0].breaker.consecutive_failures == 0
+
+
+def test_open_circuit_without_fallback_raises():
+    provider = hedged(CountingProvider(error_rate=1.0), failure_threshold=1)
+    with pytest.raises(FakeAPIError):
+        provider.query("hello", SCHEMA, "model")
+    settle(provider.routes[0].breaker, "open")
+
+    with pytest.raises(CircuitOpenError):
+        provider.query("hello", SCHEMA, "model")
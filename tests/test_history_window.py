@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import re
+import threading
+import time
+
+from synthetic_conversation_generation.benchmark.fakes import synthetic_personas
+from synthetic_conversation_generation.benchmark.run_benchmark import BENCHMARK_ASSISTANT
+from synthetic_conversation_generation.data_models.conversation import ROLE, Conversation, Message
+from synthetic_conversation_generation.llm_queries.history_window import HistoryWindow, HistoryWindowPolicy, count_tokens
+from synthetic_conversation_generation.llm_queries.llm_query import ModelProvider
+
+HEADING = "### Conversation"
+
+
+class FoldRecorder(ModelProvider):
+    """Answers summary queries with the ids of every message folded so far, and records each query's messages."""
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.delay = delay
+        self.folds = []
+        self._lock = threading.Lock()
+
+    def query(self, user_msg, response_schema, model_id, timeout=60):
+        time.sleep(self.delay)
+        previous, new_messages = user_msg.history.split("### New Messages")
+        folded = re.findall(r'"message_id": "([^"]+)"', new_messages)
+        with self._lock:
+            self.folds.append(folded)
+        summary = previous.split("### Summary So Far\n", 1)[1].strip()
+        return {"summary": " ".join(([] if summary == "(none yet)" else summary.split()) + folded)}
+
+    def response_format(self, response_schema):
+        return response_schema
+
+
+def add_turn(conversation: Conversation, words: int = 40):
+    turn = len(conversation.messages) // 2
+    now = datetime.now()
+    conversation.messages.append(Message(ROLE.user, " ".join(["question"] * words), now, f"u{turn}"))
+    conversation.messages.append(Message(ROLE.assistant, " ".join(["answer"] * words), now, f"a{turn}"))
+
+
+def window(policy: HistoryWindowPolicy, provider: ModelProvider) -> HistoryWindow:
+    conversation = Conversation(id="0", user_id="user", messages=[])
+    return HistoryWindow(policy, provider, conversation, synthetic_personas(1)[0], BENCHMARK_ASSISTANT)
+
+
+def shown_message_ids(history_window: HistoryWindow):
+    return [message["message_id"] for message in json.loads(history_window.render(HEADING).split(HEADING, 1)[1])]
+
+
+def test_window_stays_within_token_budget():
+    policy = HistoryWindowPolicy("summary-model", max_tokens=300, summary_max_tokens=60)
+    history_window = window(policy, FoldRecorder())
+
+    for _ in range(10):
+        add_turn(history_window.conversation)
+        history_window.update()
+        assert count_tokens(history_window.render(HEADING)) <= policy.max_tokens
+
+    assert history_window.folded_messages > 0
+
+
+def test_summary_covers_exactly_the_dropped_turns():
+    provider = FoldRecorder()
+    history_window = window(HistoryWindowPolicy("summary-model", recent_turns=2), provider)
+
+    for _ in range(5):
+        add_turn(history_window.conversation)
+        history_window.update()
+
+    message_ids = [message.message_id for message in history_window.conversation.messages]
+    # Every dropped message was folded exactly once, in order, and the last two turns are shown verbatim
+    assert [message_id for fold in provider.folds for message_id in fold] == message_ids[:6]
+    assert history_window.summary.split() == message_ids[:6]
+    assert shown_message_ids(history_window) == message_ids[6:]
+
+
+def test_concurrent_updates_fold_once():
+    provider = FoldRecorder(delay=0.05)
+    history_window = window(HistoryWindowPolicy("summary-model", recent_turns=1), provider)
+    for _ in range(3):
+        add_turn(history_window.conversation)
+
+    # As a speculative user message and a completion check would
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(history_window.update) for _ in range(4)]:
+            future.result()
+
+    assert provider.folds == [["u0", "a0", "u1", "a1"]]
+    assert history_window.folded_messages == 4
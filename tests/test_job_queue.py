@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+
+import pytest
+
+from synthetic_conversation_generation.benchmark.fakes import FakeInferenceServer, FakeModelProvider, FakeServiceConfig, LatencyModel, synthetic_personas
+from synthetic_conversation_generation.benchmark.run_benchmark import BENCHMARK_ASSISTANT
+from synthetic_conversation_generation.conversation_generator import ConversationGenerator
+from synthetic_conversation_generation.data_models.conversation import ROLE, Conversation, Message
+from synthetic_conversation_generation.experiment import ExperimentCell
+from synthetic_conversation_generation.job_queue import JobStore, JobWorker, LeaseLostError
+
+LEASE_SECONDS = 0.2
+
+
+def stores(path, count: int = 2, lease_seconds: float = LEASE_SECONDS, max_attempts: int = 3):
+    """Separate stores on one file, as separate workers would open it."""
+    return [JobStore(str(path), lease_seconds, max_attempts) for _ in range(count)]
+
+
+def enqueue(store: JobStore, count: int):
+    store.enqueue((str(i), ExperimentCell("default", 0), i, persona) for i, persona in enumerate(synthetic_personas(count)))
+
+
+def first_turn(job_id: str) -> Conversation:
+    now = datetime.now()
+    return Conversation(id=job_id, user_id="user", messages=[
+        Message(ROLE.user, "Hello", now, "m1"),
+        Message(ROLE.assistant, "Hi, how can I help?", now, "m2")
+    ])
+
+
+def test_leased_job_is_not_claimed_by_another_worker(tmp_path):
+    first, second = stores(tmp_path / "jobs.db")
+    enqueue(first, 1)
+
+    assert len(first.lease("worker-a")) == 1
+    assert second.lease("worker-b") == []
+
+
+def test_concurrent_workers_never_claim_the_same_job(tmp_path):
+    worker_stores = stores(tmp_path / "jobs.db", count=4, lease_seconds=60)
+    enqueue(worker_stores[0], 40)
+
+    def claim(worker_number):
+        claimed = []
+        while jobs := worker_stores[worker_number].lease(f"worker-{worker_number}"):
+            claimed.extend(job.job_id for job in jobs)
+        return claimed
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        claims = list(executor.map(claim, range(4)))
+
+    claimed = [job_id for worker_claims in claims for job_id in worker_claims]
+    assert sorted(claimed, key=int) == [str(i) for i in range(40)]
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_loses_it(tmp_path):
+    first, second = stores(tmp_path / "jobs.db")
+    enqueue(first, 1)
+    first.lease("worker-a")
+
+    time.sleep(LEASE_SECONDS * 1.5)
+    jobs = second.lease("worker-b")
+
+    assert [job.attempts for job in jobs] == [2]
+    with pytest.raises(LeaseLostError):
+        first.heartbeat("0", "worker-a")
+    with pytest.raises(LeaseLostError):
+        first.checkpoint("0", "worker-a", first_turn("0"))
+
+
+def test_heartbeat_keeps_a_lease(tmp_path):
+    first, second = stores(tmp_path / "jobs.db")
+    enqueue(first, 1)
+    first.lease("worker-a")
+
+    for _ in range(3):
+        time.sleep(LEASE_SECONDS / 2)
+        first.heartbeat("0", "worker-a")
+
+    assert second.lease("worker-b") == []
+
+
+def test_expired_lease_on_the_final_attempt_fails_the_job(tmp_path):
+    first, second = stores(tmp_path / "jobs.db", max_attempts=1)
+    enqueue(first, 1)
+    first.lease("worker-a")
+
+    time.sleep(LEASE_SECONDS * 1.5)
+
+    assert second.lease("worker-b") == []
+    assert second.status()["failed"] == 1
+
+
+def test_reclaimed_job_resumes_from_its_last_checkpoint(tmp_path):
+    first, second = stores(tmp_path / "jobs.db")
+    enqueue(first, 1)
+    first.lease("worker-a")
+    first.checkpoint("0", "worker-a", first_turn("0"))
+
+    # worker-a crashes after its first turn; worker-b finishes the conversation
+    time.sleep(LEASE_SECONDS * 1.5)
+    provider = FakeModelProvider(FakeServiceConfig(LatencyModel(0.001, 0)), completion_rate=0.0)
+    with FakeInferenceServer(FakeServiceConfig(LatencyModel(0.001, 0))) as server:
+        endpoint = server.inference_endpoint()
+        worker = JobWorker(second, lambda job: ConversationGenerator(provider, "user-model", endpoint, BENCHMARK_ASSISTANT, job.persona, 3, "completion-model"), "worker-b")
+        worker.run()
+        endpoint.close()
+
+    assert worker.completed == 1
+    [(_, conversation)] = list(second.finished_conversations())
+    assert len(conversation.messages) == 6
+    assert [message.content for message in conversation.messages[:2]] == ["Hello", "Hi, how can I help?"]
+    # Only the two remaining turns were generated, each with a user message and a completion check
+    assert sum(usage["requests"] for usage in provider.usage_summary().values()) == 2 * 2
+
+
+def test_only_the_first_worker_to_finish_completes_a_job(tmp_path):
+    first, second = stores(tmp_path / "jobs.db")
+    enqueue(first, 1)
+    first.lease("worker-a")
+    time.sleep(LEASE_SECONDS * 1.5)
+    second.lease("worker-b")
+
+    second.complete("0", "worker-b", first_turn("0"))
+
+    with pytest.raises(LeaseLostError):
+        first.complete("0", "worker-a", first_turn("0"))
@@ -0,0 +1,42 @@
+import pytest
+
+from synthetic_conversation_generation.benchmark.fakes import FakeModelProvider, FakeServiceConfig, LatencyModel
+from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery
+
+
+class AnswerQuery(LLMQuery):
+
+    def __init__(self, model_provider):
+        super().__init__(model_provider, "model")
+
+    def generate_prompt(self):
+        return "hello"
+
+    def response_schema(self):
+        return {"type": "object", "properties": {"answer": {"type": "string"}}}
+
+    def parse_response(self, json_response):
+        return json_response["answer"]
+
+
+def fake_provider(error_rate: float = 0.0) -> FakeModelProvider:
+    return FakeModelProvider(FakeServiceConfig(LatencyModel(0.001, 0), error_rate=error_rate))
+
+
+@pytest.mark.parametrize("max_retries", [0, -1])
+def test_query_rejects_fewer_than_one_attempt(max_retries):
+    provider = fake_provider()
+
+    with pytest.raises(ValueError):
+        AnswerQuery(provider).query(max_retries=max_retries)
+
+    assert provider.usage_summary() == {}
+
+
+def test_query_raises_after_last_attempt():
+    with pytest.raises(Exception, match="Unable to complete llm query"):
+        AnswerQuery(fake_provider(error_rate=1.0)).query(max_retries=2, retry_delay=0.01)
+
+
+def test_query_returns_parsed_response():
+    assert isinstance(AnswerQuery(fake_provider()).query(max_retries=1), str)
@@ -0,0 +1,83 @@
+import pytest
+
+from synthetic_conversation_generation.benchmark.fakes import FakeModelProvider, FakeServiceConfig, LatencyModel
+from synthetic_conversation_generation.llm_queries.hedging import HedgedModelProvider
+from synthetic_conversation_generation.llm_queries.llm_query import LLMQuery
+from synthetic_conversation_generation.llm_queries.response_cache import CachedModelProvider, ResponseCache
+
+
+SCHEMA = {"type": "object", "properties": {"answer": {"type": "string"}}}
+
+
+class AnswerQuery(LLMQuery):
+
+    def __init__(self, model_provider, valid: bool = True):
+        super().__init__(model_provider, "model")
+        self.valid = valid
+
+    def generate_prompt(self):
+        return "hello"
+
+    def response_schema(self):
+        return SCHEMA
+
+    def parse_response(self, json_response):
+        if not self.valid:
+            raise ValueError("Response does not match the schema")
+        return json_response["answer"]
+
+
+def fake_provider(error_rate: float = 0.0) -> FakeModelProvider:
+    return FakeModelProvider(FakeServiceConfig(LatencyModel(0.001, 0), error_rate=error_rate))
+
+
+def requests(provider: FakeModelProvider) -> int:
+    return sum(usage["requests"] for usage in provider.usage_summary().values())
+
+
+def test_repeated_query_is_served_from_cache(tmp_path):
+    provider = fake_provider()
+    cached = CachedModelProvider(provider, ResponseCache(str(tmp_path / "cache.db")))
+
+    first = cached.query("hello", SCHEMA, "model")
+    second = cached.query("hello", SCHEMA, "model")
+
+    assert first == second
+    assert requests(provider) == 1
+    assert cached.cache.stats() == {"hits": 1, "misses": 1, "writes": 1}
+
+
+def test_failed_over_response_is_not_cached(tmp_path):
+    primary, fallback = fake_provider(error_rate=1.0), fake_provider()
+    hedged = HedgedModelProvider(primary, fallback, hedge_percentile=None, failure_threshold=100)
+    cached = CachedModelProvider(hedged, ResponseCache(str(tmp_path / "cache.db")))
+
+    cached.query("hello", SCHEMA, "model")
+    cached.query("hello", SCHEMA, "model")
+
+    assert requests(fallback) == 2
+    assert cached.cache.stats()["writes"] == 0
+
+    # Once the primary answers again, its response is cached
+    primary.config.error_rate = 0.0
+    cached.query("hello", SCHEMA, "model")
+    cached.query("hello", SCHEMA, "model")
+
+    assert requests(primary) == 1
+    assert cached.cache.stats()["writes"] == 1
+
+
+def test_response_that_fails_to_parse_is_not_kept(tmp_path):
+    provider = fake_provider()
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+
+    with pytest.raises(Exception):
+        AnswerQuery(CachedModelProvider(provider, cache), valid=False).query(max_retries=1)
+
+    # A later run queries the provider again instead of replaying the bad response
+    cached = CachedModelProvider(provider, ResponseCache(str(tmp_path / "cache.db")))
+    answer = AnswerQuery(cached).query(max_retries=1)
+
+    assert isinstance(answer, str)
+    assert requests(provider) == 2
+    assert cached.cache.stats()["hits"] == 0
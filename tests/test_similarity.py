@@ -0,0 +1,32 @@
+import pytest
+
+from synthetic_conversation_generation.similarity import HashingTfidfIndex
+
+
+def build(texts):
+    index = HashingTfidfIndex()
+    for text in texts:
+        index.add(text)
+    return index
+
+
+def test_scores_after_add_match_a_freshly_built_index():
+    texts = ["retired teacher who loves gardening", "student learning to cook on a budget", "nurse working night shifts"]
+    index = build(texts[:2])
+    index.most_similar("gardening teacher", k=3)
+
+    index.add(texts[2])
+
+    rebuilt = build(texts)
+    assert index.most_similar("night shift nurse", k=3) == pytest.approx(rebuilt.most_similar("night shift nurse", k=3))
+    assert index.most_similar("night shift nurse", k=1)[0][0] == 2
+
+
+def test_repeated_queries_reuse_document_vectors():
+    index = build(["retired teacher who loves gardening", "student learning to cook on a budget"])
+    index.most_similar("teacher", k=1)
+    vectors = index._vectors
+
+    index.most_similar("student", k=1)
+
+    assert index._vectors is vectors